@@ -0,0 +1,177 @@
+"""Load test of the websocket client: fake htlcevents -> LND_streams -> Htlc_writer -> local Postgres.
+
+Every sample shows what the fake node should have sent by now, what it did
+send, what the client received, how deep the writer queue is, how many
+events were dropped, the rows in htlc_events and the lag of the newest row
+(now minus its timestamp_ns, which is the time the event was sent). The first
+sample with lag over --max-lag or dropped events is reported as the point
+where the client falls behind. Use an empty scratch database.
+
+    python3 benchmarks/bench_htlc_stream.py --database lnd_bench --user ln --password xxx \\
+        --shape ramp --rate 100 --max-rate 5000 --duration 60 --reset
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from fake_lnd import Fake_lnd
+from fake_htlc_stream import Fake_htlc_stream
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+CWD = os.getcwd()
+sys.path.insert(0, SRC)
+# DB reads ./sql-scripts relative to the working directory
+os.chdir(SRC)
+
+from db import DB  # noqa: E402
+from logger import Logger  # noqa: E402
+from alias_cache import Alias_cache  # noqa: E402
+from lnd_api import LND_api  # noqa: E402
+from lnd_streams import LND_streams  # noqa: E402
+from lnd_websocket import LND_websocket_client  # noqa: E402
+
+RESET_TABLES = ("htlc_events", "failed_htlc", "channels")
+
+
+def written(db: DB) -> tuple:
+    # (rows, lag in seconds of the newest row)
+    db.cursor.execute("SELECT count(*), max(timestamp_ns) FROM public.htlc_events;")
+    count, newest = db.cursor.fetchone()
+    db.conn.commit()
+    if newest is None:
+        return 0, None
+    return count, time.time() - newest / 1000000000
+
+
+def percentile(values: list, share: float) -> float:
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Websocket client load test")
+    parser.add_argument("--database", default=os.environ.get("POSTGRES_DATABASE", "lnd_bench"))
+    parser.add_argument("--user", default=os.environ.get("POSTGRES_USER", "ln"))
+    parser.add_argument("--password", default=os.environ.get("POSTGRES_PASSWORD", ""))
+    parser.add_argument("--host", default=os.environ.get("POSTGRES_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("POSTGRES_PORT", 5432)))
+    parser.add_argument("--rate", type=float, default=100, help="events/sec")
+    parser.add_argument("--shape", default=Fake_htlc_stream.CONSTANT, choices=(Fake_htlc_stream.CONSTANT, Fake_htlc_stream.BURST, Fake_htlc_stream.RAMP))
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--max-rate", type=float, default=None, help="ramp: events/sec at the end")
+    parser.add_argument("--burst-size", type=int, default=1000)
+    parser.add_argument("--burst-period", type=float, default=5)
+    parser.add_argument("--channels", type=int, default=1000)
+    parser.add_argument("--replay", help="file with one recorded htlcevents message per line")
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--flush-interval", type=float, default=2.0)
+    parser.add_argument("--sample", type=float, default=1.0, help="seconds between samples")
+    parser.add_argument("--max-lag", type=float, default=5.0, help="seconds of lag counted as falling behind")
+    parser.add_argument("--drain", type=float, default=30, help="max seconds to wait for the queue after sending stops")
+    parser.add_argument("--reset", action="store_true", help="truncate htlc tables before the run")
+    parser.add_argument("--json", help="also write samples and summary to this file")
+    args = parser.parse_args()
+
+    rest = Fake_lnd(channels=args.channels).start()
+    stream = Fake_htlc_stream(
+        rate=args.rate,
+        shape=args.shape,
+        duration=args.duration,
+        max_rate=args.max_rate,
+        burst_size=args.burst_size,
+        burst_period=args.burst_period,
+        channels=args.channels,
+        replay=args.replay,
+    ).start()
+    db = DB(args.database, args.user, args.password, args.host, port=args.port)
+    if args.reset:
+        db.cursor.execute("TRUNCATE {} CASCADE;".format(", ".join("public." + table for table in RESET_TABLES)))
+        db.conn.commit()
+    # the client gets its own connection, samples are read on this thread
+    client_db = db.clone()
+    logger = Logger(os.devnull, db, loggin_level=Logger.WARNING, host_name="bench")
+    alias_cache = Alias_cache(client_db, logger)
+    client_db.set_alias_cache(alias_cache)
+    api = LND_api(rest.url, "00", None, False, logger, alias_cache=alias_cache)
+    client = LND_websocket_client(
+        stream.url,
+        client_db,
+        None,
+        "00",
+        api,
+        logger,
+        queue_size=args.queue_size,
+        batch_size=args.batch_size,
+        flush_interval=args.flush_interval,
+    )
+    streams = LND_streams(stream.url, "00", None, False, logger)
+    streams.subscribe(LND_streams.HTLC_EVENTS, client.handle_message)
+    threading.Thread(target=streams.run, name="streams", daemon=True).start()
+
+    rows_before, _ = written(db)
+    samples = list()
+    behind = None
+    start = time.time()
+    while True:
+        time.sleep(args.sample)
+        elapsed = time.time() - start
+        rows, lag = written(db)
+        sample = {
+            "t": round(elapsed, 1),
+            "rate": round(stream.current_rate(elapsed), 1),
+            "target": stream.target(elapsed),
+            "sent": stream.sent,
+            "received": streams.stats[LND_streams.HTLC_EVENTS]["events"],
+            "queue": client.queue_depth(),
+            "dropped": client.writer.dropped,
+            "rows": rows - rows_before,
+            "lag": round(lag, 3) if lag is not None else None,
+        }
+        samples.append(sample)
+        print(" ".join("{}={}".format(key, value) for key, value in sample.items()))
+        # once sending stops the newest row only gets older, lag is not meaningful
+        sending = elapsed <= args.duration
+        if behind is None and (sample["dropped"] > 0 or (sending and lag is not None and lag > args.max_lag)):
+            behind = sample
+        if stream.finished.is_set():
+            if sample["queue"] == 0 and sample["rows"] + sample["dropped"] >= stream.sent:
+                break
+            if elapsed > args.duration + args.drain:
+                break
+    elapsed = time.time() - start
+    client.writer.close()
+    stream.stop()
+    rest.stop()
+    logger.close()
+
+    lags = [
+        sample["lag"]
+        for sample in samples
+        if sample["lag"] is not None and sample["t"] <= args.duration
+    ]
+    summary = {
+        "shape": args.shape,
+        "sent": stream.sent,
+        "rows": samples[-1]["rows"],
+        "dropped": client.writer.dropped,
+        "seconds": round(elapsed, 1),
+        "events_per_sec": round(samples[-1]["rows"] / elapsed, 1),
+        "lag_p50": percentile(lags, 0.5),
+        "lag_p95": percentile(lags, 0.95),
+        "lag_max": max(lags) if len(lags) > 0 else None,
+        "falls_behind_at": behind,
+    }
+    print(json.dumps(summary, indent=2))
+    if args.json:
+        with open(os.path.join(CWD, args.json), "w") as fp:
+            json.dump({"samples": samples, "summary": summary}, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""End-to-end ingest benchmark: fake lnd REST api -> LND_api -> DB -> local Postgres.
+
+Runs the collectors of main-lnd-rest-api.py one by one and prints events/sec,
+REST calls, DB statements and peak RSS for each of them. Use an empty scratch
+database, tables the collectors fill are truncated first with --reset.
+
+    python3 benchmarks/bench_ingest.py --database lnd_bench --user ln --password xxx \\
+        --forwards 1000000 --channels 10000 --reset
+"""
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import psycopg2.extensions
+
+from fake_lnd import Fake_lnd
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+CWD = os.getcwd()
+sys.path.insert(0, SRC)
+# DB reads ./sql-scripts relative to the working directory
+os.chdir(SRC)
+
+from db import DB  # noqa: E402
+from logger import Logger  # noqa: E402
+from alias_cache import Alias_cache  # noqa: E402
+from lnd_api import LND_api  # noqa: E402
+
+RESET_TABLES = (
+    "routing",
+    "routing_daily",
+    "routing_day_total",
+    "invoices",
+    "payments",
+    "balance",
+    "channels",
+    "channel_backup",
+    "sync_state",
+)
+
+
+class Counting_cursor(psycopg2.extensions.cursor):
+    # every statement sent to postgres, execute_values sends one per page
+    statements = 0
+    lock = threading.Lock()
+
+    def execute(self, query, vars=None):
+        with Counting_cursor.lock:
+            Counting_cursor.statements += 1
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        with Counting_cursor.lock:
+            Counting_cursor.statements += len(vars_list)
+        return super().executemany(query, vars_list)
+
+
+def load_collectors():
+    # collectors are reused as they are, file name is not importable
+    path = os.path.join(SRC, "main-lnd-rest-api.py")
+    spec = importlib.util.spec_from_file_location("main_lnd_rest_api", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def count_rows(db: DB, table: str) -> int:
+    db.cursor.execute("SELECT count(*) FROM public.{};".format(table))
+    res = db.cursor.fetchone()[0]
+    db.conn.commit()
+    return res
+
+
+def measure(name: str, table: str, func, db: DB, api: LND_api) -> dict:
+    rows_before = count_rows(db, table)
+    requests_before = api.transport.stats()["requests"]
+    statements_before = Counting_cursor.statements
+    start = time.time()
+    func()
+    elapsed = time.time() - start
+    rows = count_rows(db, table) - rows_before
+    return {
+        "collector": name,
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "events_per_sec": round(rows / elapsed, 1) if elapsed > 0 else None,
+        "rest_calls": api.transport.stats()["requests"] - requests_before,
+        # the two count(*) around the run are not included
+        "db_statements": Counting_cursor.statements - statements_before - 1,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end ingest benchmark")
+    parser.add_argument("--database", default=os.environ.get("POSTGRES_DATABASE", "lnd_bench"))
+    parser.add_argument("--user", default=os.environ.get("POSTGRES_USER", "ln"))
+    parser.add_argument("--password", default=os.environ.get("POSTGRES_PASSWORD", ""))
+    parser.add_argument("--host", default=os.environ.get("POSTGRES_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("POSTGRES_PORT", 5432)))
+    parser.add_argument("--forwards", type=int, default=100000)
+    parser.add_argument("--channels", type=int, default=1000)
+    parser.add_argument("--invoices", type=int, default=10000)
+    parser.add_argument("--payments", type=int, default=10000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fake lnd response")
+    parser.add_argument("--graph-snapshot", action="store_true", help="resolve aliases from one /v1/graph call")
+    parser.add_argument("--alias-concurrency", type=int, default=4)
+    parser.add_argument("--reset", action="store_true", help="truncate collector tables before the run")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    fake = Fake_lnd(
+        forwards=args.forwards,
+        channels=args.channels,
+        invoices=args.invoices,
+        payments=args.payments,
+        latency=args.latency,
+    ).start()
+    db = DB(
+        args.database,
+        args.user,
+        args.password,
+        args.host,
+        port=args.port,
+        cursor_factory=Counting_cursor,
+    )
+    if args.reset:
+        db.cursor.execute("TRUNCATE {} CASCADE;".format(", ".join("public." + table for table in RESET_TABLES)))
+        db.conn.commit()
+    logger = Logger(os.devnull, db, loggin_level=Logger.WARNING, host_name="bench")
+    alias_cache = Alias_cache(db, logger)
+    db.set_alias_cache(alias_cache)
+    api = LND_api(
+        fake.url,
+        "00",
+        None,
+        False,
+        logger,
+        alias_cache=alias_cache,
+        graph_snapshot=args.graph_snapshot,
+        alias_concurrency=args.alias_concurrency,
+    )
+    collectors = load_collectors()
+    runs = (
+        ("routing", "routing", lambda: collectors.routing(api, db, logger)),
+        ("invoices", "invoices", lambda: collectors.invoices(api, db, logger)),
+        ("payments", "payments", lambda: collectors.payments(api, db, logger)),
+        ("balance", "balance", lambda: collectors.balance(api, db, logger)),
+    )
+    results = [measure(name, table, func, db, api) for name, table, func in runs]
+    logger.close()
+    fake.stop()
+
+    columns = ("collector", "rows", "seconds", "events_per_sec", "rest_calls", "db_statements", "peak_rss_mb")
+    print(" ".join("{:>14}".format(column) for column in columns))
+    for result in results:
+        print(" ".join("{:>14}".format(str(result[column])) for column in columns))
+    if args.json:
+        with open(os.path.join(CWD, args.json), "w") as fp:
+            json.dump(
+                {
+                    "forwards": args.forwards,
+                    "channels": args.channels,
+                    "invoices": args.invoices,
+                    "payments": args.payments,
+                    "latency": args.latency,
+                    "graph_snapshot": args.graph_snapshot,
+                    "results": results,
+                },
+                fp,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Local stand-in for lnd's /v2/router/htlcevents websocket.
+
+Sends synthetic HTLC events (or replays recorded ones, one raw message per
+line) at a configurable rate and shape:
+
+    constant  rate events/sec for the whole duration
+    burst     rate events/sec plus burst_size events at once every burst_period seconds
+    ramp      rate growing linearly to max_rate over the duration
+
+timestamp_ns of every event is the time it is sent, so the delay until it shows
+up in htlc_events is end-to-end latency. Standalone:
+`python3 fake_htlc_stream.py --rate 500 --shape ramp --max-rate 5000`.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import threading
+import time
+import websockets
+
+from fake_lnd import Fake_lnd
+
+
+class Fake_htlc_stream:
+    PATH = "/v2/router/htlcevents"
+    CONSTANT = "constant"
+    BURST = "burst"
+    RAMP = "ramp"
+    # percent of each event kind in the synthetic mix
+    DEFAULT_MIX = {
+        "forward_event": 40,
+        "settle_event": 35,
+        "link_fail_event": 15,
+        "forward_fail_event": 5,
+        "final_htlc_event": 5,
+    }
+    SEND_TICK = 0.005
+
+    def __init__(
+        self,
+        rate: float = 100,
+        shape: str = CONSTANT,
+        duration: float = 30,
+        max_rate: float = None,
+        burst_size: int = 1000,
+        burst_period: float = 5,
+        channels: int = 1000,
+        mix: dict = None,
+        replay: str = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.rate = rate
+        self.shape = shape
+        self.duration = duration
+        self.max_rate = max_rate if max_rate is not None else rate * 10
+        self.burst_size = burst_size
+        self.burst_period = burst_period
+        self.channels = max(channels, 2)
+        self.kinds = list()
+        for kind, weight in (mix or self.DEFAULT_MIX).items():
+            self.kinds.extend([kind] * int(weight))
+        self.recorded = None
+        if replay is not None:
+            with open(replay, "r") as fp:
+                self.recorded = [json.loads(line) for line in fp if line.strip()]
+        self.host = host
+        self.port = port
+        self.sent = 0
+        self.started_at = None
+        self.finished = threading.Event()
+        self.ready = threading.Event()
+        self.loop = None
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return "http://{}:{}".format(self.host, self.port)
+
+    def start(self) -> "Fake_htlc_stream":
+        self.thread = threading.Thread(target=self.__serve, name="fake-htlc-stream", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def stop(self) -> None:
+        if self.loop is None or self.loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self.__shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    async def __shutdown(self) -> None:
+        # connections are closed by the server, whatever is left is cancelled
+        # so the loop stops with no pending task
+        self.server.close()
+        await self.server.wait_closed()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def __serve(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(
+            websockets.serve(self.__handler, self.host, self.port, max_size=None)
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.ready.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    def target(self, elapsed: float) -> int:
+        # events that should have been sent after elapsed seconds
+        elapsed = min(elapsed, self.duration)
+        if self.shape == self.RAMP:
+            res = self.rate * elapsed + (self.max_rate - self.rate) * elapsed * elapsed / (2 * self.duration)
+        elif self.shape == self.BURST:
+            res = self.rate * elapsed + self.burst_size * (int(elapsed / self.burst_period) + 1)
+        else:
+            res = self.rate * elapsed
+        return int(res)
+
+    def current_rate(self, elapsed: float) -> float:
+        if self.shape == self.RAMP:
+            return self.rate + (self.max_rate - self.rate) * min(elapsed, self.duration) / self.duration
+        return self.rate
+
+    async def __handler(self, ws, path: str) -> None:
+        if path.split("?")[0] != self.PATH:
+            await ws.close(code=1008, reason="unknown path")
+            return
+        try:
+            await ws.send(json.dumps({"result": {"subscribed_event": {}}}))
+            # a reconnecting client continues where the previous connection stopped
+            if self.started_at is None:
+                self.started_at = time.time()
+            while not self.finished.is_set():
+                elapsed = time.time() - self.started_at
+                target = self.target(elapsed)
+                while self.sent < target:
+                    await ws.send(self.event(self.sent))
+                    self.sent += 1
+                if elapsed >= self.duration:
+                    self.finished.set()
+                    break
+                await asyncio.sleep(self.SEND_TICK)
+            await ws.wait_closed()
+        except websockets.ConnectionClosed:
+            # client went away or the server is stopping
+            pass
+
+    def event(self, index: int) -> str:
+        if self.recorded is not None:
+            message = json.loads(json.dumps(self.recorded[index % len(self.recorded)]))
+            message["result"]["timestamp_ns"] = str(time.time_ns())
+            return json.dumps(message)
+        kind = self.kinds[index * 7919 % len(self.kinds)]
+        channel_in = index * 7 % self.channels
+        channel_out = (channel_in + 1 + index * 13 % (self.channels - 1)) % self.channels
+        info = {
+            "incoming_timelock": 800144,
+            "outgoing_timelock": 800104,
+            "incoming_amt_msat": str(1001000 + index % 1000000),
+            "outgoing_amt_msat": str(1000000 + index % 1000000),
+        }
+        result = {
+            "incoming_channel_id": str(Fake_lnd.CHAN_ID_BASE + channel_in),
+            "outgoing_channel_id": str(Fake_lnd.CHAN_ID_BASE + channel_out),
+            "incoming_htlc_id": str(index),
+            "outgoing_htlc_id": str(index),
+            "timestamp_ns": str(time.time_ns()),
+            "event_type": "FORWARD",
+        }
+        if kind == "forward_event":
+            result[kind] = {"info": info}
+        elif kind == "settle_event":
+            result[kind] = {"preimage": base64.b64encode(index.to_bytes(32, "big")).decode()}
+        elif kind == "link_fail_event":
+            result[kind] = {
+                "info": info,
+                "wire_failure": "TEMPORARY_CHANNEL_FAILURE",
+                "failure_detail": "INSUFFICIENT_BALANCE",
+                "failure_string": "insufficient bandwidth to route htlc",
+            }
+        elif kind == "final_htlc_event":
+            result[kind] = {"settled": index % 4 != 0, "offchain": True}
+        else:
+            result[kind] = {}
+        return json.dumps({"result": result})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake lnd htlcevents websocket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--rate", type=float, default=100, help="events/sec")
+    parser.add_argument("--shape", default=Fake_htlc_stream.CONSTANT, choices=(Fake_htlc_stream.CONSTANT, Fake_htlc_stream.BURST, Fake_htlc_stream.RAMP))
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--max-rate", type=float, default=None, help="ramp: events/sec at the end")
+    parser.add_argument("--burst-size", type=int, default=1000)
+    parser.add_argument("--burst-period", type=float, default=5)
+    parser.add_argument("--channels", type=int, default=1000)
+    parser.add_argument("--replay", help="file with one recorded htlcevents message per line")
+    args = parser.parse_args()
+    stream = Fake_htlc_stream(
+        rate=args.rate,
+        shape=args.shape,
+        duration=args.duration,
+        max_rate=args.max_rate,
+        burst_size=args.burst_size,
+        burst_period=args.burst_period,
+        channels=args.channels,
+        replay=args.replay,
+        host=args.host,
+        port=args.port,
+    ).start()
+    print("Fake htlcevents listening on {}{}".format(stream.url, Fake_htlc_stream.PATH))
+    try:
+        stream.thread.join()
+    except KeyboardInterrupt:
+        stream.stop()
+
+
+if __name__ == "__main__":
+    main()
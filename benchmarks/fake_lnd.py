@@ -0,0 +1,427 @@
+"""Local stand-in for lnd REST api with deterministic synthetic data.
+
+Nothing is generated up front, every forward, invoice, payment and channel is
+derived from its index, so 1M forwards cost no memory. Run standalone with
+`python3 fake_lnd.py --forwards 1000000 --channels 10000` or start it from a
+benchmark with `Fake_lnd(...).start()`.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class Fake_lnd:
+    START_TIME = 1640995200  # 2022-01-01, first forward
+    FORWARD_STEP = 30  # seconds between forwards
+    CHAN_ID_BASE = 700000 << 40
+    BLOCK_HEIGHT = 800000
+    # seconds a subscription stays open after its replay, like a quiet node
+    STREAM_HOLD = 30
+
+    def __init__(
+        self,
+        forwards: int = 100000,
+        channels: int = 1000,
+        invoices: int = 10000,
+        payments: int = 10000,
+        latency: float = 0.0,
+        seed: int = 1,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.forwards = forwards
+        self.channels = max(channels, 2)
+        self.invoices = invoices
+        self.payments = payments
+        self.latency = latency
+        self.seed = seed
+        self.own_pub_key = self.__pub_key(-1)
+        self.server = ThreadingHTTPServer((host, port), self.__handler())
+        self.server.daemon_threads = True
+        self.thread = None
+        self.requests = 0
+        self.lock = threading.Lock()
+        # add_index -> settle_index of open invoices settled with settle()
+        self.settled_later = dict()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self) -> "Fake_lnd":
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="fake-lnd", daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    # synthetic data, all of it is a pure function of seed and index
+
+    def __digest(self, *parts) -> bytes:
+        key = ":".join(str(part) for part in (self.seed,) + parts)
+        return hashlib.sha256(key.encode()).digest()
+
+    def __pub_key(self, peer: int) -> str:
+        # peer index is encoded in the key so node lookups need no table
+        return "02" + (peer & 0xFFFFFFFF).to_bytes(4, "big").hex() + self.__digest("node", peer)[:28].hex()
+
+    def __peer_of_pub_key(self, pub_key: str) -> int:
+        peer = int(pub_key[2:10], 16)
+        if pub_key == self.own_pub_key or peer >= self.channels or pub_key != self.__pub_key(peer):
+            return None
+        return peer
+
+    def __chan_id(self, channel: int) -> int:
+        return self.CHAN_ID_BASE + channel
+
+    def __channel_of_chan_id(self, chan_id: str) -> int:
+        channel = int(chan_id) - self.CHAN_ID_BASE
+        if channel < 0 or channel >= self.channels:
+            return None
+        return channel
+
+    def __capacity(self, channel: int) -> int:
+        return 1000000 + (channel * 7919 % 100) * 100000
+
+    def __channel(self, channel: int) -> dict:
+        capacity = self.__capacity(channel)
+        local = capacity * (channel * 37 % 100) // 100
+        return {
+            "active": channel % 10 != 0,
+            "remote_pubkey": self.__pub_key(channel),
+            "channel_point": "{}:0".format(self.__digest("funding", channel).hex()),
+            "chan_id": str(self.__chan_id(channel)),
+            "capacity": str(capacity),
+            "local_balance": str(local),
+            "remote_balance": str(capacity - local),
+        }
+
+    def __forward(self, index: int) -> dict:
+        channel_in = index * 7 % self.channels
+        channel_out = (channel_in + 1 + index * 13 % (self.channels - 1)) % self.channels
+        amt_out_msat = 1000000 + index * 7919 % 500000000
+        fee_msat = 1000 + amt_out_msat // 1000000
+        timestamp = self.START_TIME + index * self.FORWARD_STEP
+        return {
+            "timestamp": str(timestamp),
+            "timestamp_ns": str(timestamp * 1000000000),
+            "chan_id_in": str(self.__chan_id(channel_in)),
+            "chan_id_out": str(self.__chan_id(channel_out)),
+            "amt_in": str((amt_out_msat + fee_msat) // 1000),
+            "amt_out": str(amt_out_msat // 1000),
+            "fee": str(fee_msat // 1000),
+            "fee_msat": str(fee_msat),
+            "amt_in_msat": str(amt_out_msat + fee_msat),
+            "amt_out_msat": str(amt_out_msat),
+        }
+
+    def __r_hash(self, add_index: int) -> bytes:
+        # add_index is encoded in the hash so lookups need no table
+        return add_index.to_bytes(8, "big") + self.__digest("invoice", add_index)[:24]
+
+    def __invoice(self, add_index: int) -> dict:
+        # every third invoice stays open until settle(), settle_index follows add_index
+        value_msat = 1000 * (1000 + add_index * 104729 % 1000000)
+        created = self.START_TIME + add_index * 60
+        settled = add_index % 3 != 0
+        settle_index = add_index - add_index // 3 if settled else 0
+        later = self.settled_later.get(add_index)
+        if later is not None:
+            settled, settle_index = True, later
+        return {
+            "memo": "invoice {}".format(add_index),
+            "r_hash": base64.b64encode(self.__r_hash(add_index)).decode(),
+            "value": str(value_msat // 1000),
+            "value_msat": str(value_msat),
+            "settled": settled,
+            "creation_date": str(created),
+            "settle_date": str(created + 30 if settled else 0),
+            "expiry": "86400",
+            "add_index": str(add_index),
+            "settle_index": str(settle_index),
+            "state": "SETTLED" if settled else "OPEN",
+        }
+
+    def settle(self, add_index: int) -> int:
+        # settles an open invoice, it gets the next settle_index
+        with self.lock:
+            if add_index % 3 != 0 or add_index in self.settled_later:
+                raise ValueError("Invoice {} is not open".format(add_index))
+            settle_index = self.invoices - self.invoices // 3 + len(self.settled_later) + 1
+            self.settled_later[add_index] = settle_index
+        return settle_index
+
+    def __payment(self, payment_index: int) -> dict:
+        value_msat = 1000 * (1000 + payment_index * 15485863 % 2000000)
+        fee_msat = value_msat // 1000
+        return {
+            "payment_hash": self.__digest("payment", payment_index).hex(),
+            "value_sat": str(value_msat // 1000),
+            "value_msat": str(value_msat),
+            "creation_date": str(self.START_TIME + payment_index * 120),
+            "fee_sat": str(fee_msat // 1000),
+            "fee_msat": str(fee_msat),
+            "status": "SUCCEEDED" if payment_index % 5 != 0 else "FAILED",
+            "payment_index": str(payment_index),
+        }
+
+    # endpoints, each returns (status, body)
+
+    def getinfo(self, params: dict) -> tuple:
+        return 200, {
+            "alias": "fake-lnd",
+            "color": "#3399ff",
+            "identity_pubkey": self.own_pub_key,
+            "block_height": self.BLOCK_HEIGHT,
+        }
+
+    def switch(self, data: dict) -> tuple:
+        first = 0
+        if int(data.get("start_time", 0)) > self.START_TIME:
+            first = -(-(int(data["start_time"]) - self.START_TIME) // self.FORWARD_STEP)
+        end = self.forwards
+        if data.get("end_time") is not None:
+            end = min(end, (int(data["end_time"]) - self.START_TIME) // self.FORWARD_STEP + 1)
+        # like lnd, index_offset counts the forwards after start_time
+        offset = int(data.get("index_offset", 0))
+        first += offset
+        last = max(min(end, first + int(data.get("num_max_events", 100))), first)
+        return 200, {
+            "forwarding_events": [self.__forward(index) for index in range(first, last)],
+            "last_offset_index": offset + last - first,
+        }
+
+    def invoices_list(self, params: dict) -> tuple:
+        offset = int(params.get("index_offset", 0))
+        count = int(params.get("num_max_invoices", 100))
+        last = min(self.invoices, offset + count)
+        invoices = [self.__invoice(add_index) for add_index in range(offset + 1, last + 1)]
+        return 200, {
+            "invoices": invoices,
+            "first_index_offset": str(offset + 1 if len(invoices) > 0 else 0),
+            "last_index_offset": str(last if len(invoices) > 0 else 0),
+        }
+
+    def invoices_subscribe(self, params: dict) -> list:
+        # replay of invoices settled after settle_index, in settle order
+        after = int(params.get("settle_index", 0))
+        if after <= 0:
+            return list()
+        invoices = list()
+        # settle_index of the first settle() is above all of the others
+        for add_index in range(max(after * 3 // 2 - 2, 1), self.invoices + 1):
+            if add_index % 3 != 0 and add_index - add_index // 3 > after:
+                invoices.append(self.__invoice(add_index))
+        with self.lock:
+            later = sorted(self.settled_later.items(), key=lambda item: item[1])
+        for add_index, settle_index in later:
+            if settle_index > after:
+                invoices.append(self.__invoice(add_index))
+        return [{"result": invoice} for invoice in invoices]
+
+    def payments_list(self, params: dict) -> tuple:
+        offset = int(params.get("index_offset", 0))
+        count = int(params.get("max_payments", 100))
+        last = min(self.payments, offset + count)
+        return 200, {
+            "payments": [self.__payment(index) for index in range(offset + 1, last + 1)],
+            "first_index_offset": str(offset + 1),
+            "last_index_offset": str(last),
+        }
+
+    def graph_edge(self, chan_id: str) -> tuple:
+        channel = self.__channel_of_chan_id(chan_id)
+        if channel is None:
+            return 404, {"code": 5, "message": "edge not found"}
+        return 200, {
+            "channel_id": chan_id,
+            "capacity": str(self.__capacity(channel)),
+            "node1_pub": self.own_pub_key,
+            "node2_pub": self.__pub_key(channel),
+        }
+
+    def graph_node(self, pub_key: str) -> tuple:
+        peer = self.__peer_of_pub_key(pub_key)
+        if peer is None:
+            return 404, {"code": 5, "message": "unable to find node"}
+        return 200, {
+            "node": {"pub_key": pub_key, "alias": "peer-{}".format(peer)},
+            "num_channels": 1,
+            "total_capacity": str(self.__capacity(peer)),
+        }
+
+    def graph(self, params: dict) -> tuple:
+        edges = list()
+        nodes = list()
+        for channel in range(self.channels):
+            edges.append(self.graph_edge(str(self.__chan_id(channel)))[1])
+            nodes.append({"pub_key": self.__pub_key(channel), "alias": "peer-{}".format(channel)})
+        return 200, {"nodes": nodes, "edges": edges}
+
+    def channels_list(self, params: dict) -> tuple:
+        return 200, {"channels": [self.__channel(channel) for channel in range(self.channels)]}
+
+    def channels_closed(self, params: dict) -> tuple:
+        return 200, {"channels": []}
+
+    def channels_backup(self, params: dict) -> tuple:
+        chan_points = [
+            {"funding_txid_str": self.__digest("funding", channel).hex(), "output_index": 0}
+            for channel in range(self.channels)
+        ]
+        return 200, {
+            "multi_chan_backup": {
+                "chan_points": chan_points,
+                "multi_chan_backup": base64.b64encode(
+                    b"".join(self.__digest("backup", channel) for channel in range(self.channels))
+                ).decode(),
+            }
+        }
+
+    def balance_channels(self, params: dict) -> tuple:
+        local = 0
+        remote = 0
+        for channel in range(self.channels):
+            item = self.__channel(channel)
+            local += int(item["local_balance"])
+            remote += int(item["remote_balance"])
+        return 200, {
+            "local_balance": {"sat": str(local), "msat": str(local * 1000)},
+            "remote_balance": {"sat": str(remote), "msat": str(remote * 1000)},
+            "pending_open_balance": "0",
+        }
+
+    def balance_blockchain(self, params: dict) -> tuple:
+        return 200, {"total_balance": "12345678", "confirmed_balance": "12345678"}
+
+    def route(self, method: str, path: str, params: dict, body: dict) -> tuple:
+        exact = {
+            ("GET", "/v1/getinfo"): self.getinfo,
+            ("POST", "/v1/switch"): lambda _: self.switch(body),
+            ("GET", "/v1/invoices"): self.invoices_list,
+            ("GET", "/v1/payments"): self.payments_list,
+            ("GET", "/v1/graph"): self.graph,
+            ("GET", "/v1/channels"): self.channels_list,
+            ("GET", "/v1/channels/closed"): self.channels_closed,
+            ("GET", "/v1/channels/backup"): self.channels_backup,
+            ("GET", "/v1/balance/channels"): self.balance_channels,
+            ("GET", "/v1/balance/blockchain"): self.balance_blockchain,
+        }
+        handler = exact.get((method, path))
+        if handler is not None:
+            return handler(params)
+        prefixes = {
+            "/v1/graph/edge/": self.graph_edge,
+            "/v1/graph/node/": self.graph_node,
+        }
+        if method == "GET":
+            for prefix, handler in prefixes.items():
+                if path.startswith(prefix):
+                    return handler(path[len(prefix):])
+        return 404, {"code": 12, "message": "Not Implemented"}
+
+    def __handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                self.__respond("GET")
+
+            def do_POST(self) -> None:
+                self.__respond("POST")
+
+            def __respond(self, method: str) -> None:
+                url = urlparse(self.path)
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                body = dict()
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > 0:
+                    body = json.loads(self.rfile.read(length))
+                with fake.lock:
+                    fake.requests += 1
+                if fake.latency > 0:
+                    time.sleep(fake.latency)
+                if method == "GET" and url.path == "/v1/invoices/subscribe":
+                    self.__stream(fake.invoices_subscribe(params))
+                    return
+                try:
+                    status, content = fake.route(method, url.path, params, body)
+                except Exception as e:
+                    status, content = 500, {"code": 2, "message": str(e)}
+                payload = json.dumps(content).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def __stream(self, messages: list) -> None:
+                # newline delimited json in chunks, then silence like lnd without events;
+                # lnd sends no headers either until the first event
+                self.close_connection = True
+                if not messages:
+                    time.sleep(fake.STREAM_HOLD)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for message in messages:
+                        chunk = (json.dumps(message) + "\n").encode()
+                        self.wfile.write("{:x}\r\n".format(len(chunk)).encode() + chunk + b"\r\n")
+                    self.wfile.flush()
+                    time.sleep(fake.STREAM_HOLD)
+                    self.wfile.write(b"0\r\n\r\n")
+                except OSError:
+                    # the client stopped reading
+                    pass
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake lnd REST api")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--forwards", type=int, default=100000)
+    parser.add_argument("--channels", type=int, default=1000)
+    parser.add_argument("--invoices", type=int, default=10000)
+    parser.add_argument("--payments", type=int, default=10000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    fake = Fake_lnd(
+        forwards=args.forwards,
+        channels=args.channels,
+        invoices=args.invoices,
+        payments=args.payments,
+        latency=args.latency,
+        seed=args.seed,
+        host=args.host,
+        port=args.port,
+    )
+    print("Fake lnd listening on {}".format(fake.url))
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
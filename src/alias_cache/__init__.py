@@ -0,0 +1,85 @@
+import threading
+import time
+from db import DB
+from logger import Logger
+
+
+class Alias_cache:
+    DEFAULT_TTL = 24 * 60 * 60
+
+    def __init__(self, db: DB, logger: Logger, ttl: int = DEFAULT_TTL) -> None:
+        # lookups come from collector threads and the alias pool, the cache
+        # has its own connection and uses it one call at a time
+        self.db = db.clone()
+        self.db_lock = threading.Lock()
+        self.logger = logger
+        self.ttl = ttl
+        # channel_id -> (alias, capacity, public_key, refreshed unix time)
+        self.memory = dict()
+        # channels reported as changed by lnd, refreshed on next lookup
+        self.stale = set()
+        self.hits = 0
+        self.misses = 0
+
+    def __is_fresh(self, refreshed: float) -> bool:
+        return refreshed is not None and time.time() - refreshed < self.ttl
+
+    def get(self, channel_id) -> tuple:
+        channel_id = int(channel_id)
+        if channel_id in self.stale:
+            self.misses += 1
+            return None
+        entry = self.memory.get(channel_id)
+        if entry is None:
+            entry = self.__load_from_db(channel_id)
+        if entry is not None and self.__is_fresh(entry[3]):
+            self.hits += 1
+            return entry[0], entry[1], entry[2]
+        self.misses += 1
+        return None
+
+    def __load_from_db(self, channel_id: int) -> tuple:
+        with self.db_lock:
+            try:
+                res = self.db.get_channel(channel_id)
+            finally:
+                # no transaction is left open between lookups
+                self.db.rollback()
+        if res is None:
+            return None
+        public_key, alias, last_refreshed = res
+        refreshed = None
+        if last_refreshed is not None:
+            refreshed = last_refreshed.timestamp()
+        entry = (alias, None, public_key, refreshed)
+        self.memory[channel_id] = entry
+        return entry
+
+    def put(self, channel_id, alias: str, capacity, public_key: str) -> tuple:
+        channel_id = int(channel_id)
+        # db keeps the last known alias/pubkey when lnd does not know the channel anymore
+        with self.db_lock:
+            try:
+                public_key, alias = self.db.refresh_channel(channel_id, public_key, alias)
+            except Exception:
+                self.db.rollback()
+                raise
+        self.memory[channel_id] = (alias, capacity, public_key, time.time())
+        self.stale.discard(channel_id)
+        return alias, capacity, public_key
+
+    def invalidate(self, channel_id) -> None:
+        self.stale.add(int(channel_id))
+
+    def is_persisted(self, channel_id, public_key: str, alias: str) -> bool:
+        entry = self.memory.get(int(channel_id))
+        if entry is None:
+            return False
+        return entry[0] == alias and entry[2] == public_key
+
+    def log_stats(self) -> None:
+        self.logger.info(
+            "Alias cache: {} hits, {} misses, {} channels in memory.".format(
+                self.hits, self.misses, len(self.memory)
+            )
+        )
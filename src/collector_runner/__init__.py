@@ -0,0 +1,210 @@
+import cProfile
+import os
+import threading
+import time
+from datetime import datetime
+from logger import Logger
+import metrics
+
+COLLECTOR_SECONDS = metrics.histogram(
+    "collector_run_seconds", "Run time of collectors.", ("collector",)
+)
+COLLECTOR_RUNS = metrics.counter(
+    "collector_runs_total", "Collector runs by result.", ("collector", "status")
+)
+COLLECTOR_ROWS = metrics.counter(
+    "collector_rows_total",
+    "Rows fetched from lnd and written to db by collectors.",
+    ("collector", "kind"),
+)
+
+
+class Collector_runner:
+    OK = "ok"
+    FAILED = "failed"
+    TIMEOUT = "timeout"
+    DEFAULT_TIMEOUT = 600
+    POLL_INTERVAL = 0.1
+
+    def __init__(
+        self,
+        db_factory,
+        logger: Logger,
+        default_timeout: float = DEFAULT_TIMEOUT,
+        transport=None,
+        profile_dir: str = None,
+    ) -> None:
+        # db_factory() opens a new DB connection, every collector gets its own
+        self.db_factory = db_factory
+        self.logger = logger
+        self.default_timeout = default_timeout
+        # LND_transport counting rest calls of each collector run
+        self.transport = transport
+        # cProfile dump of every collector run is written here when set
+        self.profile_dir = profile_dir
+        # name -> (func(db), dependency names, timeout in seconds)
+        self.collectors = dict()
+        self.lock = threading.Lock()
+        self.done = dict()
+        self.started = dict()
+        self.results = dict()
+        self.run_started = None
+
+    def add(self, name: str, func, depends_on: tuple = (), timeout: float = None) -> None:
+        # dependencies have to be added first, so there can be no cycle
+        for dependency in depends_on:
+            if dependency not in self.collectors:
+                raise ValueError("Unknown dependency {} of collector {}".format(dependency, name))
+        if timeout is None:
+            timeout = self.default_timeout
+        self.collectors[name] = (func, tuple(depends_on), timeout)
+
+    def run(self) -> dict:
+        # returns name -> (status, seconds)
+        start = time.time()
+        self.run_started = datetime.now()
+        self.done = {name: threading.Event() for name in self.collectors.keys()}
+        self.started = dict()
+        self.results = dict()
+        for name in self.collectors.keys():
+            threading.Thread(
+                target=self.__run_collector,
+                args=(name,),
+                name="collector-{}".format(name),
+                daemon=True,
+            ).start()
+        pending = set(self.collectors.keys())
+        while len(pending) > 0:
+            for name in list(pending):
+                if self.done[name].is_set():
+                    pending.discard(name)
+                    continue
+                started = self.started.get(name)
+                timeout = self.collectors[name][2]
+                if started is not None and time.time() - started > timeout:
+                    # the thread can not be killed, it is left behind and its result ignored
+                    self.logger.error("Collector {} timed out after {}s.", name, timeout)
+                    COLLECTOR_RUNS.inc(name, self.TIMEOUT)
+                    self.__finish(name, self.TIMEOUT)
+                    pending.discard(name)
+            time.sleep(self.POLL_INTERVAL)
+        self.logger.info(
+            "Collectors finished in {:.2f}s: {}",
+            time.time() - start,
+            lambda: ", ".join(
+                "{} {} {:.2f}s".format(name, status, seconds)
+                for name, (status, seconds) in self.results.items()
+            ),
+        )
+        return dict(self.results)
+
+    def __run_collector(self, name: str) -> None:
+        func, depends_on, _ = self.collectors[name]
+        for dependency in depends_on:
+            self.done[dependency].wait()
+            if self.results[dependency][0] != self.OK:
+                self.logger.warning(
+                    "Collector {} runs although {} {}.", name, dependency, self.results[dependency][0]
+                )
+        self.started[name] = time.time()
+        status = self.run_collector(
+            name,
+            func,
+            self.db_factory,
+            self.logger,
+            self.run_started,
+            transport=self.transport,
+            profile_dir=self.profile_dir,
+        )
+        self.__finish(name, status)
+
+    def __finish(self, name: str, status: str) -> None:
+        with self.lock:
+            if name in self.results:
+                return
+            self.results[name] = (status, time.time() - self.started[name])
+        self.done[name].set()
+
+    @classmethod
+    def run_collector(
+        cls,
+        name: str,
+        func,
+        db_factory,
+        logger: Logger,
+        run_started: datetime,
+        transport=None,
+        profile_dir: str = None,
+    ) -> str:
+        # runs func(db) on this thread and records it in collector_runs,
+        # func may return {"fetched": rows from lnd, "written": rows to db}
+        started = datetime.now()
+        start = time.time()
+        counter = transport.count_calls() if transport is not None else None
+        status = cls.OK
+        error_class = None
+        stats = None
+        profile = None
+        db = None
+        try:
+            db = db_factory()
+            if profile_dir is not None:
+                # cProfile follows only the thread it was enabled on
+                profile = cProfile.Profile()
+                profile.enable()
+            try:
+                stats = func(db)
+            finally:
+                if profile is not None:
+                    profile.disable()
+        except Exception as e:
+            status = cls.FAILED
+            error_class = type(e).__name__
+            logger.error("Collector {} failed: {}: {}", name, error_class, str(e))
+        seconds = time.time() - start
+        calls = counter.calls if counter is not None else 0
+        if not isinstance(stats, dict):
+            # report and timers return nothing, or whatever their last call gave
+            stats = dict()
+        COLLECTOR_SECONDS.observe(seconds, name)
+        COLLECTOR_RUNS.inc(name, status)
+        for kind in ("fetched", "written"):
+            COLLECTOR_ROWS.inc(name, kind, amount=int(stats.get(kind, 0)))
+        if profile is not None:
+            cls.__dump_profile(profile, profile_dir, name, run_started, logger)
+        if db is None:
+            return status
+        try:
+            # a failed collector may have left its transaction open
+            db.rollback()
+            db.write_collector_run(
+                (
+                    run_started,
+                    name,
+                    started,
+                    datetime.now(),
+                    int(seconds * 1000),
+                    int(stats.get("fetched", 0)),
+                    int(stats.get("written", 0)),
+                    calls,
+                    status,
+                    error_class,
+                )
+            )
+        except Exception as e:
+            logger.error("Can not record run of collector {}: {}", name, str(e))
+        finally:
+            db.close()
+        return status
+
+    @staticmethod
+    def __dump_profile(profile, profile_dir: str, name: str, run_started: datetime, logger: Logger) -> None:
+        try:
+            os.makedirs(profile_dir, exist_ok=True)
+            path = os.path.join(
+                profile_dir, "{}-{}.prof".format(run_started.strftime("%Y%m%d-%H%M%S"), name)
+            )
+            profile.dump_stats(path)
+            logger.info("Profile of {} written to {}.", name, path)
+        except Exception as e:
+            logger.error("Can not write profile of {}: {}", name, str(e))
@@ -1,29 +1,222 @@
 import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+from db_pool import Db_pool
+import metrics
 import json
+import re
+import sys
+import time
+import hashlib
+import zlib
 from datetime import datetime, date, timedelta
+from report_snapshot import Report_snapshot, Report_window
 # from logger import Logger
 
+STATEMENT_SECONDS = metrics.histogram(
+    "db_statement_seconds", "Duration of DB statements.", ("operation", "table")
+)
+ROWS_WRITTEN = metrics.counter(
+    "db_rows_written_total", "Rows written by batch writers.", ("table",)
+)
+
+
+class Metrics_cursor(psycopg2.extensions.cursor):
+    # only the start of a statement is looked at, execute_values sends whole pages
+    TABLE = re.compile(r"\b(?:INTO|FROM|UPDATE)\s+(?:public\.)?\"?(\w+)", re.IGNORECASE)
+
+    def execute(self, query, vars=None):
+        start = time.time()
+        try:
+            return super().execute(query, vars)
+        finally:
+            head = query[:300]
+            if isinstance(head, bytes):
+                head = head.decode(errors="ignore")
+            words = head.split(None, 1)
+            operation = words[0].upper() if len(words) > 0 else ""
+            match = self.TABLE.search(head)
+            STATEMENT_SECONDS.observe(
+                time.time() - start, operation, match.group(1) if match else ""
+            )
+
+
+class Reconnecting_cursor:
+    # the statement that starts a transaction is sent once more on a new
+    # connection when the old one died meanwhile, e.g. postgres restarted;
+    # later statements are not, the work before them is lost with the connection
+    def __init__(self, get_cursor, reconnect) -> None:
+        self.get_cursor = get_cursor
+        self.reconnect = reconnect
+
+    def execute(self, query, vars=None):
+        cursor = self.get_cursor()
+        idle = cursor.connection.status == psycopg2.extensions.STATUS_READY
+        try:
+            return cursor.execute(query, vars)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            if not idle or cursor.connection.closed == 0:
+                raise
+            self.reconnect()
+            return self.get_cursor().execute(query, vars)
+
+    def __getattr__(self, name):
+        # fetch*, rowcount, mogrify, connection, ... of the current cursor
+        return getattr(self.get_cursor(), name)
+
 
 class DB:
     SATS_TO_BTC = 100000000
     MSATS_TO_SATS = 1000
+    BULK_PAGE_SIZE = 1000
+    SYNC_FORWARDING = "forwarding"
+    SYNC_PAYMENTS = "payments"
+    SYNC_INVOICES_ADD = "invoices_add"
+    SYNC_INVOICES_SETTLE = "invoices_settle"
+    LOG_CONNECT_TIMEOUT = 5
+    # monthly partitioned tables and their partition column, see update-schemas.sql
+    PARTITIONED_TABLES = {
+        "routing": "unix_timestamp",
+        "failed_htlc": "unix_timestamp",
+        "logs": "log_timestamp",
+    }
+    PARTITION_MONTHS_AHEAD = 3
+    # pg_advisory_xact_lock key held while the schema is created or updated
+    SCHEMA_LOCK = 7301
 
     def __init__(
-        self, db: str, user: str, password: str, host: str, port: int = 5432
+        self,
+        db: str,
+        user: str,
+        password: str,
+        host: str,
+        port: int = 5432,
+        prepare_schema: bool = True,
+        min_connections: int = 1,
+        max_connections: int = 10,
+        pool: Db_pool = None,
+        **connect_kwargs
     ) -> None:
-        # connecting to db
-        self.conn = psycopg2.connect(
-            database=db, user=user, password=password, host=host, port=port
+        # connect_kwargs go to psycopg2.connect, e.g. cursor_factory
+        connect_kwargs.setdefault("cursor_factory", Metrics_cursor)
+        self.connect_params = {
+            "database": db,
+            "user": user,
+            "password": password,
+            "host": host,
+            "port": port,
+        }
+        self.connect_params.update(connect_kwargs)
+        # clones share the pool, every DB object holds one connection checked out of it
+        self.pool = pool
+        if self.pool is None:
+            self.pool = Db_pool(min_connections, max_connections, **self.connect_params)
+        self.__conn = None
+        self.__cursor = None
+        self.__used = 0
+        self.__verify = False
+        self.__reconnecting_cursor = Reconnecting_cursor(
+            self.__current_cursor, self.__reconnect
         )
-        self.cursor = self.conn.cursor()  # creating a cursor
-        if self.__is_db_cleared():
-            self.create_schema()
+        self.alias_cache = None
+        if prepare_schema:
+            self.__prepare_schema()
+
+    def clone(self) -> "DB":
+        # new connection for another thread, schema is already prepared by this one
+        db = DB(
+            self.connect_params["database"],
+            self.connect_params["user"],
+            self.connect_params["password"],
+            self.connect_params["host"],
+            port=self.connect_params["port"],
+            prepare_schema=False,
+            pool=self.pool,
+        )
+        db.set_alias_cache(self.alias_cache)
+        return db
+
+    @property
+    def conn(self):
+        # checked out lazily, a connection idle for a while is tested before
+        # it is used and replaced when postgres went away meanwhile
+        # the check rolls back, so only a connection without an open
+        # transaction is tested
+        if self.__conn is not None and (
+            self.__conn.closed != 0
+            or (
+                time.time() - self.__used > self.pool.HEALTH_CHECK_AFTER
+                and self.__conn.get_transaction_status()
+                == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+                and not self.pool.is_alive(self.__conn)
+            )
+        ):
+            self.__release(broken=True)
+        if self.__conn is None:
+            self.__conn = self.pool.getconn(verify=self.__verify)
+            self.__cursor = self.__conn.cursor()
+            self.__verify = False
+        self.__used = time.time()
+        return self.__conn
+
+    @property
+    def cursor(self) -> Reconnecting_cursor:
+        return self.__reconnecting_cursor
+
+    def __current_cursor(self):
+        conn = self.conn
+        if self.__cursor is None or self.__cursor.closed:
+            self.__cursor = conn.cursor()
+        return self.__cursor
+
+    def __reconnect(self) -> None:
+        self.__release(broken=True)
+        self.__verify = True
+
+    def __release(self, broken: bool = False) -> None:
+        if self.__conn is None:
+            return
+        self.pool.putconn(self.__conn, broken=broken)
+        self.__conn = None
+        self.__cursor = None
+
+    def close(self) -> None:
+        # gives the connection back to the pool, the object can still be used
+        self.__release()
 
     def create_schema(self) -> None:
-        with open("./sql-scripts/create-schemas.sql", "r") as sql_file:
-            query = sql_file.read()
-            self.cursor.execute(query)
-            self.conn.commit()
+        self.__execute_script("./sql-scripts/create-schemas.sql")
+        self.conn.commit()
+
+    def update_schema(self) -> None:
+        self.__execute_script("./sql-scripts/update-schemas.sql")
+        self.conn.commit()
+
+    def __prepare_schema(self) -> None:
+        # rest and websocket containers start at the same time, the second one
+        # waits for the lock and then finds tables created and converted; all of
+        # it is one transaction, also copying rows of a table into partitions
+        self.cursor.execute("SELECT pg_advisory_xact_lock(%s);", (self.SCHEMA_LOCK,))
+        if self.__is_db_cleared():
+            self.__execute_script("./sql-scripts/create-schemas.sql")
+        self.__execute_script("./sql-scripts/update-schemas.sql")
+        self.__backfill_routing_daily()
+
+    def __execute_script(self, path: str) -> None:
+        with open(path, "r") as sql_file:
+            self.cursor.execute(sql_file.read())
+
+    def rollback(self) -> None:
+        if self.__conn is None:
+            return
+        try:
+            self.__conn.rollback()
+        except psycopg2.Error:
+            # connection is gone, the next query checks out a new one
+            self.__release(broken=True)
+
+    def set_alias_cache(self, alias_cache) -> None:
+        self.alias_cache = alias_cache
 
     def __is_db_cleared(self) -> bool:
         query = """
@@ -35,43 +228,238 @@ class DB:
         res = self.cursor.fetchone()
         return int(res[0]) == 0
 
-    def write_tx_to_db(self, content_list: list, logger) -> None:
-        logger.info("Start writting channels to DB.")
+    def write_tx_to_db(self, content_list: list, logger, cursor: tuple = None) -> None:
+        start = time.time()
+        channels = dict()
+        rows = list()
+        daily = dict()
         for item in content_list:
-            self.check_channel_in_db(
-                item["chan_id_in"], item["public_key_in"], item["chan_in_alias"], logger
+            channels[int(item["chan_id_in"])] = (item["public_key_in"], item["chan_in_alias"])
+            channels[int(item["chan_id_out"])] = (item["public_key_out"], item["chan_out_alias"])
+            unix_timestamp = datetime.fromtimestamp(int(item["timestamp"]))
+            key = (unix_timestamp.date(), int(item["chan_id_in"]), int(item["chan_id_out"]))
+            day = daily.get(key, (0, 0, 0, 0))
+            daily[key] = (
+                day[0] + 1,
+                day[1] + int(item["amt_out"]),
+                day[2] + int(item["amt_out_msat"]),
+                day[3] + int(item["fee_msat"]),
             )
-            self.check_channel_in_db(
-                item["chan_id_out"],
-                item["public_key_out"],
-                item["chan_out_alias"],
-                logger,
+            rows.append(
+                (
+                    unix_timestamp,
+                    item["chan_id_in"],
+                    item["chan_id_out"],
+                    item["amt_in"],
+                    item["amt_out"],
+                    item["fee"],
+                    item["fee_msat"],
+                    item["amt_in_msat"],
+                    item["amt_out_msat"],
+                )
             )
-            logger.info("Channels written to DB.")
-            logger.info("Start writing Txs to DB.")
-            self.__write_routing_tx(item, logger)
-            logger.info("Written TXs to DB.")
-        logger.info("Done writting channels to DB.")
+        written_channels = self.__upsert_channels(channels)
+        query = """
+        INSERT INTO public.routing 
+        (unix_timestamp, chan_id_in, chan_id_out, amount_in_sats, amount_out_sats, fee_sats, fee_milisats, amt_in_milisats, amount_out_milisats)
+        VALUES %s;
+        """
+        self.__bulk_insert(query, rows)
+        self.__add_to_routing_daily(daily)
+        self.__stage_sync_cursor(cursor)
+        self.conn.commit()
+        self.__log_throughput(logger, "routing", len(rows), start)
+        logger.debug("Channels written with routing batch: {}", written_channels)
 
-    def check_channel_in_db(
-        self, channel_id: int, public_key: str, alias: str, logger
-    ) -> None:
-        if not self.is_channel_in_db(channel_id):
-            logger.info("Channel not in DB, writting it.")
+    def __add_to_routing_daily(self, daily: dict) -> None:
+        query = """
+            INSERT INTO routing_daily (day, chan_id_in, chan_id_out, tx_count, amount_out_sats, amount_out_milisats, fee_milisats)
+            VALUES %s
+            ON CONFLICT (day, chan_id_in, chan_id_out) DO UPDATE SET
+                tx_count = routing_daily.tx_count + EXCLUDED.tx_count,
+                amount_out_sats = routing_daily.amount_out_sats + EXCLUDED.amount_out_sats,
+                amount_out_milisats = routing_daily.amount_out_milisats + EXCLUDED.amount_out_milisats,
+                fee_milisats = routing_daily.fee_milisats + EXCLUDED.fee_milisats;
+            """
+        rows = [key + values for key, values in daily.items()]
+        self.__bulk_insert(query, rows)
+        totals = dict()
+        for (day, _, _), values in daily.items():
+            total = totals.get(day, (0, 0, 0, 0))
+            totals[day] = tuple(a + b for a, b in zip(total, values))
+        query = """
+            INSERT INTO routing_day_total (day, tx_count, amount_out_sats, amount_out_milisats, fee_milisats)
+            VALUES %s
+            ON CONFLICT (day) DO UPDATE SET
+                tx_count = routing_day_total.tx_count + EXCLUDED.tx_count,
+                amount_out_sats = routing_day_total.amount_out_sats + EXCLUDED.amount_out_sats,
+                amount_out_milisats = routing_day_total.amount_out_milisats + EXCLUDED.amount_out_milisats,
+                fee_milisats = routing_day_total.fee_milisats + EXCLUDED.fee_milisats;
+            """
+        self.__bulk_insert(query, [(day,) + values for day, values in totals.items()])
+
+    def rebuild_routing_daily(self, logger) -> None:
+        logger.info("Rebuilding routing_daily from routing...")
+        start = time.time()
+        self.cursor.execute("DELETE FROM routing_daily;")
+        self.cursor.execute("DELETE FROM routing_day_total;")
+        self.__fill_routing_daily()
+        self.conn.commit()
+        logger.info("Routing_daily rebuilt in {:.2f}s.", time.time() - start)
+
+    def maintain_partitions(self, logger, retention: dict = None) -> int:
+        # creates the partitions of the next months and of past months that
+        # have rows in the default partition, e.g. after the first sync of
+        # history, and moves those rows there; retention maps a table to the
+        # number of months kept before the current one, its older partitions
+        # are dropped whole, tables without an entry keep everything
+        retention = retention or dict()
+        changed = 0
+        today = date.today()
+        for table, column in self.PARTITIONED_TABLES.items():
             self.cursor.execute(
-                "INSERT INTO channels (channel_id,remote_public_key,alias) VALUES (%s,%s,%s);",
-                (channel_id, public_key, alias),
+                "SELECT min({}) FROM public.{}_default;".format(column, table)
             )
-            logger.debug(
-                "Channel to be written: {},{},{}".format(
-                    str(channel_id), str(public_key), str(alias)
-                )
+            first = self.cursor.fetchone()[0]
+            from_month = today
+            if first is not None and first.date() < today:
+                from_month = first.date()
+            if retention.get(table) is not None:
+                # months that are dropped right after are not split out
+                month = today.year * 12 + today.month - 1 - int(retention[table])
+                from_month = max(from_month, date(month // 12, month % 12 + 1, 1))
+            self.cursor.execute(
+                "SELECT public.create_monthly_partitions(%s, %s, %s, %s);",
+                (table, column, from_month, self.PARTITION_MONTHS_AHEAD),
             )
+            created = self.cursor.fetchone()[0]
+            dropped = 0
+            if retention.get(table) is not None:
+                self.cursor.execute(
+                    "SELECT public.drop_monthly_partitions(%s, %s, %s);",
+                    (table, column, int(retention[table])),
+                )
+                dropped = self.cursor.fetchone()[0]
             self.conn.commit()
-        self.update_channel_alias(channel_id,alias)
-        logger.info("Channel written to DB.")
-        
-        
+            if created > 0 or dropped > 0:
+                logger.info(
+                    "Partitions of {}: {} created, {} dropped.", table, created, dropped
+                )
+            changed += created + dropped
+        return changed
+
+    def __backfill_routing_daily(self) -> None:
+        # databases created before routing_daily or routing_day_total existed
+        # get them filled once
+        query = """
+            SELECT EXISTS (SELECT 1 FROM routing) AND NOT EXISTS (SELECT 1 FROM routing_daily);
+            """
+        self.cursor.execute(query)
+        if self.cursor.fetchone()[0]:
+            self.__fill_routing_daily()
+        query = """
+            SELECT EXISTS (SELECT 1 FROM routing_daily) AND NOT EXISTS (SELECT 1 FROM routing_day_total);
+            """
+        self.cursor.execute(query)
+        if self.cursor.fetchone()[0]:
+            self.__fill_routing_day_total()
+        self.conn.commit()
+
+    def __fill_routing_daily(self) -> None:
+        query = """
+            INSERT INTO routing_daily (day, chan_id_in, chan_id_out, tx_count, amount_out_sats, amount_out_milisats, fee_milisats)
+            SELECT unix_timestamp::date, chan_id_in, chan_id_out, count(*),
+                sum(amount_out_sats), sum(amount_out_milisats), sum(fee_milisats)
+            FROM routing
+            GROUP BY unix_timestamp::date, chan_id_in, chan_id_out;
+            """
+        self.cursor.execute(query)
+        self.__fill_routing_day_total()
+
+    def __fill_routing_day_total(self) -> None:
+        query = """
+            INSERT INTO routing_day_total (day, tx_count, amount_out_sats, amount_out_milisats, fee_milisats)
+            SELECT day, sum(tx_count), sum(amount_out_sats), sum(amount_out_milisats), sum(fee_milisats)
+            FROM routing_daily
+            GROUP BY day;
+            """
+        self.cursor.execute(query)
+
+    def check_channel_in_db(
+        self, channel_id: int, public_key: str, alias: str, logger
+    ) -> None:
+        self.__upsert_channels({int(channel_id): (public_key, alias)})
+        self.conn.commit()
+
+    def __upsert_channels(self, channels: dict) -> int:
+        # channels: channel_id -> (public_key, alias), already unique per batch
+        rows = list()
+        for channel_id, (public_key, alias) in channels.items():
+            if self.alias_cache is not None and self.alias_cache.is_persisted(
+                channel_id, public_key, alias
+            ):
+                continue
+            rows.append((channel_id, public_key, alias))
+        query = """
+            INSERT INTO channels (channel_id,remote_public_key,alias) VALUES %s
+            ON CONFLICT (channel_id) DO UPDATE SET
+                remote_public_key = COALESCE(EXCLUDED.remote_public_key, channels.remote_public_key),
+                alias = COALESCE(EXCLUDED.alias, channels.alias);
+            """
+        return self.__bulk_insert(query, rows)
+
+    def __bulk_insert(
+        self, query: str, rows: list, template: str = None, returning: bool = False
+    ) -> int:
+        # with returning the query has a RETURNING clause and only the rows it
+        # returns are counted, e.g. the ones an upsert really changed
+        if len(rows) == 0:
+            return 0
+        res = execute_values(
+            self.cursor,
+            query,
+            rows,
+            template=template,
+            page_size=self.BULK_PAGE_SIZE,
+            fetch=returning,
+        )
+        if returning:
+            return len(res)
+        return len(rows)
+
+    def __log_throughput(self, logger, name: str, count: int, start: float) -> None:
+        ROWS_WRITTEN.inc(name, amount=count)
+        duration = time.time() - start
+        rate = count / duration if duration > 0 else float(count)
+        logger.info(
+            "Written {} {} rows in {:.2f}s ({:.0f} rows/sec).".format(
+                count, name, duration, rate
+            )
+        )
+
+    def refresh_channel(self, channel_id: int, public_key: str, alias: str) -> tuple:
+        self.cursor.execute(
+            """
+            INSERT INTO channels (channel_id,remote_public_key,alias,last_refreshed) VALUES (%s,%s,%s,now())
+            ON CONFLICT (channel_id) DO UPDATE SET
+                remote_public_key = COALESCE(EXCLUDED.remote_public_key, channels.remote_public_key),
+                alias = COALESCE(EXCLUDED.alias, channels.alias),
+                last_refreshed = now()
+            RETURNING remote_public_key, alias;
+            """,
+            (channel_id, public_key, alias),
+        )
+        res = self.cursor.fetchone()
+        self.conn.commit()
+        return res[0], res[1]
+
+    def get_channel(self, channel_id: int) -> tuple:
+        self.cursor.execute(
+            "SELECT remote_public_key, alias, last_refreshed FROM channels WHERE channel_id = %s;",
+            (channel_id,),
+        )
+        return self.cursor.fetchone()
+
     def update_channel_alias(self, channel_id:int, alias:str)->None:
         self.cursor.execute(
             """SELECT alias FROM channels WHERE channel_id = %s;""",(channel_id,)
@@ -84,7 +472,6 @@ class DB:
             self.conn.commit()
         
     def is_channel_in_db(self,channel_id:int)->bool:
-         # print(channel_id)
         self.cursor.execute(
             "SELECT sum(channel_id) FROM channels WHERE channel_id = %s;", (channel_id,)
         )
@@ -97,103 +484,124 @@ class DB:
             return True
             
         
-    def __write_routing_tx(self, content: dict, logger) -> None:
+    def write_invoices(self, invoices: list, logger, cursor: tuple = None) -> int:
+        # returns the number of invoices inserted or moved to another state
+        logger.info("Start writing invoices to DB.")
+        start = time.time()
+        # existing invoices are only updated when lnd moved them to another state
         query = """
-        INSERT INTO public.routing 
-        (unix_timestamp, chan_id_in, chan_id_out, amount_in_sats, amount_out_sats, fee_sats, fee_milisats, amt_in_milisats, amount_out_milisats)
-        VALUES
-        (%s, %s, %s, %s, %s, %s, %s, %s, %s);
+            INSERT INTO public.invoices (memo, value, value_milisats, settled, creation_date, settle_date, state, expiry, add_index, settle_index)
+            VALUES %s
+            ON CONFLICT (add_index) DO UPDATE SET
+                settled = EXCLUDED.settled,
+                settle_date = EXCLUDED.settle_date,
+                state = EXCLUDED.state,
+                settle_index = EXCLUDED.settle_index
+            WHERE invoices.state IS DISTINCT FROM EXCLUDED.state
+                OR invoices.settle_index IS DISTINCT FROM EXCLUDED.settle_index
+            RETURNING 1;
         """
-        values = (
-            datetime.fromtimestamp(int(content["timestamp"])),
-            content["chan_id_in"],
-            content["chan_id_out"],
-            content["amt_in"],
-            content["amt_out"],
-            content["fee"],
-            content["fee_msat"],
-            content["amt_in_msat"],
-            content["amt_out_msat"],
-        )
-        logger.info("Writting TX...")
-        logger.debug("Routing TX values: {}".format(str(values)))
-        self.cursor.execute(query, values)
-        self.conn.commit()
-
-    def write_invoices(self, invoices: list, logger) -> None:
-        logger.info("Start writing invoices to DB.")
+        rows = list()
+        settle_index = 0
         for invoice in invoices:
-            query = """
-                INSERT INTO public.invoices (memo, value, value_milisats, settled, creation_date, settle_date, state, expiry)
-                VALUES(%s, %s, %s, %s, %s, %s, %s, %s);
-            """
-            values = (
-                invoice["memo"],
-                int(invoice["value"]),
-                int(invoice["value_msat"]),
-                invoice["settled"],
-                datetime.fromtimestamp(int(invoice["creation_date"])),
-                datetime.fromtimestamp(int(invoice["settle_date"])),
-                invoice["state"],
-                int(invoice["expiry"]),
+            invoice_settle_index = int(invoice.get("settle_index", 0))
+            settle_index = max(settle_index, invoice_settle_index)
+            rows.append(
+                (
+                    invoice["memo"],
+                    int(invoice["value"]),
+                    int(invoice["value_msat"]),
+                    invoice["settled"],
+                    datetime.fromtimestamp(int(invoice["creation_date"])),
+                    datetime.fromtimestamp(int(invoice["settle_date"])),
+                    invoice["state"],
+                    int(invoice["expiry"]),
+                    int(invoice["add_index"]),
+                    invoice_settle_index if invoice_settle_index > 0 else None,
+                )
             )
-            self.cursor.execute(query, values)
-            self.conn.commit()
+        changed = self.__bulk_insert(query, rows, returning=True)
+        self.__stage_sync_cursor(cursor)
+        if settle_index > 0:
+            self.__stage_sync_cursor((self.SYNC_INVOICES_SETTLE, settle_index), keep_max=True)
+        self.conn.commit()
+        self.__log_throughput(logger, "invoices", changed, start)
+        return changed
 
     def write_log(self, level: str, message: str,host_name:str) -> bool:
-        try:
-            query = """INSERT INTO public.logs 
-                            (log_type, log_timestamp, message,host_name) 
-                        VALUES
-                            ((SELECT id FROM log_type WHERE type=%s), now(),%s,%s);"""
-            values = (level, message,host_name)
-            self.cursor.execute(query, values)
-            self.conn.commit()
-            return True
-        except Exception as e:
-            print(str(e))
-            return False
+        return self.write_logs([(level, datetime.now(), message, host_name)])
 
-    def delete_all_invoices_that_are_open(self, logger) -> None:
-        if not self.__is_invoices_empty_table(logger):
-            logger.info("Empty table.. returning 0")
-            return 0
-        query = """
-                SELECT min(id) FROM invoices WHERE state = 'OPEN';
-                """
-        alter_offset_min = self.__get_offset_index_by_query(query)
-        if alter_offset_min is None:
-            logger.info("Returning max(id) from invoices.")
-            query = "SELECT max(id) FROM invoices;"
-            offset = self.__get_offset_index_by_query(query)
-            logger.debug("Offset: {}".format(str(offset)))
-            return offset
-        else:
-            query = """
-                    DELETE FROM invoices where id>=%s;
-                    ALTER SEQUENCE invoices_id_seq RESTART WITH  %s;"""
-            values = (alter_offset_min, int(alter_offset_min))
-            logger.info("Deleting from invoices...")
-            logger.info("Restarting sequence to {}...".format(str(alter_offset_min)))
-            self.cursor.execute(query, values)
-            self.conn.commit()
-            return alter_offset_min
+    def write_logs(self, rows: list) -> bool:
+        # rows: (level, timestamp, message, host_name)
+        # logs are flushed from a background thread, every flush checks out its
+        # own connection so it never commits a half written data batch; a batch
+        # that hit a dead connection is sent once more on a checked one
+        for attempt in range(2):
+            conn = None
+            broken = False
+            try:
+                conn = self.pool.getconn(
+                    timeout=self.LOG_CONNECT_TIMEOUT, verify=attempt > 0
+                )
+                query = """INSERT INTO public.logs 
+                                (log_type, log_timestamp, message,host_name) 
+                            VALUES %s;"""
+                with conn.cursor() as cursor:
+                    execute_values(
+                        cursor,
+                        query,
+                        rows,
+                        template="((SELECT id FROM log_type WHERE type=%s), %s, %s, %s)",
+                        page_size=self.BULK_PAGE_SIZE,
+                    )
+                conn.commit()
+                return True
+            except Exception as e:
+                if attempt == 0 and conn is not None and conn.closed != 0:
+                    continue
+                # the logger calls this, errors of it can not be logged to the db
+                sys.stderr.write("Can not write logs to db: {}\n".format(str(e)))
+                if conn is not None and conn.closed == 0:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        broken = True
+                return False
+            finally:
+                if conn is not None:
+                    self.pool.putconn(conn, broken=broken)
+        return False
 
-    def __get_offset_index_by_query(self, query: str) -> int:
-        self.cursor.execute(query, None)
+    def get_invoice_add_index(self, logger) -> int:
+        cursor = self.get_sync_cursor(self.SYNC_INVOICES_ADD)
+        if cursor is not None:
+            self.__end_read()
+            return cursor
+        # rows stored before add_index was tracked can not be matched to lnd
+        # invoices reliably, they are replaced by one full resync
+        logger.info("No invoice cursor, resyncing all invoices from node.")
+        self.cursor.execute("DELETE FROM invoices WHERE add_index IS NULL;")
         self.conn.commit()
-        offset = self.cursor.fetchone()[0]
-        return offset
+        return 0
 
-    def __is_invoices_empty_table(self, logger) -> bool:
+    def get_invoice_settle_index(self) -> int:
+        cursor = self.get_sync_cursor(self.SYNC_INVOICES_SETTLE)
+        if cursor is None:
+            query = """
+                    SELECT max(settle_index) FROM invoices;
+                    """
+            cursor = self.__parse_res_value(self.__request_query_fetch_one(query, None))
+        self.__end_read()
+        return cursor
+
+    def get_oldest_open_invoice_add_index(self) -> int:
         query = """
-                SELECT count(*) FROM invoices;
+                SELECT min(add_index) FROM invoices WHERE state IN ('OPEN', 'ACCEPTED');
                 """
-        self.cursor.execute(query, None)
-        self.conn.commit()
-        num_records = self.cursor.fetchone()[0]
-        logger.debug("Is invoices empty: {}".format(str(num_records)))
-        return num_records > 0
+        self.cursor.execute(query)
+        res = self.cursor.fetchone()[0]
+        self.__end_read()
+        return int(res) if res is not None else None
 
     def get_youngest_unixtimestamp_routing_tx(self) -> int:
         query = """
@@ -206,40 +614,137 @@ class DB:
             res = self.cursor.fetchone()[0]
         except:
             return 0
+        finally:
+            self.__end_read()
         if res is None:
             return int(0)
         else:
             return int(res.timestamp())
 
-    def write_payments_to_db(self, payment_list: list) -> None:
+    def write_payments_to_db(self, payment_list: list, logger, cursor: tuple = None) -> None:
+        start = time.time()
+        query = """
+        INSERT INTO payments 
+        (value, value_milisat, creation_date, fee, fee_milisat, status, index_offset) 
+        VALUES %s;
+        """
+        rows = list()
         for payment in payment_list:
-            query = """
-            INSERT INTO payments 
-            (value, value_milisat, creation_date, fee, fee_milisat, status, index_offset) 
-            VALUES(%s, %s, %s, %s, %s, %s, %s);
-            """
-            values = (
-                int(payment["value_sat"]),
-                int(payment["value_msat"]),
-                datetime.fromtimestamp(int(payment["creation_date"])),
-                int(payment["fee_sat"]),
-                int(payment["value_msat"]),
-                payment["status"],
-                int(payment["payment_index"]),
+            rows.append(
+                (
+                    int(payment["value_sat"]),
+                    int(payment["value_msat"]),
+                    datetime.fromtimestamp(int(payment["creation_date"])),
+                    int(payment["fee_sat"]),
+                    int(payment["fee_msat"]),
+                    payment["status"],
+                    int(payment["payment_index"]),
+                )
             )
-            self.cursor.execute(query, values)
+        self.__bulk_insert(query, rows)
+        self.__stage_sync_cursor(cursor)
         self.conn.commit()
+        self.__log_throughput(logger, "payments", len(rows), start)
 
-    def write_channel_backup(self, data: dict, logger) -> None:
+    @staticmethod
+    def channel_backup_hash(data: dict) -> tuple:
+        # the encrypted blobs get a new nonce on every call, only the set of
+        # channels tells whether the backup changed; returns (hash, channels)
+        chan_points = (data.get("multi_chan_backup") or dict()).get("chan_points")
+        if chan_points is None:
+            chan_points = [
+                item.get("chan_point")
+                for item in (data.get("single_chan_backups") or dict()).get("chan_backups", list())
+            ]
+        keys = sorted(json.dumps(chan_point, sort_keys=True) for chan_point in chan_points)
+        return hashlib.sha256(json.dumps(keys).encode()).hexdigest(), len(keys)
+
+    def write_channel_backup(self, data: dict, logger) -> bool:
+        # returns True when a new version of the backup was stored
+        if data is None:
+            logger.warning("No channel backup to write.")
+            return False
         logger.info("Writting channel backup to DB...")
+        blob_hash, channels = self.channel_backup_hash(data)
+        self.cursor.execute(
+            "SELECT 1 FROM public.channel_backup_blob WHERE hash = %s;", (blob_hash,)
+        )
+        stored = self.cursor.fetchone() is None
+        if stored:
+            blob = zlib.compress(json.dumps(data).encode(), 9)
+            query = """
+                    INSERT INTO public.channel_backup_blob (hash, created, channels, size_bytes, "data")
+                    VALUES(%s, NOW(), %s, %s, %s)
+                    ON CONFLICT (hash) DO NOTHING;"""
+            self.cursor.execute(query, (blob_hash, channels, len(blob), psycopg2.Binary(blob)))
+            logger.info(
+                "New channel backup {} with {} channels, {} bytes compressed.",
+                blob_hash[:12],
+                channels,
+                len(blob),
+            )
         query = """
-                INSERT INTO public.channel_backup (date_creation, "data") 
+                INSERT INTO public.channel_backup (date_creation, blob_hash) 
                 VALUES(NOW(), %s);"""
-        values = (json.dumps(data),)
-        self.cursor.execute(query, values)
+        self.cursor.execute(query, (blob_hash,))
         self.conn.commit()
+        return stored
+
+    def get_channel_backup(self, at: datetime = None, blob_hash: str = None) -> dict:
+        # newest backup written up to at, or the version with blob_hash;
+        # returns dict with date, hash and data or None
+        if blob_hash is not None:
+            condition, values = "channel_backup.blob_hash LIKE %s", (blob_hash + "%",)
+        else:
+            condition, values = "channel_backup.date_creation <= %s", (at or datetime.now(),)
+        query = """
+                SELECT channel_backup.date_creation, channel_backup.blob_hash,
+                    channel_backup."data", channel_backup_blob."data"
+                FROM public.channel_backup
+                LEFT JOIN public.channel_backup_blob ON channel_backup_blob.hash = channel_backup.blob_hash
+                WHERE {}
+                ORDER BY channel_backup.date_creation DESC
+                LIMIT 1;
+                """.format(condition)
+        self.cursor.execute(query, values)
+        res = self.cursor.fetchone()
+        if res is None:
+            return None
+        date_creation, blob_hash, legacy, blob = res
+        if blob is not None:
+            data = json.loads(zlib.decompress(blob))
+        else:
+            data = legacy
+        return {"date": date_creation, "hash": blob_hash, "data": data}
+
+    def get_channel_backup_versions(self) -> list:
+        # stored versions with the first and last run that pointed to them
+        query = """
+                SELECT channel_backup_blob.hash, channel_backup_blob.channels, channel_backup_blob.size_bytes,
+                    min(channel_backup.date_creation), max(channel_backup.date_creation), count(channel_backup.id)
+                FROM public.channel_backup_blob
+                LEFT JOIN public.channel_backup ON channel_backup.blob_hash = channel_backup_blob.hash
+                GROUP BY channel_backup_blob.hash
+                ORDER BY min(channel_backup.date_creation) DESC;
+                """
+        self.cursor.execute(query)
+        return [
+            {
+                "hash": item[0],
+                "channels": item[1],
+                "size_bytes": item[2],
+                "first_seen": item[3],
+                "last_seen": item[4],
+                "runs": item[5],
+            }
+            for item in self.cursor.fetchall()
+        ]
 
     def get_last_index_offset(self) -> int:
+        cursor = self.get_sync_cursor(self.SYNC_PAYMENTS)
+        if cursor is not None:
+            self.__end_read()
+            return cursor
         query = """
                 SELECT max(index_offset) from payments;
                 """
@@ -248,14 +753,60 @@ class DB:
             return index
         except:
             return 0
+        finally:
+            self.__end_read()
+
+    def get_forwarding_offset(self) -> int:
+        # None when forwards were stored before sync_state existed, their count
+        # is no lnd offset as the old collector skipped forwards sharing a second
+        cursor = self.get_sync_cursor(self.SYNC_FORWARDING)
+        if cursor is None:
+            self.cursor.execute("SELECT EXISTS (SELECT 1 FROM routing);")
+            cursor = None if self.cursor.fetchone()[0] else 0
+        self.__end_read()
+        return cursor
+
+    def get_sync_cursor(self, stream: str) -> int:
+        query = """
+                SELECT cursor_value FROM sync_state WHERE stream = %s;
+                """
+        self.cursor.execute(query, (stream,))
+        res = self.cursor.fetchone()
+        if res is None:
+            return None
+        return int(res[0])
+
+    def __end_read(self) -> None:
+        # collectors read their cursor and then page lnd for a while, the
+        # connection must not stay idle in transaction meanwhile
+        self.conn.commit()
+
+    def set_sync_cursor(self, stream: str, value: int) -> None:
+        self.__stage_sync_cursor((stream, value))
+        self.conn.commit()
+
+    def __stage_sync_cursor(self, cursor: tuple, keep_max: bool = False) -> None:
+        # cursor is (stream, value), committed together with the data batch
+        if cursor is None:
+            return
+        value = "EXCLUDED.cursor_value"
+        if keep_max:
+            value = "GREATEST(sync_state.cursor_value, EXCLUDED.cursor_value)"
+        query = """
+                INSERT INTO sync_state (stream, cursor_value, updated) VALUES (%s, %s, now())
+                ON CONFLICT (stream) DO UPDATE SET
+                    cursor_value = {},
+                    updated = now();
+                """.format(value)
+        self.cursor.execute(query, cursor)
 
     def get_sum_routing_yesterday(self) -> float:
         yesterday_date, today_date = self.__yesterday_today_tuple()
         query = """
-                SELECT sum(amount_out_sats) FROM routing WHERE
-                    unix_timestamp >= %s 
+                SELECT sum(amount_out_sats) FROM routing_day_total WHERE
+                    day >= %s 
                 and 
-                    unix_timestamp < %s;
+                    day < %s;
                 """
         values = (yesterday_date, today_date)
 
@@ -267,10 +818,10 @@ class DB:
     def get_fee_yesterday_sats(self) -> int:
         yesterday_date, today_date = self.__yesterday_today_tuple()
         query = """
-                SELECT sum(fee_milisats) FROM routing WHERE
-                    unix_timestamp >= %s 
+                SELECT sum(fee_milisats) FROM routing_day_total WHERE
+                    day >= %s 
                 and 
-                    unix_timestamp < %s;
+                    day < %s;
                 """
         values = (yesterday_date, today_date)
         return self.__parse_res_value(
@@ -280,7 +831,7 @@ class DB:
 
     def get_sum_routing_all(self) -> float:
         query = """
-                SELECT sum(amount_out_sats) FROM routing;
+                SELECT sum(amount_out_sats) FROM routing_day_total;
                 """
         return float(
             self.__parse_res_value_float(
@@ -291,7 +842,7 @@ class DB:
 
     def get_fee_routing_all_sats(self) -> str:
         query = """
-                SELECT sum(fee_milisats) FROM routing; 
+                SELECT sum(fee_milisats) FROM routing_day_total;
                 """
         return self.__parse_res_value(
             self.__request_query_fetch_one(query, None, disable_none_return=True)
@@ -300,7 +851,7 @@ class DB:
 
     def get_tx_routing_count_all(self) -> int:
         query = """
-                SELECT count(id) from routing;
+                SELECT sum(tx_count) FROM routing_day_total;
                 """
         return self.__parse_res_value(
             self.__request_query_fetch_one(query, None, disable_none_return=True)
@@ -308,10 +859,10 @@ class DB:
 
     def get_tx_routing_count_yesterday(self) -> int:
         query = """
-                SELECT count(id) FROM routing WHERE
-                 unix_timestamp >= %s 
+                SELECT sum(tx_count) FROM routing_day_total WHERE
+                 day >= %s 
                 and 
-                 unix_timestamp < %s;
+                 day < %s;
                 """
         yesterday_date, today_date = self.__yesterday_today_tuple()
         values = (yesterday_date, today_date)
@@ -319,6 +870,68 @@ class DB:
             self.__request_query_fetch_one(query, values, disable_none_return=True)
         )
 
+    def get_report_snapshot(self, today: date, windows: tuple, events_limit: int) -> Report_snapshot:
+        # everything the report needs in one round-trip
+        columns = list()
+        values = list()
+        for name in windows:
+            bounds = Report_snapshot.window_bounds(name, today)
+            condition = ""
+            if bounds is not None:
+                condition = " FILTER (WHERE day >= %s AND day < %s)"
+                values.extend(bounds * 3)
+            for column in ("tx_count", "amount_out_sats", "fee_milisats"):
+                columns.append("COALESCE(sum({}){}, 0)".format(column, condition))
+        yesterday, today = Report_snapshot.window_bounds(Report_snapshot.YESTERDAY, today)
+        values.extend((yesterday, today, yesterday, today, events_limit))
+        query = """
+                WITH rollup AS (
+                    SELECT {} FROM routing_day_total
+                ),
+                last_balance AS (
+                    SELECT to_char(unix_timestamp, 'YYYY-MM-DD HH24:MI:SS') AS date,
+                        inbound_sats, outbound_sats, onchain, pending_open_balance
+                    FROM public.balance
+                    ORDER BY unix_timestamp DESC
+                    LIMIT 1
+                ),
+                events AS (
+                    SELECT
+                        (SELECT count(*) FROM routing
+                         WHERE unix_timestamp >= %s AND unix_timestamp < %s) AS events_count,
+                        (SELECT json_agg(e ORDER BY e.unix_timestamp) FROM (
+                            SELECT unix_timestamp, to_char(unix_timestamp, 'YYYY-MM-DD HH24:MI:SS') AS date,
+                                alias_in, alias_out, amount_out_sats AS amount, fee_milisats AS fee_msats
+                            FROM routing_completed
+                            WHERE unix_timestamp >= %s AND unix_timestamp < %s
+                            ORDER BY unix_timestamp
+                            LIMIT %s
+                        ) e) AS events_list
+                )
+                SELECT rollup.*, last_balance.*, events.events_count, events.events_list
+                FROM rollup
+                CROSS JOIN events
+                LEFT JOIN last_balance ON true;
+                """.format(", ".join(columns))
+        self.cursor.execute(query, values)
+        res = self.cursor.fetchone()
+        window_results = dict()
+        for i, name in enumerate(windows):
+            tx_count, amount, fee = res[i * 3 : i * 3 + 3]
+            window_results[name] = Report_window(name, int(tx_count), int(amount), int(fee))
+        balance_row = res[len(windows) * 3 : len(windows) * 3 + 5]
+        balance = None
+        if balance_row[0] is not None:
+            balance = {
+                "date": balance_row[0],
+                "inbound": balance_row[1],
+                "outbound": balance_row[2],
+                "onchain": balance_row[3],
+                "pending": balance_row[4],
+            }
+        events_count, events_list = res[-2], res[-1]
+        return Report_snapshot(window_results, balance, events_list or list(), int(events_count))
+
     def get_routing_events_yesterday(self) -> list:
         yesterday_date, today_date = self.__yesterday_today_tuple()
         values = (yesterday_date, today_date)
@@ -372,23 +985,64 @@ class DB:
         }
 
     def write_failed_htlc(self,failed_dict:dict)->None:
+        self.write_failed_htlcs([failed_dict])
+
+    def write_failed_htlcs(self, failed_list: list) -> int:
+        count = self.__insert_failed_htlcs(failed_list)
+        self.conn.commit()
+        return count
+
+    def __insert_failed_htlcs(self, failed_list: list) -> int:
         query = """
                 INSERT INTO public.failed_htlc (incoming_channel_id, outgoing_channel_id, event_type, wire_failure, failure_detail, incoming_amount_msats, outgoing_amount_msats, unix_timestamp) 
-                VALUES(%s,%s, %s, %s, %s, %s, %s, %s);
+                VALUES %s;
                 """
-        values = (
-            failed_dict["chan_in"],
-            failed_dict["chan_out"],
-            failed_dict["event_type"],
-            failed_dict["wire_failure"],
-            failed_dict["failure_detail"],
-            failed_dict["incoming_amount_msats"],
-            failed_dict["outgoing_amount_msats"],
-            failed_dict["time"]
-        )
-        self.cursor.execute(query,values)
+        rows = list()
+        for failed_dict in failed_list:
+            rows.append(
+                (
+                    failed_dict["chan_in"],
+                    failed_dict["chan_out"],
+                    failed_dict["event_type"],
+                    failed_dict["wire_failure"],
+                    failed_dict["failure_detail"],
+                    failed_dict["incoming_amount_msats"],
+                    failed_dict["outgoing_amount_msats"],
+                    failed_dict["time"],
+                )
+            )
+        return self.__bulk_insert(query, rows)
+
+    def write_collector_run(self, row: tuple) -> None:
+        query = """
+                INSERT INTO public.collector_runs (run_started, collector, started, finished, duration_ms, rows_fetched, rows_written, rest_calls, status, error_class)
+                VALUES(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+                """
+        self.cursor.execute(query, row)
         self.conn.commit()
-        
+
+    def write_htlc_events(self, rows: list) -> int:
+        count = self.__insert_htlc_events(rows)
+        self.conn.commit()
+        return count
+
+    def write_htlc_batch(self, rows: list, failed_list: list, channels: dict) -> int:
+        # channels (channel_id -> (public_key, alias)), htlc_events rows and
+        # failed htlcs of one batch are committed together or not at all;
+        # returns the number of htlc_events rows
+        self.__upsert_channels(channels)
+        count = self.__insert_htlc_events(rows)
+        self.__insert_failed_htlcs(failed_list)
+        self.conn.commit()
+        return count
+
+    def __insert_htlc_events(self, rows: list) -> int:
+        query = """
+                INSERT INTO public.htlc_events (timestamp_ns, event_kind, event_type, incoming_channel_id, outgoing_channel_id, incoming_htlc_id, outgoing_htlc_id, incoming_amt_msat, outgoing_amt_msat, wire_failure, failure_detail, settled)
+                VALUES %s;
+                """
+        return self.__bulk_insert(query, rows)
+
     def __parse_res_value(self, data: object) -> int:
         if data is None:
             return int(0)
@@ -404,8 +1058,6 @@ class DB:
     def __yesterday_today_tuple(self) -> tuple:
         today_date = date.today().strftime("%Y-%m-%d")
         yesterday_date = (date.today() - timedelta(days=1)).strftime("%Y-%m-%d")
-        print("Today: " + str(today_date))
-        print("Yesterday:" + str(yesterday_date))
         return yesterday_date, today_date
 
     def __request_query_fetch_one(
@@ -0,0 +1,86 @@
+import sys
+import threading
+import time
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+
+
+class Db_pool:
+    MIN_BACKOFF = 1
+    MAX_BACKOFF = 30
+    # connections idle longer than this are checked with SELECT 1 before use
+    HEALTH_CHECK_AFTER = 30
+
+    def __init__(self, min_size: int = 1, max_size: int = 10, **connect_params) -> None:
+        # connect_params go to psycopg2.connect, e.g. database, user, cursor_factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.connect_params = connect_params
+        self.pool = None
+        self.lock = threading.Lock()
+        # id(conn) -> unix time when it was returned to the pool
+        self.returned = dict()
+        self.reconnects = 0
+
+    def __get_pool(self) -> ThreadedConnectionPool:
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadedConnectionPool(
+                    self.min_size, self.max_size, **self.connect_params
+                )
+            return self.pool
+
+    def getconn(self, timeout: float = None, verify: bool = False):
+        # waits with backoff until postgres is reachable and a connection is free,
+        # timeout None waits forever; verify checks also recently used connections,
+        # after one of them died the others are likely dead as well
+        start = time.time()
+        backoff = self.MIN_BACKOFF
+        while True:
+            try:
+                conn = self.__get_pool().getconn()
+                returned = self.returned.pop(id(conn), None)
+                recent = returned is not None and time.time() - returned < self.HEALTH_CHECK_AFTER
+                if (not verify and (returned is None or recent)) or self.is_alive(conn):
+                    return conn
+                self.putconn(conn, broken=True)
+                continue
+            except (psycopg2.OperationalError, PoolError) as e:
+                if timeout is not None and time.time() - start + backoff > timeout:
+                    raise
+                # logger writes to the db itself, so this goes to stderr
+                sys.stderr.write(
+                    "Can not get db connection ({}), retrying in {}s...\n".format(
+                        str(e).strip(), backoff
+                    )
+                )
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self.MAX_BACKOFF)
+
+    def putconn(self, conn, broken: bool = False) -> None:
+        broken = broken or conn.closed != 0
+        if broken:
+            self.reconnects += 1
+            self.returned.pop(id(conn), None)
+        else:
+            self.returned[id(conn)] = time.time()
+        try:
+            self.__get_pool().putconn(conn, close=broken)
+        except PoolError:
+            pass
+
+    def is_alive(self, conn) -> bool:
+        if conn.closed != 0:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def close(self) -> None:
+        with self.lock:
+            if self.pool is not None and not self.pool.closed:
+                self.pool.closeall()
@@ -0,0 +1,96 @@
+import time
+from array import array
+from logger import Logger
+from lnd_transport import LND_transport
+
+
+class Graph_index:
+    REFRESH_AFTER = 60 * 60
+
+    def __init__(self, transport: LND_transport, logger: Logger) -> None:
+        self.transport = transport
+        self.logger = logger
+        self.loaded_at = None
+        self.__clear()
+
+    def __clear(self) -> None:
+        # only our own channels and their peers are kept, the rest of the graph
+        # (~15k nodes, ~70k edges on mainnet) is dropped right after parsing.
+        # pubkeys are stored once as 33 raw bytes and referenced by position.
+        self.pub_keys = list()
+        self.pub_key_ids = dict()
+        self.aliases = list()
+        self.channel_rows = dict()
+        self.peers = array("l")
+        self.capacities = array("q")
+
+    def is_stale(self) -> bool:
+        return (
+            self.loaded_at is None
+            or time.time() - self.loaded_at > self.REFRESH_AFTER
+        )
+
+    def load(self, own_pub_key: str) -> None:
+        self.logger.info("Loading graph snapshot from node...")
+        start = time.time()
+        self.__clear()
+        response = self.transport.get("/v1/channels")
+        for channel in response.json().get("channels", []):
+            self.__add_channel(
+                channel["chan_id"], channel["remote_pubkey"], channel["capacity"]
+            )
+        response = self.transport.get("/v1/channels/closed")
+        for channel in response.json().get("channels", []):
+            self.__add_channel(
+                channel["chan_id"], channel["remote_pubkey"], channel["capacity"]
+            )
+        response = self.transport.get(
+            "/v1/graph", params={"include_unannounced": "true"}
+        )
+        graph = response.json()
+        del response
+        for edge in graph.get("edges", []):
+            if edge["node1_pub"] == own_pub_key:
+                self.__add_channel(edge["channel_id"], edge["node2_pub"], edge["capacity"])
+            elif edge["node2_pub"] == own_pub_key:
+                self.__add_channel(edge["channel_id"], edge["node1_pub"], edge["capacity"])
+        for node in graph.get("nodes", []):
+            idx = self.pub_key_ids.get(bytes.fromhex(node["pub_key"]))
+            if idx is not None:
+                self.aliases[idx] = node.get("alias")
+        del graph
+        self.loaded_at = time.time()
+        self.logger.info(
+            "Graph snapshot loaded: {} channels, {} peers in {:.2f}s.".format(
+                len(self.channel_rows), len(self.pub_keys), self.loaded_at - start
+            )
+        )
+
+    def __add_channel(self, chan_id: str, pub_key: str, capacity) -> None:
+        chan_id = int(chan_id)
+        if chan_id in self.channel_rows or not pub_key:
+            return
+        self.channel_rows[chan_id] = len(self.peers)
+        self.peers.append(self.__pub_key_id(pub_key))
+        self.capacities.append(int(capacity or 0))
+
+    def __pub_key_id(self, pub_key: str) -> int:
+        raw = bytes.fromhex(pub_key)
+        idx = self.pub_key_ids.get(raw)
+        if idx is None:
+            idx = len(self.pub_keys)
+            self.pub_key_ids[raw] = idx
+            self.pub_keys.append(raw)
+            self.aliases.append(None)
+        return idx
+
+    def lookup(self, chan_id) -> tuple:
+        row = self.channel_rows.get(int(chan_id))
+        if row is None:
+            return None
+        peer = self.peers[row]
+        return (
+            self.aliases[peer],
+            str(self.capacities[row]),
+            self.pub_keys[peer].hex(),
+        )
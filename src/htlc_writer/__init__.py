@@ -0,0 +1,163 @@
+import atexit
+import queue
+import threading
+import time
+from db import DB
+from logger import Logger
+from lnd_api import LND_api
+import metrics
+
+HTLC_QUEUE_DEPTH = metrics.gauge("htlc_queue_depth", "HTLC events waiting for the writer.")
+HTLC_DROPPED = metrics.counter("htlc_dropped_total", "HTLC events dropped on full queue.")
+HTLC_WRITTEN = metrics.counter("htlc_events_written_total", "HTLC events written to db.")
+HTLC_FLUSH_SECONDS = metrics.histogram("htlc_flush_seconds", "Duration of HTLC batch writes.")
+
+
+class Htlc_writer:
+    def __init__(
+        self,
+        db: DB,
+        lnd_api: LND_api,
+        logger: Logger,
+        parse_message,
+        queue_size: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 2.0,
+    ) -> None:
+        # parse_message(raw message) returns (htlc_events row, failed htlc dict or None) or None
+        self.db = db
+        self.lnd_api = lnd_api
+        self.logger = logger
+        self.parse_message = parse_message
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.known_channels = set()
+        self.buffer = list()
+        self.events = list()
+        self.dropped = 0
+        self.written = 0
+        self.retrying = False
+        self.stop_event = threading.Event()
+        self.worker = threading.Thread(target=self.__run, name="htlc-writer", daemon=True)
+        self.worker.start()
+        HTLC_QUEUE_DEPTH.set_function(self.queue_depth)
+        atexit.register(self.close)
+
+    def submit(self, message: str) -> bool:
+        # called from the socket thread, never blocks
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            HTLC_DROPPED.inc()
+            return False
+
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def __run(self) -> None:
+        last_flush = time.time()
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            try:
+                message = self.queue.get(timeout=self.flush_interval)
+                self.__handle(message)
+            except queue.Empty:
+                pass
+            # after a failed write the kept batch waits a full interval
+            full = len(self.events) >= self.batch_size and not self.retrying
+            if full or (
+                len(self.events) > 0 and time.time() - last_flush >= self.flush_interval
+            ):
+                self.__flush()
+                last_flush = time.time()
+        if len(self.events) > 0:
+            self.__flush()
+        if len(self.events) > 0:
+            # the db is still failing at shutdown
+            self.__drop(len(self.events))
+
+    def __handle(self, message: str) -> None:
+        try:
+            res = self.parse_message(message)
+        except Exception as e:
+            self.logger.error("Can not parse HTLC message: {}", str(e))
+            return
+        if res is None:
+            return
+        event, failed = res
+        self.events.append(event)
+        if failed is not None:
+            self.buffer.append(failed)
+
+    def __flush(self) -> bool:
+        events = self.events
+        batch = self.buffer
+        self.events = list()
+        self.buffer = list()
+        start = time.time()
+        try:
+            # lnd is asked before the batch is written, nothing is half committed
+            channels = self.__resolve_channels(batch)
+            count = self.db.write_htlc_batch(events, batch, channels)
+        except Exception as e:
+            self.db.rollback()
+            self.logger.error(
+                "Can not write {} HTLC events ({} failed), kept for next flush: {}",
+                len(events),
+                len(batch),
+                str(e),
+            )
+            self.__keep(events, batch)
+            self.retrying = True
+            return False
+        self.retrying = False
+        self.known_channels.update(channels)
+        self.written += count
+        HTLC_WRITTEN.inc(amount=count)
+        HTLC_FLUSH_SECONDS.observe(time.time() - start)
+        self.logger.info(
+            "Written {} HTLC events ({} failed), queue depth {}, dropped {}.",
+            len(events),
+            len(batch),
+            self.queue_depth(),
+            self.dropped,
+        )
+        return True
+
+    def __keep(self, events: list, batch: list) -> None:
+        # a failed batch goes back in front of newer events, while the db is
+        # down the kept events are bounded like the queue
+        self.events = events + self.events
+        self.buffer = batch + self.buffer
+        if len(self.events) > self.queue.maxsize:
+            self.__drop(len(self.events))
+
+    def __drop(self, count: int) -> None:
+        self.dropped += count
+        HTLC_DROPPED.inc(amount=count)
+        self.logger.error("Dropped {} unwritten HTLC events.", count)
+        self.events = list()
+        self.buffer = list()
+
+    def __resolve_channels(self, batch: list) -> dict:
+        # channel_id -> (public_key, alias) of channels not written before
+        unknown = set()
+        for failed in batch:
+            for channel_id in (failed["chan_in"], failed["chan_out"]):
+                if channel_id not in self.known_channels:
+                    unknown.add(channel_id)
+        if len(unknown) == 0:
+            return dict()
+        resolved = self.lnd_api.resolve_channels([str(channel_id) for channel_id in unknown])
+        channels = dict()
+        for chan_id, (alias, _, remote_pub_key) in resolved.items():
+            channels[int(chan_id)] = (remote_pub_key, alias)
+        return channels
+
+    def close(self) -> None:
+        if self.stop_event.is_set():
+            return
+        self.stop_event.set()
+        self.worker.join()
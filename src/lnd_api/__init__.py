@@ -1,14 +1,23 @@
-import json, requests
+import json
 from datetime import date, datetime
 from datetime import timedelta
 from logger import Logger
+from lnd_transport import LND_transport
+from graph_index import Graph_index
+from node_info import Node_info
+import contextvars
 import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
 
 
 class LND_api:
     NUM_MAX_INVOICES = 100
-    NUM_MAX_EVENTS = 50000
+    NUM_MAX_EVENTS = 5000  # page size of forwarding history requests
     NUM_MAX_PAYMENTS = 100
+    # the replay of settled invoices is over after this many seconds without one
+    SETTLE_STREAM_IDLE = 2
+    SETTLE_STREAM_MAX = 60
 
     def __init__(
         self,
@@ -17,6 +26,12 @@ class LND_api:
         cert_path: str,
         validate_cert: bool,
         logger: Logger,
+        pool_size: int = 10,
+        retries: int = 3,
+        alias_cache=None,
+        graph_snapshot: bool = False,
+        alias_concurrency: int = 4,
+        node_info_ttl: int = Node_info.DEFAULT_TTL,
     ) -> None:
         self.base_url = base_url
         self.macaroon = macaroon
@@ -24,39 +39,32 @@ class LND_api:
         self.validate_cert = validate_cert
         self.headers = headers = {"Grpc-Metadata-macaroon": self.macaroon}
         self.logger = logger
+        self.alias_cache = alias_cache
+        self.alias_concurrency = max(int(alias_concurrency), 1)
         if validate_cert == False:
             self.cert_path = False
-        self.__get_basic_info()
-
-    def __get_basic_info(self) -> None:
-        urlInfo = self.base_url + "/v1/getinfo"
-        self.logger.info("Sending basic info.")
-        try:
-            r = requests.get(urlInfo, headers=self.headers, verify=self.cert_path)
-            content = r.json()
-        except Exception as e:
-            self.logger.error("Error when sending basic info: {}".format(str(e)))
-        self.alias = self.__parse_alias(content)
-        self.color = content["color"]
-        self.pub_key = content["identity_pubkey"]
-        self.height = content["block_height"]
-        self.num_active_channels = None
-        self.num_inactive_channels = None
-        self.__get_channels_status_count()
-        self.logger.info("Basic info parsed.")
-        self.logger.debug(
-            "Alias: {}, Color: {}, Pubkey: {}, Block_height: {}".format(
-                self.alias, self.color, self.pub_key, self.height
-            )
+        self.transport = LND_transport(
+            self.base_url,
+            self.macaroon,
+            self.cert_path,
+            self.logger,
+            pool_size=pool_size,
+            retries=retries,
         )
+        self.graph_index = None
+        if graph_snapshot:
+            self.graph_index = Graph_index(self.transport, self.logger)
+        # getinfo and channel list are requested only when read
+        self.node_info = Node_info(self.transport, self.logger, ttl=node_info_ttl)
+
+    @property
+    def pub_key(self) -> str:
+        return self.node_info.pub_key
+
+    @property
+    def alias(self) -> str:
+        return self.node_info.alias
 
-    def __parse_alias(self,content:dict)->str:
-        result = None
-        try:
-            result = content["alias"]
-        except:
-            result = content["identity_pubkey"]
-        return result
     def __str__(self) -> str:
         return self.alias
 
@@ -74,49 +82,72 @@ class LND_api:
         yesterday_start = date.today() - timedelta(days=1)
         yesterday_start = time.mktime(yesterday_start.timetuple())
         yesterday_stop = yesterday_start + (60 * 60 * 24)
-        data = {
-            "start_time": str(int(yesterday_start)),
-            "end_time": str(int(yesterday_stop)),
-            "num_max_events": self.NUM_MAX_EVENTS,
-        }
-        return self.routing_since_time_as_dict(None, params_data=data)
-
-    def routing_since_time_as_dict(
-        self, start_time_unix: int, params_data=None
-    ) -> dict:
         result_list = list()
-        data = None
+        for events, _ in self.routing_pages(
+            int(yesterday_start), end_time_unix=int(yesterday_stop)
+        ):
+            result_list.extend(events)
+        return result_list
+
+    def routing_since_time_as_dict(self, start_time_unix: int) -> dict:
+        result_list = list()
+        for events, _ in self.routing_pages(start_time_unix + 1):
+            result_list.extend(events)
+        return result_list
+
+    def routing_pages(
+        self, start_time_unix: int, end_time_unix: int = None, index_offset: int = 0
+    ):
+        # yields (events with aliases, last_offset_index) page by page,
+        # so only one page of forwarding history is held in memory
         while True:
-            if params_data is None:
-                data = {
-                    "start_time": str(start_time_unix + 1),
-                    "num_max_events": self.NUM_MAX_EVENTS,
-                }
-            else:
-                data = params_data
-            self.logger.debug("Data in requests: {}".format(json.dumps(data)))
+            data = {
+                "start_time": str(start_time_unix),
+                "index_offset": index_offset,
+                "num_max_events": self.NUM_MAX_EVENTS,
+            }
+            if end_time_unix is not None:
+                data["end_time"] = str(end_time_unix)
+            self.logger.debug("Data in requests: {}", lambda: json.dumps(data))
             self.logger.info("Sending request to node.")
             content = self.__switch(data)
-            self.logger.info("Parsing requests from node.")
+            events = content.get("forwarding_events", [])
+            self.logger.info("Parsing {} forwarding events from node.".format(len(events)))
+            if len(events) == 0:
+                return
+            index_offset = int(content["last_offset_index"])
+            events = self.__generate_aliases_for_channels(events)
             self.logger.debug(
-                "Parsing request from node: {}".format(json.dumps(content))
+                "Parsing request from node with aliases: {}", lambda: json.dumps(events)
             )
-            result_list = result_list + content["forwarding_events"]
-            if len(content["forwarding_events"]) < self.NUM_MAX_INVOICES:
-                break
-            else:
-                start_time_unix = int(content["forwarding_events"][-1]["timestamp"])
-        result_list = self.__generate_aliases_for_channels(result_list)
-        self.logger.debug(
-            "Parsing request from node with aliases: {}".format(json.dumps(result_list))
-        )
-        return result_list
+            yield events, index_offset
+            if len(events) < self.NUM_MAX_EVENTS:
+                return
+
+    def forwarding_offset_after(self, unix_timestamp: int) -> int:
+        # index_offset of the first forward after unix_timestamp in the whole
+        # history, counted page by page without resolving aliases
+        self.logger.info("Counting forwards up to {} on node...".format(unix_timestamp))
+        index_offset = 0
+        while True:
+            content = self.__switch(
+                {
+                    "start_time": "0",
+                    "index_offset": index_offset,
+                    "num_max_events": self.NUM_MAX_EVENTS,
+                }
+            )
+            events = content.get("forwarding_events", [])
+            for event in events:
+                if int(event["timestamp"]) > unix_timestamp:
+                    return index_offset
+                index_offset += 1
+            if len(events) < self.NUM_MAX_EVENTS:
+                return index_offset
 
     def routing_yesterday(self) -> tuple:
         response = self.routing_yesterday_get_all_as_dict()
-        return self.__generate_aliases_for_channels(
-            response
-        ), self.__get_sum_from_response(response)
+        return response, self.__get_sum_from_response(response)
 
     def __get_sum_from_response(self, data_list: list) -> tuple:
         if len(data_list) == 0:
@@ -135,35 +166,27 @@ class LND_api:
         return result
 
     def __switch(self, data: dict) -> dict:
-        urlTX = self.base_url + "/v1/switch"
-        r = requests.post(
-            urlTX, headers=self.headers, verify=self.cert_path, data=json.dumps(data)
-        )
+        r = self.transport.post("/v1/switch", data=json.dumps(data))
         return r.json()
 
     def __generate_aliases_for_channels(self, responses: list) -> dict:
-        hash_mapa = {}
+        chan_ids = set()
+        for response in responses:
+            chan_ids.add(response["chan_id_in"])
+            chan_ids.add(response["chan_id_out"])
+        resolved = self.resolve_channels(chan_ids)
         result_list = list()
         for response in responses:
-            if response["chan_id_in"] in hash_mapa.keys():
-                chan_alias_in = hash_mapa[response["chan_id_in"]]
-            else:
-                (
-                    chan_alias_in,
-                    channel_capacity,
-                    public_key_in,
-                ) = self.get_nodes_in_channel(response["chan_id_in"])
-                hash_mapa[response["chan_id_in"]] = chan_alias_in
-
-            if response["chan_id_out"] in hash_mapa.keys():
-                chan_alias_out = hash_mapa[response["chan_id_out"]]
-            else:
-                (
-                    chan_alias_out,
-                    channel_capacity,
-                    public_key_out,
-                ) = self.get_nodes_in_channel(response["chan_id_out"])
-                hash_mapa[response["chan_id_out"]] = chan_alias_out
+            (
+                chan_alias_in,
+                channel_capacity,
+                public_key_in,
+            ) = resolved[response["chan_id_in"]]
+            (
+                chan_alias_out,
+                channel_capacity,
+                public_key_out,
+            ) = resolved[response["chan_id_out"]]
             response["chan_in_alias"] = chan_alias_in
             response["chan_out_alias"] = chan_alias_out
             response["channel_capacity"] = channel_capacity
@@ -172,9 +195,56 @@ class LND_api:
             result_list.append(response)
         return result_list
 
+    def resolve_channel(self, chan_id: str) -> tuple:
+        return self.resolve_channels([chan_id])[chan_id]
+
+    def resolve_channels(self, chan_ids) -> dict:
+        result = dict()
+        missing = list()
+        for chan_id in set(chan_ids):
+            res = None
+            if self.alias_cache is not None:
+                res = self.alias_cache.get(chan_id)
+            if res is None:
+                missing.append(chan_id)
+            else:
+                result[chan_id] = res
+        if len(missing) == 0:
+            return result
+        fetched = dict()
+        if self.graph_index is not None:
+            if self.graph_index.is_stale():
+                self.graph_index.load(self.pub_key)
+            for chan_id in missing:
+                res = self.graph_index.lookup(chan_id)
+                if res is not None:
+                    fetched[chan_id] = res
+            missing = [chan_id for chan_id in missing if chan_id not in fetched]
+        if len(missing) > 0:
+            self.logger.info(
+                "Resolving {} channels from lnd graph, {} at once.".format(
+                    len(missing), self.alias_concurrency
+                )
+            )
+            # only network calls run in the pool, db writes of the cache stay on this thread;
+            # every task runs in a copy of this context so its calls count for the collector
+            with ThreadPoolExecutor(max_workers=self.alias_concurrency) as executor:
+                futures = [
+                    executor.submit(
+                        contextvars.copy_context().run, self.get_nodes_in_channel, chan_id
+                    )
+                    for chan_id in missing
+                ]
+                for chan_id, future in zip(missing, futures):
+                    fetched[chan_id] = future.result()
+        for chan_id, res in fetched.items():
+            if self.alias_cache is not None:
+                res = self.alias_cache.put(chan_id, res[0], res[1], res[2])
+            result[chan_id] = res
+        return result
+
     def get_nodes_in_channel(self, chan_id: str) -> tuple:
-        url = self.base_url + "/v1/graph/edge/" + chan_id
-        r = requests.get(url, headers=self.headers, verify=self.cert_path)
+        r = self.transport.get("/v1/graph/edge/" + chan_id)
         # print(str(json.dumps(r.json(),indent=3)))
         response = r.json()
         if r.status_code == 200:
@@ -183,8 +253,7 @@ class LND_api:
                 node_to_resolver_allias = response["node2_pub"]
             else:
                 node_to_resolver_allias = response["node1_pub"]
-            url = self.base_url + "/v1/graph/node/" + node_to_resolver_allias
-            r = requests.get(url, headers=self.headers, verify=self.cert_path)
+            r = self.transport.get("/v1/graph/node/" + node_to_resolver_allias)
             response = r.json()
             # print(json.dumps(response,indent=2))
             return (
@@ -196,70 +265,95 @@ class LND_api:
             ## node not found (neznal jsem ale rip nějakému uzlu)
             return None, None, None
 
-    def __get_channels_status_count(self) -> None:
-        url = self.base_url + "/v1/channels"
-        response = requests.get(
-            url,
-            headers=self.headers,
-            verify=self.cert_path,
-        )
-        channel_list = response.json()["channels"]
-
-        self.num_active_channels = 0
-        self.num_inactive_channels = 0
-        for item in channel_list:
-            if item["active"]:
-                self.num_active_channels += 1
-            else:
-                self.num_inactive_channels += 1
+    def log_transport_stats(self) -> None:
+        self.transport.log_stats()
 
     def get_num_active_channels(self) -> int:
-        return self.num_active_channels
+        return self.node_info.num_active_channels
 
     def get_num_passive_channels(self) -> int:
-        return self.num_inactive_channels
+        return self.node_info.num_inactive_channels
 
     def invoices_since_last_offset_as_list(self, start_index_offset: int) -> list:
         sum_list = list()
-        current_offset = start_index_offset
-        loop_to_run = True
+        for content_list, _ in self.invoices_pages(start_index_offset):
+            sum_list.extend(content_list)
+        self.logger.debug("Number of invoices: {}", len(sum_list))
+        return sum_list
+
+    def invoices_pages(self, start_add_index: int):
+        # yields (invoices, last add_index) for invoices added after start_add_index
+        current_offset = start_add_index
         self.logger.info("Preparing to send request for invoices...")
-        while loop_to_run:
+        while True:
             params = {
                 "index_offset": current_offset,
                 "num_max_invoices": self.NUM_MAX_INVOICES,
             }
             self.logger.info("Request for invoices offset: {}".format(current_offset))
-            self.logger.debug("Request for invoices: {}".format(json.dumps(params)))
-
-            content_list = self.__invoices(params)
-            sum_list.extend(content_list)
+            self.logger.debug("Request for invoices: {}", lambda: json.dumps(params))
+            content = self.__invoices(params)
+            content_list = content.get("invoices", [])
             if len(content_list) == 0:
                 self.logger.info("Stopping sending request for invoices...")
-                loop_to_run = False
+                return
+            current_offset = int(content["last_index_offset"])
+            yield content_list, current_offset
+
+    def settled_invoices(self, settle_index: int) -> list:
+        # invoices settled after settle_index; lnd replays them first on the
+        # invoice subscription and then keeps it open for new events, so the
+        # stream is read until it goes quiet. lnd replays nothing for 0.
+        result = list()
+        if settle_index <= 0:
+            return result
+        self.logger.info("Request for invoices settled after: {}".format(settle_index))
+        start = time.time()
+        r = None
+        try:
+            r = self.transport.get_stream(
+                "/v1/invoices/subscribe",
+                params={"settle_index": settle_index},
+                idle_timeout=self.SETTLE_STREAM_IDLE,
+            )
+            for line in r.iter_lines():
+                if line:
+                    invoice = json.loads(line).get("result", dict())
+                    if (
+                        invoice.get("state") == "SETTLED"
+                        and int(invoice.get("settle_index", 0)) > settle_index
+                    ):
+                        result.append(invoice)
+                if time.time() - start > self.SETTLE_STREAM_MAX:
+                    break
+        except requests.exceptions.RequestException as e:
+            if r is None and not isinstance(e, requests.exceptions.ReadTimeout):
+                self.logger.error(
+                    "Error when subscribing to settled invoices: {}".format(str(e))
+                )
             else:
-                current_offset += self.NUM_MAX_INVOICES
-
-        self.logger.debug("Number of invoices: {}".format(str(len(sum_list))))
-        return sum_list
+                # read timeout is the usual end of the replay, before the headers
+                # it means lnd had nothing settled to send
+                self.logger.debug("Invoice subscription ended: {}", str(e))
+        finally:
+            if r is not None:
+                r.close()
+        self.logger.info("Invoices settled since last run: {}".format(len(result)))
+        return result
 
     def __invoices(self, params: dict) -> dict:
         try:
-            urlTX = self.base_url + "/v1/invoices"
-            r = requests.get(
-                urlTX, headers=self.headers, verify=self.cert_path, params=params
-            )
-            return r.json()["invoices"]
+            r = self.transport.get("/v1/invoices", params=params)
+            return r.json()
         except Exception as e:
             self.logger.error(
                 "Error when recieving requests for invoices: {}".format(str(e))
             )
-            return list()
+            return dict()
 
     def channel_backup_as_dict(self) -> dict:
         try:
-            urlCB = self.base_url + "/v1/channels/backup"
-            r = requests.get(urlCB, headers=self.headers, verify=self.cert_path)
+            r = self.transport.get("/v1/channels/backup")
             return r.json()
         except Exception as e:
             self.logger.error("Error when recieving channel backup: {}".format(str(e)))
@@ -270,8 +364,14 @@ class LND_api:
         return self.payments_from_index_offset_as_dict(1)
 
     def payments_from_index_offset_as_dict(self, start_index: int) -> list:
-        index_offset = start_index
         result_list = list()
+        for content, _ in self.payments_pages(start_index):
+            result_list.extend(content)
+        return result_list
+
+    def payments_pages(self, start_index: int):
+        # yields (payments, last payment_index) page by page
+        index_offset = start_index
         while True:
             self.logger.info(
                 "Sending message for payments, max {}".format(
@@ -280,24 +380,20 @@ class LND_api:
             )
             data = {
                 "max_payments": self.NUM_MAX_PAYMENTS,
-                "count_total_payments": True,
                 "index_offset": str(index_offset),
             }
             content = self.__payments(data)
             if len(content) == 0:
-                return result_list
-            index_offset = content[-1]["payment_index"]
-            result_list = result_list + content
+                return
+            index_offset = int(content[-1]["payment_index"])
+            yield content, index_offset
 
     def __payments(self, params: dict) -> list:
         try:
             self.logger.debug(
-                "Sending requests for paymtns with params {}".format(json.dumps(params))
-            )
-            urlTX = self.base_url + "/v1/payments"
-            r = requests.get(
-                urlTX, headers=self.headers, verify=self.cert_path, params=params
+                "Sending requests for paymtns with params {}", lambda: json.dumps(params)
             )
+            r = self.transport.get("/v1/payments", params=params)
             return r.json()["payments"]
         except Exception as e:
             self.logger.error(
@@ -334,8 +430,7 @@ class LND_api:
 
     def __get_ln_balance(self) -> dict:
         try:
-            urlTX = self.base_url + "/v1/balance/channels"
-            r = requests.get(urlTX, headers=self.headers, verify=self.cert_path)
+            r = self.transport.get("/v1/balance/channels")
             return r.json()
         except Exception as e:
             self.logger.error(
@@ -345,8 +440,7 @@ class LND_api:
 
     def __get_onchain_balance(self) -> dict:
         try:
-            urlTX = self.base_url + "/v1/balance/blockchain"
-            r = requests.get(urlTX, headers=self.headers, verify=self.cert_path)
+            r = self.transport.get("/v1/balance/blockchain")
             return r.json()
         except Exception as e:
             self.logger.error(
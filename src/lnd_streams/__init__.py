@@ -0,0 +1,133 @@
+import asyncio
+import ssl
+import time
+import websockets
+from logger import Logger
+import metrics
+
+STREAM_EVENTS = metrics.counter(
+    "stream_events_total", "Messages received from lnd streams.", ("stream",)
+)
+STREAM_RECONNECTS = metrics.counter(
+    "stream_reconnects_total", "Reconnects of lnd streams.", ("stream",)
+)
+STREAM_CONNECTED = metrics.gauge(
+    "stream_connected", "1 while the lnd stream is connected.", ("stream",)
+)
+
+
+class LND_streams:
+    HTLC_EVENTS = "/v2/router/htlcevents"
+    INVOICES = "/v1/invoices/subscribe"
+    CHANNELS = "/v1/channels/subscribe"
+    PEERS = "/v1/peers/subscribe"
+    STREAMS = {
+        "htlcevents": HTLC_EVENTS,
+        "invoices": INVOICES,
+        "channels": CHANNELS,
+        "peers": PEERS,
+    }
+    MIN_BACKOFF = 1
+    MAX_BACKOFF = 60
+    STATS_INTERVAL = 60
+
+    def __init__(
+        self,
+        base_url: str,
+        macaroon: str,
+        cert_path: str,
+        validate_cert: bool,
+        logger: Logger,
+        trace: bool = False,
+    ) -> None:
+        self.base_url = base_url
+        if base_url.startswith("https://"):
+            self.base_url = "wss://" + base_url[len("https://") :]
+        elif base_url.startswith("http://"):
+            self.base_url = "ws://" + base_url[len("http://") :]
+        self.headers = {"Grpc-Metadata-macaroon": macaroon}
+        self.logger = logger
+        self.trace = trace
+        self.handlers = dict()
+        self.stats = dict()
+        self.ssl_context = None
+        if self.base_url.startswith("wss"):
+            if validate_cert:
+                self.ssl_context = ssl.create_default_context(cafile=cert_path)
+            else:
+                self.ssl_context = ssl.create_default_context()
+                self.ssl_context.check_hostname = False
+                self.ssl_context.verify_mode = ssl.CERT_NONE
+
+    def __str__(self) -> str:
+        return self.base_url
+
+    def subscribe(self, path: str, handler) -> None:
+        # handler(raw message) runs on the event loop, it has to be cheap
+        self.handlers[path] = handler
+        self.stats[path] = {"events": 0, "reconnects": 0, "connected": False}
+
+    def run(self) -> None:
+        asyncio.run(self.__run_all())
+
+    async def __run_all(self) -> None:
+        tasks = [
+            self.__run_stream(path, handler) for path, handler in self.handlers.items()
+        ]
+        tasks.append(self.__report_stats())
+        await asyncio.gather(*tasks)
+
+    async def __run_stream(self, path: str, handler) -> None:
+        url = self.base_url + path + "?method=GET"
+        stats = self.stats[path]
+        backoff = self.MIN_BACKOFF
+        while True:
+            try:
+                async with websockets.connect(
+                    url,
+                    extra_headers=self.headers,
+                    ssl=self.ssl_context,
+                    max_size=None,
+                ) as ws:
+                    self.logger.info("Opening connection to {}...", path)
+                    stats["connected"] = True
+                    STREAM_CONNECTED.set(1, path)
+                    backoff = self.MIN_BACKOFF
+                    async for message in ws:
+                        stats["events"] += 1
+                        STREAM_EVENTS.inc(path)
+                        if self.trace:
+                            self.logger.debug("{}: {}", path, message)
+                        try:
+                            handler(message)
+                        except Exception as e:
+                            self.logger.error("Handler of {} failed: {}", path, str(e))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error("Stream {} failed: {}", path, str(e))
+            stats["connected"] = False
+            stats["reconnects"] += 1
+            STREAM_CONNECTED.set(0, path)
+            STREAM_RECONNECTS.inc(path)
+            self.logger.info("Reconnecting to {} in {}s...", path, backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.MAX_BACKOFF)
+
+    async def __report_stats(self) -> None:
+        last_events = {path: 0 for path in self.stats.keys()}
+        last_time = time.time()
+        while True:
+            await asyncio.sleep(self.STATS_INTERVAL)
+            now = time.time()
+            for path, stats in self.stats.items():
+                rate = (stats["events"] - last_events[path]) / (now - last_time)
+                last_events[path] = stats["events"]
+                self.logger.info(
+                    "Stream {}: {:.2f} events/sec, {} events, {} reconnects.",
+                    path,
+                    rate,
+                    stats["events"],
+                    stats["reconnects"],
+                )
+            last_time = now
@@ -0,0 +1,175 @@
+import contextvars
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from logger import Logger
+import metrics
+
+REQUEST_SECONDS = metrics.histogram(
+    "lnd_request_seconds", "Duration of lnd REST requests.", ("endpoint", "method")
+)
+REQUESTS = metrics.counter(
+    "lnd_requests_total", "lnd REST requests by response status.", ("endpoint", "method", "status")
+)
+
+# counter of the collector run the current code belongs to, worker threads
+# get it by running their task in a copy of the submitting context
+CALL_COUNTER = contextvars.ContextVar("lnd_call_counter", default=None)
+
+
+class Call_counter:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def inc(self) -> None:
+        with self.lock:
+            self.calls += 1
+
+
+class LND_transport:
+    DEFAULT_TIMEOUT = 30
+    # longest matching prefix wins, values are (connect, read) timeouts in seconds
+    ENDPOINT_TIMEOUTS = {
+        "/v1/getinfo": (5, 15),
+        "/v1/switch": (5, 120),
+        "/v1/invoices": (5, 60),
+        "/v1/payments": (5, 60),
+        "/v1/graph": (5, 120),
+        "/v1/graph/edge": (5, 15),
+        "/v1/graph/node": (5, 15),
+        "/v1/channels/backup": (5, 60),
+    }
+    RETRY_STATUS = (500, 502, 503, 504)
+    # ids in these paths are replaced by {id} in metric labels, invoice
+    # lookups carry a payment hash or payment request
+    TEMPLATED_PATHS = (
+        "/v1/graph/edge/",
+        "/v1/graph/node/",
+        "/v1/invoice/",
+        "/v1/payreq/",
+    )
+
+    def __init__(
+        self,
+        base_url: str,
+        macaroon: str,
+        cert_path,
+        logger: Logger,
+        pool_size: int = 10,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+    ) -> None:
+        self.base_url = base_url
+        self.logger = logger
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.session.headers.update({"Grpc-Metadata-macaroon": macaroon})
+        self.session.verify = cert_path
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.RETRY_STATUS,
+            # /v1/switch is a read-only query even though it is sent as POST
+            allowed_methods=frozenset(["GET", "POST"]),
+            raise_on_status=False,
+        )
+        self.adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        # subscriptions are not retried, a read timeout there means no events yet
+        self.stream_session = requests.Session()
+        self.stream_session.headers.update({"Grpc-Metadata-macaroon": macaroon})
+        self.stream_session.verify = cert_path
+        self.stream_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+        self.stream_session.mount("https://", self.stream_adapter)
+        self.stream_session.mount("http://", self.stream_adapter)
+
+    def get(self, path: str, params: dict = None) -> requests.Response:
+        return self.__request("GET", path, params=params)
+
+    def post(self, path: str, data: str = None) -> requests.Response:
+        return self.__request("POST", path, data=data)
+
+    def get_stream(self, path: str, params: dict = None, idle_timeout: float = 5) -> requests.Response:
+        # subscriptions never end, reading raises after idle_timeout seconds without
+        # data; lnd may hold back even the headers until the first event
+        return self.__request(
+            "GET",
+            path,
+            session=self.stream_session,
+            params=params,
+            stream=True,
+            timeout=(5, idle_timeout),
+        )
+
+    def __request(self, method: str, path: str, session: requests.Session = None, **kwargs) -> requests.Response:
+        endpoint = self.__endpoint(path)
+        counter = CALL_COUNTER.get()
+        if counter is not None:
+            counter.inc()
+        start = time.time()
+        status = "error"
+        try:
+            kwargs.setdefault("timeout", self.__timeout(path))
+            r = (session or self.session).request(method, self.base_url + path, **kwargs)
+            status = str(r.status_code)
+            return r
+        finally:
+            REQUEST_SECONDS.observe(time.time() - start, endpoint, method)
+            REQUESTS.inc(endpoint, method, status)
+
+    def __endpoint(self, path: str) -> str:
+        for prefix in self.TEMPLATED_PATHS:
+            if path.startswith(prefix):
+                return prefix + "{id}"
+        return path
+
+    def __timeout(self, path: str) -> tuple:
+        best = None
+        for prefix in self.ENDPOINT_TIMEOUTS.keys():
+            if path.startswith(prefix) and (best is None or len(prefix) > len(best)):
+                best = prefix
+        if best is None:
+            return self.DEFAULT_TIMEOUT
+        return self.ENDPOINT_TIMEOUTS[best]
+
+    @staticmethod
+    def count_calls() -> Call_counter:
+        # requests sent from now on in this context and in tasks submitted
+        # with contextvars.copy_context().run, e.g. alias lookups in a pool
+        counter = Call_counter()
+        CALL_COUNTER.set(counter)
+        return counter
+
+    def stats(self) -> dict:
+        requests_count = 0
+        connections_count = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_count += pool.num_requests
+            connections_count += pool.num_connections
+        return {
+            "requests": requests_count,
+            "connections": connections_count,
+            "reused": max(requests_count - connections_count, 0),
+        }
+
+    def log_stats(self) -> None:
+        stats = self.stats()
+        self.logger.info(
+            "LND transport: {} requests over {} connections ({} reused).".format(
+                stats["requests"], stats["connections"], stats["reused"]
+            )
+        )
+
+    def close(self) -> None:
+        self.session.close()
+        self.stream_session.close()
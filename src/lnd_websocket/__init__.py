@@ -4,9 +4,8 @@ from datetime import date
 from db import DB
 from logger import Logger
 from lnd_api import LND_api
-import websocket
+from htlc_writer import Htlc_writer
 from datetime import datetime
-import os
 class LND_websocket_client:
     SATS_TO_BTC = 100000000
     MSATS_TO_SATS = 1000
@@ -14,63 +13,143 @@ class LND_websocket_client:
     EVENT_TYPE = "event_type"
     WIRE_FAILURE = "wire_failure"
     LINK_FAIL_EVENT = "link_fail_event"
-    def __init__(self,base_url:str,db: DB, cert_path: str, macaroon: str, lnd_api:LND_api,logger: Logger) -> None:
-        self.base_url = base_url.replace("https","wss")
+    # small codes stored in htlc_events, see htlc_event_kind table
+    EVENT_KINDS = {
+        "forward_event": 1,
+        "forward_fail_event": 2,
+        "settle_event": 3,
+        "link_fail_event": 4,
+        "final_htlc_event": 5,
+    }
+    # codes below follow lnd's proto enum numbers
+    EVENT_TYPES = {"UNKNOWN": 0, "SEND": 1, "RECEIVE": 2, "FORWARD": 3}
+    WIRE_FAILURES = {
+        "RESERVED": 0,
+        "INCORRECT_OR_UNKNOWN_PAYMENT_DETAILS": 1,
+        "INCORRECT_PAYMENT_AMOUNT": 2,
+        "FINAL_INCORRECT_CLTV_EXPIRY": 3,
+        "FINAL_INCORRECT_HTLC_AMOUNT": 4,
+        "FINAL_EXPIRY_TOO_SOON": 5,
+        "INVALID_REALM": 6,
+        "EXPIRY_TOO_SOON": 7,
+        "INVALID_ONION_VERSION": 8,
+        "INVALID_ONION_HMAC": 9,
+        "INVALID_ONION_KEY": 10,
+        "AMOUNT_BELOW_MINIMUM": 11,
+        "FEE_INSUFFICIENT": 12,
+        "INCORRECT_CLTV_EXPIRY": 13,
+        "CHANNEL_DISABLED": 14,
+        "TEMPORARY_CHANNEL_FAILURE": 15,
+        "REQUIRED_NODE_FEATURE_MISSING": 16,
+        "REQUIRED_CHANNEL_FEATURE_MISSING": 17,
+        "UNKNOWN_NEXT_PEER": 18,
+        "TEMPORARY_NODE_FAILURE": 19,
+        "PERMANENT_NODE_FAILURE": 20,
+        "PERMANENT_CHANNEL_FAILURE": 21,
+        "EXPIRY_TOO_FAR": 22,
+        "MPP_TIMEOUT": 23,
+        "INVALID_ONION_PAYLOAD": 24,
+        "INVALID_ONION_BLINDING": 25,
+        "INTERNAL_FAILURE": 997,
+        "UNKNOWN_FAILURE": 998,
+        "UNREADABLE_FAILURE": 999,
+    }
+    FAILURE_DETAILS = {
+        "UNKNOWN": 0,
+        "NO_DETAIL": 1,
+        "ONION_DECODE": 2,
+        "LINK_NOT_ELIGIBLE": 3,
+        "ON_CHAIN_TIMEOUT": 4,
+        "HTLC_EXCEEDS_MAX": 5,
+        "INSUFFICIENT_BALANCE": 6,
+        "INCOMPLETE_FORWARD": 7,
+        "HTLC_ADD_FAILED": 8,
+        "FORWARDS_DISABLED": 9,
+        "INVOICE_CANCELED": 10,
+        "INVOICE_UNDERPAID": 11,
+        "INVOICE_EXPIRY_TOO_SOON": 12,
+        "INVOICE_NOT_OPEN": 13,
+        "MPP_INVOICE_TIMEOUT": 14,
+        "ADDRESS_MISMATCH": 15,
+        "SET_TOTAL_MISMATCH": 16,
+        "SET_TOTAL_TOO_LOW": 17,
+        "SET_OVERPAID": 18,
+        "UNKNOWN_INVOICE": 19,
+        "INVALID_KEYSEND": 20,
+        "MPP_IN_PROGRESS": 21,
+        "CIRCULAR_ROUTE": 22,
+    }
+    def __init__(self,base_url:str,db: DB, cert_path: str, macaroon: str, lnd_api:LND_api,logger: Logger, queue_size: int = 10000, batch_size: int = 100, flush_interval: float = 2.0) -> None:
+        self.base_url = base_url
         self.macaroon = macaroon
         self.cert_path = cert_path
         self.logger = logger
         self.db = db
         self.headers = headers = {"Grpc-Metadata-macaroon": self.macaroon}
         self.lnd_api = lnd_api
-        self.ssl_context = None
-        self.ssl_opt = None
-        self.__setup_ssl_context()
-        websocket.enableTrace(True)
+        # same lazily loaded node metadata the api and reports use
+        self.node_info = lnd_api.node_info
+        # db and lnd work happens on the writer thread, the socket thread only enqueues
+        self.writer = Htlc_writer(
+            db,
+            lnd_api,
+            logger,
+            self.__parse_message,
+            queue_size=queue_size,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+        )
     def __str__(self) -> str:
         return self.base_url
-    
-    def __setup_ssl_context(self)->None:
-        os.environ["REQUESTS_CA_BUNDLE"] = self.cert_path
-        os.environ["SSL_CERT_FILE"] = self.cert_path
-        
-    def listen_for_htlc_stream(self):
-        
-        ws = websocket.WebSocketApp(
-                                self.base_url + "/v2/router/htlcevents",
-                                header=self.headers,
-                                on_open=lambda msg: self.__on_open(msg),
-                                on_message=lambda ws,msg: self.__on_message(ws,msg),
-                                on_error=lambda ws,msg: self.__on_error(ws,msg),
-                                on_close=lambda ws,close_status_code,close_msg: self.__on_close(ws, close_status_code,close_msg)
-                            )
-        ws.run_forever()
-        
-    def __on_message(self,ws:websocket.WebSocketApp,message:str):
-        self.__parse_message(message)
-    
-    def __on_error(self, ws:websocket.WebSocketApp,error:str)->None:
-        self.logger.error(str(error))
 
-    def __on_close(self,ws:websocket.WebSocketApp, close_status_code:int, close_msg:str)->None:
-        self.logger.info("Clossing connection.. {} .. {}".format(str(close_msg),str(close_status_code)))
-    def __on_open(self,ws:websocket.WebSocketApp)->None:
-        self.logger.info("Opening connection to wss...")
+    def handle_message(self, message: str) -> None:
+        self.writer.submit(message)
 
-    def __parse_message(self,message:str)->None:
+    def queue_depth(self) -> int:
+        return self.writer.queue_depth()
+
+    def __parse_message(self,message:str)->tuple:
+        # returns (htlc_events row, failed_htlc dict or None), None for events not stored
         res = json.loads(message)
         res = res[self.RESULT]
-        try:
-            if res[self.EVENT_TYPE] == "FORWARD" and res[self.LINK_FAIL_EVENT][self.WIRE_FAILURE] == "TEMPORARY_CHANNEL_FAILURE":
-                self.logger.info("HTLC fail route message...saving to db")
-                self.__failed_htlc_message(res)
-                
-        except Exception as ex:
-           self.logger.info("Not HTLC fail route message... skipping")
-        #    self.logger.error(str(ex))
+        kind = None
+        for key in self.EVENT_KINDS.keys():
+            if key in res:
+                kind = key
+                break
+        if kind is None:
+            # subscribed_event and unknown kinds
+            return None
+        event = self.__htlc_event_row(res, kind)
+        failed = None
+        if kind == self.LINK_FAIL_EVENT and res.get(self.EVENT_TYPE) == "FORWARD" and res[kind].get(self.WIRE_FAILURE) == "TEMPORARY_CHANNEL_FAILURE":
+            failed = self.__failed_htlc_message(res)
+        return event, failed
+
+    def __htlc_event_row(self, message: dict, kind: str) -> tuple:
+        body = message[kind]
+        info = body.get("info") or dict()
+        incoming_amt_msat = info.get("incoming_amt_msat")
+        outgoing_amt_msat = info.get("outgoing_amt_msat")
+        settled = body.get("settled") if kind == "final_htlc_event" else None
+        return (
+            int(message["timestamp_ns"]),
+            self.EVENT_KINDS[kind],
+            self.EVENT_TYPES.get(message.get(self.EVENT_TYPE), 0),
+            int(message.get("incoming_channel_id", 0)),
+            int(message.get("outgoing_channel_id", 0)),
+            int(message.get("incoming_htlc_id", 0)),
+            int(message.get("outgoing_htlc_id", 0)),
+            int(incoming_amt_msat) if incoming_amt_msat is not None else None,
+            int(outgoing_amt_msat) if outgoing_amt_msat is not None else None,
+            self.WIRE_FAILURES.get(body.get(self.WIRE_FAILURE)),
+            self.FAILURE_DETAILS.get(body.get("failure_detail")),
+            settled,
+        )
 
-    def __failed_htlc_message(self,message:dict)->None:
+    def __failed_htlc_message(self,message:dict)->dict:
         time = int(int(message["timestamp_ns"])/(1000000000))
-        res_dict = {
+        return {
             "chan_in": int(message["incoming_channel_id"]),
             "chan_out": int(message["outgoing_channel_id"]),
             "event_type":message["event_type"],
@@ -80,15 +159,3 @@ class LND_websocket_client:
             "failure_detail":message["link_fail_event"]["failure_detail"],
             "time":datetime.fromtimestamp(time)
         }
-        #HAS TO BE DONE
-        self.__channel_in_db(res_dict["chan_in"])
-        self.__channel_in_db(res_dict["chan_out"])
-            #SAVEPARAMS INTO DB       
-        self.db.write_failed_htlc(res_dict)
-    
-    def __channel_in_db(self,channel_id:int)->None:
-        if not self.db.is_channel_in_db(channel_id):
-            response = self.lnd_api.get_nodes_in_channel(str(channel_id))
-            alias = response[0]
-            remote_pub_key = response[2]
-            self.db.check_channel_in_db(channel_id,remote_pub_key,alias,self.logger)
\ No newline at end of file
@@ -1,6 +1,10 @@
 from db import DB
 from os.path import exists
 from datetime import datetime
+import atexit
+import queue
+import sys
+import threading
 
 
 class Logger:
@@ -8,13 +12,45 @@ class Logger:
     INFO = "INFO"
     WARNING = "WARNING"
     ERROR = "ERROR"
+    OVERFLOW_DROP = "drop"
+    OVERFLOW_BLOCK = "block"
+    MAX_BATCH = 500
+    LEVELS = {DEBUG: 10, INFO: 20, WARNING: 30, ERROR: 40}
 
-    def __init__(self, file_url: str, db: DB, loggin_level="INFO",host_name="bot") -> None:
+    def __init__(
+        self,
+        file_url: str,
+        db: DB,
+        loggin_level="INFO",
+        host_name="bot",
+        flush_interval: float = 1.0,
+        queue_size: int = 10000,
+        overflow: str = OVERFLOW_DROP,
+    ) -> None:
         self.file_url = file_url
         self.loggin_level = loggin_level
+        self.level_no = self.LEVELS.get(loggin_level, self.LEVELS[self.INFO])
         self.db = db
         self.host_name = host_name
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.dropped = 0
+        # records that reached file and console but not the db
+        self.failed = 0
+        self.closed = False
         self.__check_or_create_file()
+        self.file = None
+        try:
+            self.file = open(self.file_url, "a")
+        except:
+            sys.stderr.write("Can not open log file, logging only to console and db...\n")
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.worker = threading.Thread(
+            target=self.__run, name="logger-{}".format(host_name), daemon=True
+        )
+        self.worker.start()
+        atexit.register(self.close)
 
     def __check_or_create_file(self) -> None:
         if not exists(self.file_url):
@@ -22,51 +58,113 @@ class Logger:
                 fp = open(self.file_url, "x")
                 fp.close()
             except:
-                print("Path to file doesn not exists, can not make file...")
-
-    def __write_log_to_db(self, level: str, message: str) -> None:
-        if not self.db.write_log(level, message,self.host_name):
-            self.__write_log_to_file("ERROR", "Could not write log to PostgresSQL")
-
-    def __check_logging_level(self, level_fired: str) -> bool:
-        if self.loggin_level == "DEBUG":
-            return True
-        if self.loggin_level == level_fired:
-            return True
-        if (
-            level_fired == "WARNING" or level_fired == "ERROR"
-        ) and self.loggin_level == "INFO":
-            return True
-        if level_fired == "ERROR" and self.loggin_level == "WARNING":
-            return True
-        return False
-
-    def __write_log_to_file(self, level: str, message: str) -> None:
-        with open(self.file_url, "a") as file:
-            file.write(self.__create_log_line(level, message) + "\n")
-
-    def __create_log_line(self, level: str, message: str) -> str:
-        now = datetime.now()
-        return "{} : {} : {} : {}".format(now.strftime("%Y-%m-%d %H:%M:%S"),self.host_name, level, message)
-
-    def __write_log_to_console(self, level: str, message: str) -> None:
-        res = self.__create_log_line(level, message) + "\n"
-        print(res)
-
-    def __log_new_message(self, level: str, message: str) -> None:
-        if self.__check_logging_level(level):
-            self.__write_log_to_db(level, message)
-            self.__write_log_to_file(level, message)
-            self.__write_log_to_console(level, message)
-
-    def info(self, message: str) -> None:
-        self.__log_new_message(self.INFO, message)
-
-    def debug(self, message: str) -> None:
-        self.__log_new_message(self.DEBUG, message)
-
-    def warning(self, message: str) -> None:
-        self.__log_new_message(self.WARNING, message)
-
-    def error(self, message: str) -> None:
-        self.__log_new_message(self.ERROR, message)
+                sys.stderr.write("Path to file doesn not exists, can not make file...\n")
+
+    def __write_logs_to_db(self, records: list) -> None:
+        rows = [
+            (level, created, message, self.host_name)
+            for level, message, created in records
+        ]
+        if not self.db.write_logs(rows):
+            self.failed += len(rows)
+            self.__write_log_to_file(
+                "ERROR",
+                "Could not write {} log records to PostgresSQL".format(len(rows)),
+                datetime.now(),
+            )
+
+    def is_enabled(self, level: str) -> bool:
+        return self.LEVELS[level] >= self.level_no
+
+    @staticmethod
+    def __render(message, args: tuple) -> str:
+        # message and args may be callables, they are evaluated only for enabled levels
+        if callable(message):
+            message = message()
+        if len(args) > 0:
+            message = message.format(*[arg() if callable(arg) else arg for arg in args])
+        return message
+
+    def __write_log_to_file(self, level: str, message: str, created: datetime) -> None:
+        if self.file is not None:
+            self.file.write(self.__create_log_line(level, message, created) + "\n")
+
+    def __create_log_line(self, level: str, message: str, created: datetime) -> str:
+        return "{} : {} : {} : {}".format(created.strftime("%Y-%m-%d %H:%M:%S"),self.host_name, level, message)
+
+    def __write_log_to_console(self, level: str, message: str, created: datetime) -> None:
+        sys.stdout.write(self.__create_log_line(level, message, created) + "\n")
+
+    def __log_new_message(self, level: str, message, args: tuple) -> None:
+        if self.LEVELS[level] >= self.level_no:
+            record = (level, self.__render(message, args), datetime.now())
+            if self.closed:
+                self.__flush([record])
+                return
+            if self.overflow == self.OVERFLOW_BLOCK:
+                self.queue.put(record)
+                return
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+    def __run(self) -> None:
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            records = list()
+            try:
+                records.append(self.queue.get(timeout=self.flush_interval))
+                while len(records) < self.MAX_BATCH:
+                    records.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            if len(records) > 0:
+                self.__flush(records)
+
+    def __flush(self, records: list) -> None:
+        for level, message, created in records:
+            self.__write_log_to_file(level, message, created)
+            self.__write_log_to_console(level, message, created)
+        if self.file is not None:
+            self.file.flush()
+        sys.stdout.flush()
+        self.__write_logs_to_db(records)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.stop_event.set()
+        self.worker.join()
+        self.closed = True
+        remaining = list()
+        while not self.queue.empty():
+            remaining.append(self.queue.get_nowait())
+        if len(remaining) > 0:
+            self.__flush(remaining)
+        if self.dropped > 0:
+            self.__flush(
+                [
+                    (
+                        self.WARNING,
+                        "Log queue was full, {} messages dropped.".format(self.dropped),
+                        datetime.now(),
+                    )
+                ]
+            )
+        if self.failed > 0:
+            # the db is likely still failing, so this one goes to stderr too
+            message = "{} log records were not written to PostgresSQL.".format(self.failed)
+            sys.stderr.write(message + "\n")
+            self.__flush([(self.WARNING, message, datetime.now())])
+
+    def info(self, message, *args) -> None:
+        self.__log_new_message(self.INFO, message, args)
+
+    def debug(self, message, *args) -> None:
+        self.__log_new_message(self.DEBUG, message, args)
+
+    def warning(self, message, *args) -> None:
+        self.__log_new_message(self.WARNING, message, args)
+
+    def error(self, message, *args) -> None:
+        self.__log_new_message(self.ERROR, message, args)
@@ -0,0 +1,78 @@
+from logger import Logger
+from dotenv import dotenv_values
+from db import DB
+from datetime import datetime
+import argparse
+import base64
+import json
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a stored channel backup")
+    parser.add_argument("--list", action="store_true", help="list stored versions")
+    parser.add_argument("--at", help="newest backup up to this time, YYYY-MM-DD or 'YYYY-MM-DD HH:MM'")
+    parser.add_argument("--hash", help="version with this hash or hash prefix")
+    parser.add_argument(
+        "--multi",
+        action="store_true",
+        help="write the binary multi channel backup for `lncli restorechanbackup --multi_file`",
+    )
+    parser.add_argument("--output", help="file to write")
+    args = parser.parse_args()
+    # log lines go to stdout, the backup is written to a file only
+    if not args.list and args.output is None:
+        parser.error("--output is required")
+
+    config = dotenv_values(".env")
+    db = DB(
+        config["POSTGRES_DATABASE"],
+        config["POSTGRES_USER"],
+        config["POSTGRES_PASSWORD"],
+        config["POSTGRES_HOST"],
+        port=int(config["POSTGRES_PORT"]),
+        min_connections=int(config.get("DB_POOL_MIN", 1)),
+        max_connections=int(config.get("DB_POOL_MAX", 10)),
+    )
+    logger = Logger(
+        config["LOG_FILE"],
+        db,
+        loggin_level=config["LOG_LEVEL"],
+        host_name="export-channel-backup",
+    )
+    try:
+        if args.list:
+            for version in db.get_channel_backup_versions():
+                print(
+                    "{} channels={} bytes={} first={} last={} runs={}".format(
+                        version["hash"],
+                        version["channels"],
+                        version["size_bytes"],
+                        version["first_seen"],
+                        version["last_seen"],
+                        version["runs"],
+                    )
+                )
+            return
+        at = None
+        if args.at is not None:
+            at = datetime.fromisoformat(args.at)
+        backup = db.get_channel_backup(at=at, blob_hash=args.hash)
+        if backup is None:
+            logger.error("No channel backup found.")
+            sys.exit(1)
+        logger.info(
+            "Exporting channel backup {} from {}.", backup["hash"], backup["date"]
+        )
+        if args.multi:
+            payload = base64.b64decode(backup["data"]["multi_chan_backup"]["multi_chan_backup"])
+        else:
+            payload = json.dumps(backup["data"], indent=2).encode()
+        with open(args.output, "wb") as fp:
+            fp.write(payload)
+    finally:
+        logger.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,74 @@
 from logger import Logger
+import metrics
 from dotenv import dotenv_values
 from lnd_api import LND_api
+from node_info import Node_info
 from lnd_websocket import LND_websocket_client
 from db import DB
+from alias_cache import Alias_cache
+from lnd_streams import LND_streams
+import json
+
+
+def channel_event(
+    alias_cache: Alias_cache, node_info: Node_info, logger: Logger, message: str
+) -> None:
+    res = json.loads(message)["result"]
+    logger.debug("Channel event: {}", res.get("type"))
+    # channel counts and balances changed
+    node_info.invalidate()
+    for key in ("open_channel", "closed_channel"):
+        channel = res.get(key)
+        if channel is not None and "chan_id" in channel:
+            alias_cache.invalidate(channel["chan_id"])
+
+
+def log_event(logger: Logger, name: str, message: str) -> None:
+    logger.debug("{} event: {}", name, message)
+
+
 def main():
     
     
     config = dotenv_values(".env")
+    if config.get("METRICS_PORT"):
+        # Prometheus text format on http://<container>:METRICS_PORT/metrics
+        metrics.start_server(int(config["METRICS_PORT"]))
     db = DB(
         config["POSTGRES_DATABASE"],
         config["POSTGRES_USER"],
         config["POSTGRES_PASSWORD"],
         config["POSTGRES_HOST"],
         port=int(config["POSTGRES_PORT"]),
+        min_connections=int(config.get("DB_POOL_MIN", 1)),
+        max_connections=int(config.get("DB_POOL_MAX", 10)),
     )
     
     logger = Logger(
         config["LOG_FILE"], 
         db, 
         loggin_level=config["LOG_LEVEL"],
-        host_name="websocket-client"       
+        host_name="websocket-client",
+        flush_interval=float(config.get("LOG_FLUSH_INTERVAL", 1.0)),
+        queue_size=int(config.get("LOG_QUEUE_SIZE", 10000)),
+        overflow=config.get("LOG_OVERFLOW", Logger.OVERFLOW_DROP),
     )
+    alias_cache = Alias_cache(
+        db, logger, ttl=int(config.get("ALIAS_CACHE_TTL", Alias_cache.DEFAULT_TTL))
+    )
+    db.set_alias_cache(alias_cache)
     lnd_api = LND_api(
         config["URL"],
         config["MACAROON"],
         config["CERT_PATH"],
         config["VERIFY_CERT"] == "True",
         logger,
+        pool_size=int(config.get("LND_POOL_SIZE", 10)),
+        retries=int(config.get("LND_RETRIES", 3)),
+        alias_cache=alias_cache,
+        graph_snapshot=config.get("GRAPH_SNAPSHOT") == "True",
+        alias_concurrency=int(config.get("ALIAS_CONCURRENCY", 4)),
+        node_info_ttl=int(config.get("NODE_INFO_TTL", Node_info.DEFAULT_TTL)),
     )
     lnd_websocket = LND_websocket_client(
         config["URL"],
@@ -34,11 +76,35 @@ def main():
         config["CERT_PATH"],
         config["MACAROON"],
         lnd_api,
-        logger   
+        logger,
+        queue_size=int(config.get("HTLC_QUEUE_SIZE", 10000)),
+        batch_size=int(config.get("HTLC_BATCH_SIZE", 100)),
+        flush_interval=float(config.get("HTLC_FLUSH_INTERVAL", 2.0)),
     )
-    
-    
-    lnd_websocket.listen_for_htlc_stream()
+    streams = LND_streams(
+        config["URL"],
+        config["MACAROON"],
+        config["CERT_PATH"],
+        config["VERIFY_CERT"] == "True",
+        logger,
+        trace=config.get("WEBSOCKET_TRACE") == "True",
+    )
+    for name in config.get("LND_STREAMS", "htlcevents").split(","):
+        path = LND_streams.STREAMS[name]
+        if path == LND_streams.HTLC_EVENTS:
+            streams.subscribe(path, lnd_websocket.handle_message)
+        elif path == LND_streams.CHANNELS:
+            streams.subscribe(
+                path,
+                lambda message: channel_event(
+                    alias_cache, lnd_websocket.node_info, logger, message
+                ),
+            )
+        else:
+            streams.subscribe(
+                path, lambda message, name=name: log_event(logger, name, message)
+            )
+    streams.run()
 
 if __name__ == "__main__":
     main()
@@ -1,76 +1,154 @@
 from lnd_api import LND_api
+from node_info import Node_info
 from signal_cli import Signal_client
 from db import DB
+from alias_cache import Alias_cache
+from collector_runner import Collector_runner
+from scheduler import Scheduler
 from dotenv import dotenv_values
 from logger import Logger
+import metrics
 from message_creator import Message_creator
 import traceback
 
-def routing(api: LND_api, db: DB, logger: Logger) -> None:
-    try:
-        time = db.get_youngest_unixtimestamp_routing_tx()
-        routing_txs = api.routing_since_time_as_dict(time)
-        db.write_tx_to_db(routing_txs, logger)
-    except Exception as e:
-        logger.error("Routing error: {}".format(str(e)))
-
-
-def channel_backup(api: LND_api, db: DB, logger: Logger) -> None:
-    try:
-        res = api.channel_backup_as_dict()
-        db.write_channel_backup(res, logger)
-    except Exception as e:
-        logger.error("Channel backups error: {}".format(str(e)))
-
-
-def invoices(api: LND_api, db: DB, logger: Logger) -> None:
-    try:
-        min_offset = db.delete_all_invoices_that_are_open(logger)
-        res = api.invoices_since_last_offset_as_list(min_offset)
-        db.write_invoices(res, logger)
-    except Exception as e:
-        logger.error("Invoices error: {}".format(str(e)))
-
-
-def payments(api: LND_api, db: DB, logger: Logger) -> None:
-    try:
-        index_offset = db.get_last_index_offset()
-        paymentns_txs = api.payments_from_index_offset_as_dict(index_offset)
-        db.write_payments_to_db(paymentns_txs)
-    except Exception as e:
-        logger.error("Payments error: {}".format(str(e)))
+# daemon mode, seconds between runs, overridden by <NAME>_INTERVAL in .env
+DEFAULT_INTERVALS = {
+    "routing": 60,
+    "channel_backup": 3600,
+    "invoices": 300,
+    "payments": 300,
+    "balance": 300,
+    "partitions": 86400,
+}
+STATS_INTERVAL = 3600
+
+def routing(api: LND_api, db: DB, logger: Logger) -> dict:
+    fetched = 0
+    offset = db.get_forwarding_offset()
+    if offset is None:
+        # continue after the newest stored forward
+        offset = api.forwarding_offset_after(db.get_youngest_unixtimestamp_routing_tx())
+        db.set_sync_cursor(DB.SYNC_FORWARDING, offset)
+        logger.info("Forwarding history continues at offset {}.".format(offset))
+    for routing_txs, last_offset in api.routing_pages(0, index_offset=offset):
+        fetched += len(routing_txs)
+        db.write_tx_to_db(routing_txs, logger, cursor=(DB.SYNC_FORWARDING, last_offset))
+    return {"fetched": fetched, "written": fetched}
+
+
+def channel_backup(api: LND_api, db: DB, logger: Logger) -> dict:
+    res = api.channel_backup_as_dict()
+    # the pointer row of an unchanged backup is not counted
+    stored = db.write_channel_backup(res, logger)
+    return {"fetched": 1 if res is not None else 0, "written": 1 if stored else 0}
+
+
+def invoices(api: LND_api, db: DB, logger: Logger) -> dict:
+    fetched = 0
+    written = 0
+    # read first, new invoices below move it past settles of older ones
+    settle_index = db.get_invoice_settle_index()
+    add_index = db.get_invoice_add_index(logger)
+    newest_add_index = add_index
+    for res, last_add_index in api.invoices_pages(add_index):
+        fetched += len(res)
+        written += db.write_invoices(
+            res, logger, cursor=(DB.SYNC_INVOICES_ADD, last_add_index)
+        )
+        newest_add_index = last_add_index
+    # older invoices are only followed when they are settled, lnd's state of
+    # expired and canceled ones is not tracked
+    if settle_index > 0:
+        res = api.settled_invoices(settle_index)
+        fetched += len(res)
+        written += db.write_invoices(res, logger)
+    elif add_index > 0:
+        # lnd replays settles only after a non-zero index, until the first
+        # settle is seen one page of the newest open invoices is checked again
+        oldest_open = db.get_oldest_open_invoice_add_index()
+        if oldest_open is not None:
+            pages = api.invoices_pages(
+                max(oldest_open - 1, newest_add_index - api.NUM_MAX_INVOICES)
+            )
+            for res, _ in pages:
+                fetched += len(res)
+                written += db.write_invoices(res, logger)
+                break
+            pages.close()
+    return {"fetched": fetched, "written": written}
+
+
+def payments(api: LND_api, db: DB, logger: Logger) -> dict:
+    fetched = 0
+    index_offset = db.get_last_index_offset()
+    for paymentns_txs, last_index in api.payments_pages(index_offset):
+        fetched += len(paymentns_txs)
+        db.write_payments_to_db(paymentns_txs, logger, cursor=(DB.SYNC_PAYMENTS, last_index))
+    return {"fetched": fetched, "written": fetched}
+
+
+def balance(api: LND_api, db: DB, logger: Logger) -> dict:
+    res = api.balance_as_dict()
+    db.write_balance(res)
+    return {"fetched": 1, "written": 1}
+
+
+def partitions(db: DB, logger: Logger, retention: dict) -> dict:
+    changed = db.maintain_partitions(logger, retention=retention)
+    return {"fetched": 0, "written": changed}
+
+
+def report(
+    api: LND_api, db: DB, logger: Logger, signal_client: Signal_client, windows: list
+) -> None:
+    message_creator = Message_creator(db, api, logger, windows=windows)
+    signal_client.send_string(str(message_creator))
 
 
-def balance(api: LND_api, db: DB, logger: Logger) -> None:
-    try:
-        res = api.balance_as_dict()
-        db.write_balance(res)
-    except Exception as e:
-        logger.error("Balance error: {}".format(str(e)))
+def stats(api: LND_api, alias_cache: Alias_cache) -> None:
+    api.log_transport_stats()
+    alias_cache.log_stats()
 
 
 def main():
     config = dotenv_values(".env")
+    if config.get("METRICS_PORT"):
+        # Prometheus text format on http://<container>:METRICS_PORT/metrics
+        metrics.start_server(int(config["METRICS_PORT"]))
     db = DB(
         config["POSTGRES_DATABASE"],
         config["POSTGRES_USER"],
         config["POSTGRES_PASSWORD"],
         config["POSTGRES_HOST"],
         port=int(config["POSTGRES_PORT"]),
+        min_connections=int(config.get("DB_POOL_MIN", 1)),
+        max_connections=int(config.get("DB_POOL_MAX", 10)),
     )
     logger = Logger(
         config["LOG_FILE"],
         db,
         loggin_level=config["LOG_LEVEL"],
-        host_name="rest-client"
-        )
-    
+        host_name="rest-client",
+        flush_interval=float(config.get("LOG_FLUSH_INTERVAL", 1.0)),
+        queue_size=int(config.get("LOG_QUEUE_SIZE", 10000)),
+        overflow=config.get("LOG_OVERFLOW", Logger.OVERFLOW_DROP),
+    )
+    alias_cache = Alias_cache(
+        db, logger, ttl=int(config.get("ALIAS_CACHE_TTL", Alias_cache.DEFAULT_TTL))
+    )
+    db.set_alias_cache(alias_cache)
     api = LND_api(
         config["URL"],
         config["MACAROON"],
         config["CERT_PATH"],
         config["VERIFY_CERT"] == "True",
         logger,
+        pool_size=int(config.get("LND_POOL_SIZE", 10)),
+        retries=int(config.get("LND_RETRIES", 3)),
+        alias_cache=alias_cache,
+        graph_snapshot=config.get("GRAPH_SNAPSHOT") == "True",
+        alias_concurrency=int(config.get("ALIAS_CONCURRENCY", 4)),
+        node_info_ttl=int(config.get("NODE_INFO_TTL", Node_info.DEFAULT_TTL)),
     )
     signal_client = Signal_client(
         config["SIGNAL_SOURCE_NUMBER"],
@@ -78,28 +156,74 @@ def main():
         config["SIGNAL_BASE_URL"],
         logger,
     )
-
-    message_creator = Message_creator(db, api, logger)
-    # ROUTING
-    routing(api, db, logger)
-
-    # CHANNEL BACKUP
+    windows = config.get("REPORT_WINDOWS", "all,yesterday").split(",")
+    profile_dir = None
+    if config.get("PROFILE") == "True":
+        profile_dir = config.get("PROFILE_DIR", "./profiles")
+
+    # months kept before the current one, empty keeps everything
+    retention = dict()
+    if config.get("LOGS_RETENTION_MONTHS"):
+        retention["logs"] = int(config["LOGS_RETENTION_MONTHS"])
+    if config.get("FAILED_HTLC_RETENTION_MONTHS"):
+        retention["failed_htlc"] = int(config["FAILED_HTLC_RETENTION_MONTHS"])
+
+    # (name, func(db), depends_on)
+    collectors = [("routing", lambda db: routing(api, db, logger), ())]
     if config["SAVE_CHANNEL_BACKUP"] == "True":
         logger.info("Channel backup config TRUE")
-        channel_backup(api, db, logger)
+        collectors.append(
+            ("channel_backup", lambda db: channel_backup(api, db, logger), ())
+        )
     else:
         logger.info("Channel backup config FALSE")
-    # INVOICES
-    invoices(api, db, logger)
-
-    # PAYMENTS
-    payments(api, db, logger)
+    collectors.append(("invoices", lambda db: invoices(api, db, logger), ()))
+    collectors.append(("payments", lambda db: payments(api, db, logger), ()))
+    collectors.append(("balance", lambda db: balance(api, db, logger), ()))
+    # after routing, so a first sync of history is split into monthly partitions
+    collectors.append(
+        ("partitions", lambda db: partitions(db, logger, retention), ("routing",))
+    )
+    report_collector = (
+        "report",
+        lambda db: report(api, db, logger, signal_client, windows),
+        ("routing", "balance"),
+    )
 
-    # BALANCE
-    balance(api, db, logger)
+    if config.get("DAEMON") == "True":
+        # connections, caches and lnd info stay warm between runs
+        scheduler = Scheduler(
+            db.clone, logger, transport=api.transport, profile_dir=profile_dir
+        )
+        for name, func, depends_on in collectors:
+            interval = float(
+                config.get("{}_INTERVAL".format(name.upper()), DEFAULT_INTERVALS[name])
+            )
+            scheduler.every(name, interval, func, depends_on=depends_on)
+        name, func, depends_on = report_collector
+        scheduler.daily(
+            name, config.get("REPORT_TIME", "08:00"), func, depends_on=depends_on
+        )
+        scheduler.every(
+            "stats", STATS_INTERVAL, lambda: stats(api, alias_cache), record=False
+        )
+        scheduler.run()
+        return
 
-    # SEND SIGNAL MESSAGE
-    signal_client.send_string(str(message_creator))
+    # independent collectors run at once, each on its own db connection
+    runner = Collector_runner(
+        db.clone,
+        logger,
+        default_timeout=float(
+            config.get("COLLECTOR_TIMEOUT", Collector_runner.DEFAULT_TIMEOUT)
+        ),
+        transport=api.transport,
+        profile_dir=profile_dir,
+    )
+    for name, func, depends_on in collectors + [report_collector]:
+        runner.add(name, func, depends_on=depends_on)
+    runner.run()
+    stats(api, alias_cache)
 
 
 if __name__ == "__main__":
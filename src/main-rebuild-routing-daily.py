@@ -0,0 +1,28 @@
+from logger import Logger
+from dotenv import dotenv_values
+from db import DB
+
+
+def main():
+    config = dotenv_values(".env")
+    db = DB(
+        config["POSTGRES_DATABASE"],
+        config["POSTGRES_USER"],
+        config["POSTGRES_PASSWORD"],
+        config["POSTGRES_HOST"],
+        port=int(config["POSTGRES_PORT"]),
+        min_connections=int(config.get("DB_POOL_MIN", 1)),
+        max_connections=int(config.get("DB_POOL_MAX", 10)),
+    )
+    logger = Logger(
+        config["LOG_FILE"],
+        db,
+        loggin_level=config["LOG_LEVEL"],
+        host_name="rebuild-routing-daily",
+    )
+    db.rebuild_routing_daily(logger)
+    logger.close()
+
+
+if __name__ == "__main__":
+    main()
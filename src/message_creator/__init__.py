@@ -2,54 +2,62 @@ from db import DB
 from logger import Logger
 from lnd_api import LND_api
 from datetime import date
+from report_snapshot import Report_snapshot, Report_window
 
 
 class Message_creator:
-    def __init__(self, db: DB, lnd_api: LND_api, logger: Logger) -> None:
+    MAX_ROUTING_EVENTS = 50
+    WINDOW_TITLES = {
+        Report_snapshot.LAST_7_DAYS: "Summary last 7 days:",
+        Report_snapshot.LAST_30_DAYS: "Summary last 30 days:",
+    }
+
+    def __init__(
+        self,
+        db: DB,
+        lnd_api: LND_api,
+        logger: Logger,
+        windows: tuple = (Report_snapshot.ALL, Report_snapshot.YESTERDAY),
+    ) -> None:
         self.db = db
         self.logger = logger
         self.lnd_api = lnd_api
+        # shared with everything else using this lnd_api, refreshed after its ttl
+        self.node_info = lnd_api.node_info
+        self.windows = tuple(windows)
+        self.snapshot = None
+
+    def __get_snapshot(self) -> Report_snapshot:
+        if self.snapshot is None:
+            self.snapshot = self.db.get_report_snapshot(
+                date.today(), self.windows, self.MAX_ROUTING_EVENTS + 1
+            )
+        return self.snapshot
 
     def __date_str(self) -> str:
         return "Date: \t{}\n".format(date.today().strftime("%Y-%m-%d"))
 
     def __active_channels(self) -> str:
-        return "Active channels: \t{}\n".format(self.lnd_api.get_num_active_channels())
+        return "Active channels: \t{}\n".format(self.node_info.num_active_channels)
 
     def __inactive_channels(self) -> str:
         return "Inactive channels: \t{}\n".format(
-            str(self.lnd_api.get_num_passive_channels())
+            str(self.node_info.num_inactive_channels)
         )
 
     def __channel_alias(self) -> str:
-        return "Alias: \t{}\n".format(str(self.lnd_api))
-
-    def __routing_all(self) -> str:
-        value = self.__btc_format(self.db.get_sum_routing_all())
-        return "Routing [BTC]: \t{}\n".format(value)
-
-    def __fee_all(self) -> str:
-        value = self.__sats_format(self.db.get_fee_routing_all_sats())
-        return "Fee [sats]: \t{}\n".format(value)
-
-    def __routing_yesterday(self) -> str:
-        value = self.__btc_format(self.db.get_sum_routing_yesterday())
-        return "Routing [BTC]: \t{}\n".format(value)
+        return "Alias: \t{}\n".format(self.node_info.alias)
 
-    def __fee_yesterday(self) -> str:
-        value = self.__sats_format(self.db.get_fee_yesterday_sats())
-        return "Fee [sats]: \t{}\n".format(value)
+    def __routing(self, window: Report_window) -> str:
+        return "Routing [BTC]: \t{}\n".format(self.__btc_format(window.routed_btc))
 
-    def __count_routing_tx_all(self) -> str:
-        value = self.__sats_format(self.db.get_tx_routing_count_all())
-        return "TXs: \t\t\t{}\n".format(value)
-
-    def __count_routing_tx_yesterday(self) -> str:
-        value = self.__sats_format(self.db.get_tx_routing_count_yesterday())
-        return "TX: \t\t\t{}\n".format(value)
+    def __fee(self, window: Report_window) -> str:
+        return "Fee [sats]: \t{}\n".format(self.__sats_format(window.fee_sats))
 
     def balance(self) -> str:
-        res = self.db.get_balance()
+        res = self.__get_snapshot().balance
+        if res is None:
+            return ""
         message = "Date: \t\t{} \n".format(res["date"])
         message += "Inbound: \t{} \n".format(self.__sats_format(res["inbound"]))
         message += "Outbound: \t{} \n".format(self.__sats_format(res["outbound"]))
@@ -59,12 +67,12 @@ class Message_creator:
         return message
 
     def routing_events(self) -> str:
-        res = self.db.get_routing_events_yesterday()
+        snapshot = self.__get_snapshot()
         message = ""
-        if len(res) > 50:
+        if snapshot.routing_events_count > self.MAX_ROUTING_EVENTS:
             #skipp -> message for signal would be too long and fail
             return message
-        for item in res:
+        for item in snapshot.routing_events:
             message += "{}: from '{}' to '{}' amount {} for fee {:.2f}\n".format(
                 item["date"],
                 item["alias_in"],
@@ -83,28 +91,42 @@ class Message_creator:
         return message
 
     def summary_all_time(self) -> str:
-        message = "\nSummary all time:\n"
+        return self.__summary("Summary all time:", Report_snapshot.ALL)
+
+    def summary_window(self, name: str) -> str:
+        return self.__summary(self.WINDOW_TITLES[name], name)
+
+    def __summary(self, title: str, name: str) -> str:
+        window = self.__get_snapshot().window(name)
+        message = "\n{}\n".format(title)
         message += "{}\n".format(self.__line())
-        message += "{}".format(self.__count_routing_tx_all())
-        message += "{}".format(self.__routing_all())
-        message += "{}".format(self.__fee_all())
+        message += "TXs: \t\t\t{}\n".format(self.__sats_format(window.tx_count))
+        message += "{}".format(self.__routing(window))
+        message += "{}".format(self.__fee(window))
         message += "{}\n".format(self.__line())
         return message
 
     def summary_yesterday(self) -> str:
+        window = self.__get_snapshot().window(Report_snapshot.YESTERDAY)
         message = "Summary yersterday:"
         message += "\n{}\n".format(self.__line())
-        message += "{}".format(self.__count_routing_tx_yesterday())
-        message += "{}".format(self.__routing_yesterday())
-        message += "{}\n".format(self.__fee_yesterday())
+        message += "TX: \t\t\t{}\n".format(self.__sats_format(window.tx_count))
+        message += "{}".format(self.__routing(window))
+        message += "{}\n".format(self.__fee(window))
         return message
 
     def __str__(self) -> str:
+        self.snapshot = None
         message = self.initial_info()
         message += self.balance()
-        message += self.summary_all_time()
-        message += self.summary_yesterday()
-        message += self.routing_events()
+        for name in self.windows:
+            if name == Report_snapshot.ALL:
+                message += self.summary_all_time()
+            elif name == Report_snapshot.YESTERDAY:
+                message += self.summary_yesterday()
+                message += self.routing_events()
+            else:
+                message += self.summary_window(name)
         return message
 
     def __line(self) -> str:
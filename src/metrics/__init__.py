@@ -0,0 +1,179 @@
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Metric:
+    TYPE = None
+
+    def __init__(self, name: str, help: str, label_names: tuple = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        # label values tuple -> value
+        self.values = dict()
+
+    @staticmethod
+    def _labels(label_names: tuple, label_values: tuple) -> str:
+        if len(label_names) == 0:
+            return ""
+        pairs = [
+            '{}="{}"'.format(
+                name,
+                str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+            )
+            for name, value in zip(label_names, label_values)
+        ]
+        return "{" + ",".join(pairs) + "}"
+
+    def render(self) -> list:
+        lines = [
+            "# HELP {} {}".format(self.name, self.help),
+            "# TYPE {} {}".format(self.name, self.TYPE),
+        ]
+        with self.lock:
+            items = list(self.values.items())
+        for label_values, value in items:
+            lines.append(
+                "{}{} {}".format(self.name, self._labels(self.label_names, label_values), value)
+            )
+        return lines
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def __init__(self, name: str, help: str, label_names: tuple = ()) -> None:
+        super().__init__(name, help, label_names)
+        # label values tuple -> callable evaluated on scrape
+        self.functions = dict()
+
+    def set(self, value: float, *label_values) -> None:
+        with self.lock:
+            self.values[label_values] = value
+
+    def set_function(self, func, *label_values) -> None:
+        # for values that already exist elsewhere, e.g. queue depth
+        with self.lock:
+            self.functions[label_values] = func
+
+    def render(self) -> list:
+        with self.lock:
+            functions = list(self.functions.items())
+        for label_values, func in functions:
+            try:
+                self.set(func(), *label_values)
+            except Exception:
+                pass
+        return super().render()
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(self, name: str, help: str, label_names: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values) -> None:
+        # per label values: [count in each bucket (not cumulative) + overflow, sum, count]
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                entry = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self.values[label_values] = entry
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> list:
+        lines = [
+            "# HELP {} {}".format(self.name, self.help),
+            "# TYPE {} {}".format(self.name, self.TYPE),
+        ]
+        with self.lock:
+            items = [(labels, (list(entry[0]), entry[1], entry[2])) for labels, entry in self.values.items()]
+        for label_values, (counts, total, count) in items:
+            names = self.label_names + ("le",)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                labels = self._labels(names, label_values + (bound,))
+                lines.append("{}_bucket{} {}".format(self.name, labels, cumulative))
+            labels = self._labels(self.label_names, label_values)
+            lines.append("{}_sum{} {}".format(self.name, labels, total))
+            lines.append("{}_count{} {}".format(self.name, labels, count))
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.metrics = dict()
+
+    def __get_or_create(self, cls, name: str, help: str, label_names: tuple, **kwargs) -> Metric:
+        # a metric may be asked for from more modules, it is created only once
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = cls(name, help, label_names, **kwargs)
+                self.metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, label_names: tuple = ()) -> Counter:
+        return self.__get_or_create(Counter, name, help, label_names)
+
+    def gauge(self, name: str, help: str, label_names: tuple = ()) -> Gauge:
+        return self.__get_or_create(Gauge, name, help, label_names)
+
+    def histogram(self, name: str, help: str, label_names: tuple = (), buckets: tuple = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self.__get_or_create(Histogram, name, help, label_names, buckets=buckets)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = list()
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# one registry per process, metrics are created at import time of the measured modules
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+def start_server(port: int, host: str = "0.0.0.0", registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    # Prometheus text format on http://host:port/metrics, served from a daemon thread
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            payload = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,108 @@
+import threading
+import time
+from logger import Logger
+from lnd_transport import LND_transport
+
+
+class Node_info:
+    DEFAULT_TTL = 300
+    GETINFO = "/v1/getinfo"
+    CHANNELS = "/v1/channels"
+
+    def __init__(self, transport: LND_transport, logger: Logger, ttl: int = DEFAULT_TTL) -> None:
+        # nothing is requested until a property is read, every endpoint is cached for ttl seconds
+        self.transport = transport
+        self.logger = logger
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # path -> (parsed dict, loaded unix time)
+        self.cache = dict()
+        self.identity_pubkey = None
+
+    def __load(self, path: str, parse) -> dict:
+        with self.lock:
+            entry = self.cache.get(path)
+            if entry is not None and time.time() - entry[1] < self.ttl:
+                return entry[0]
+            try:
+                r = self.transport.get(path)
+                content = parse(r.json())
+            except Exception as e:
+                if entry is None:
+                    raise
+                # lnd is unreachable, old data is better than none
+                self.logger.error("Can not refresh {}, using old data: {}".format(path, str(e)))
+                return entry[0]
+            self.cache[path] = (content, time.time())
+            return content
+
+    def __getinfo(self) -> dict:
+        return self.__load(self.GETINFO, self.__parse_getinfo)
+
+    def __parse_getinfo(self, content: dict) -> dict:
+        res = {
+            "alias": content.get("alias") or content["identity_pubkey"],
+            "color": content.get("color"),
+            "pub_key": content["identity_pubkey"],
+            "block_height": int(content.get("block_height", 0)),
+        }
+        self.logger.debug(
+            "Alias: {}, Color: {}, Pubkey: {}, Block_height: {}",
+            res["alias"],
+            res["color"],
+            res["pub_key"],
+            res["block_height"],
+        )
+        return res
+
+    def __channels(self) -> dict:
+        return self.__load(self.CHANNELS, self.__parse_channels)
+
+    def __parse_channels(self, content: dict) -> dict:
+        res = {"active": 0, "inactive": 0, "balances": dict()}
+        for item in content.get("channels", []):
+            if item.get("active"):
+                res["active"] += 1
+            else:
+                res["inactive"] += 1
+            res["balances"][item["chan_id"]] = (
+                int(item.get("local_balance", 0)),
+                int(item.get("remote_balance", 0)),
+            )
+        return res
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.cache = dict()
+
+    @property
+    def pub_key(self) -> str:
+        # identity never changes, no need to ask again after ttl
+        if self.identity_pubkey is None:
+            self.identity_pubkey = self.__getinfo()["pub_key"]
+        return self.identity_pubkey
+
+    @property
+    def alias(self) -> str:
+        return self.__getinfo()["alias"]
+
+    @property
+    def color(self) -> str:
+        return self.__getinfo()["color"]
+
+    @property
+    def block_height(self) -> int:
+        return self.__getinfo()["block_height"]
+
+    @property
+    def num_active_channels(self) -> int:
+        return self.__channels()["active"]
+
+    @property
+    def num_inactive_channels(self) -> int:
+        return self.__channels()["inactive"]
+
+    @property
+    def channel_balances(self) -> dict:
+        # chan_id -> (local_balance, remote_balance) in sats
+        return self.__channels()["balances"]
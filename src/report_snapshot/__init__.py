@@ -0,0 +1,48 @@
+from datetime import date, timedelta
+from typing import NamedTuple
+
+
+class Report_window(NamedTuple):
+    name: str
+    tx_count: int
+    amount_out_sats: int
+    fee_milisats: int
+
+    @property
+    def routed_btc(self) -> float:
+        return self.amount_out_sats / 100000000
+
+    @property
+    def fee_sats(self) -> int:
+        return int(self.fee_milisats / 1000)
+
+
+class Report_snapshot:
+    ALL = "all"
+    YESTERDAY = "yesterday"
+    LAST_7_DAYS = "7d"
+    LAST_30_DAYS = "30d"
+    # window name -> number of whole days before today, None for all time
+    WINDOW_DAYS = {ALL: None, YESTERDAY: 1, LAST_7_DAYS: 7, LAST_30_DAYS: 30}
+
+    def __init__(
+        self,
+        windows: dict,
+        balance: dict,
+        routing_events: list,
+        routing_events_count: int,
+    ) -> None:
+        self.windows = windows
+        self.balance = balance
+        self.routing_events = routing_events
+        self.routing_events_count = routing_events_count
+
+    def window(self, name: str) -> Report_window:
+        return self.windows[name]
+
+    @classmethod
+    def window_bounds(cls, name: str, today: date) -> tuple:
+        days = cls.WINDOW_DAYS[name]
+        if days is None:
+            return None
+        return today - timedelta(days=days), today
@@ -0,0 +1,142 @@
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+from logger import Logger
+from collector_runner import Collector_runner, COLLECTOR_RUNS
+
+
+class Scheduler:
+    TICK = 1.0
+
+    def __init__(self, db_factory, logger: Logger, transport=None, profile_dir: str = None) -> None:
+        # db_factory() gives every job run its own DB object, connections come from the pool
+        self.db_factory = db_factory
+        self.logger = logger
+        # see Collector_runner, runs are recorded the same way
+        self.transport = transport
+        self.profile_dir = profile_dir
+        # name -> job dict, see __add
+        self.jobs = dict()
+        self.stop_event = threading.Event()
+
+    def every(self, name: str, seconds: float, func, depends_on: tuple = (), record: bool = True) -> None:
+        # first run right after start; without record func() is a plain timer,
+        # it gets no db and its runs are not stored in collector_runs
+        self.__add(
+            name, func, depends_on, interval=seconds, at=None, next_run=time.time(), record=record
+        )
+
+    def daily(self, name: str, at: str, func, depends_on: tuple = ()) -> None:
+        # at is local time HH:MM
+        at = datetime.strptime(at, "%H:%M").time()
+        self.__add(name, func, depends_on, interval=None, at=at, next_run=self.__next_daily(at))
+
+    def __add(
+        self, name: str, func, depends_on: tuple, interval: float, at, next_run: float, record: bool = True
+    ) -> None:
+        for dependency in depends_on:
+            if dependency not in self.jobs:
+                raise ValueError("Unknown dependency {} of job {}".format(dependency, name))
+        self.jobs[name] = {
+            "func": func,
+            "depends_on": tuple(depends_on),
+            "interval": interval,
+            "at": at,
+            "next_run": next_run,
+            "record": record,
+            # held while the job runs, overlapping runs are skipped
+            "lock": threading.Lock(),
+            "runs": 0,
+            "skipped": 0,
+        }
+
+    @staticmethod
+    def __next_daily(at) -> float:
+        now = datetime.now()
+        next_run = datetime.combine(now.date(), at)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return next_run.timestamp()
+
+    def stop(self, *args) -> None:
+        self.stop_event.set()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.logger.info(
+            "Scheduler started: {}",
+            lambda: ", ".join(
+                "{} every {}s".format(name, job["interval"])
+                if job["interval"] is not None
+                else "{} daily at {}".format(name, job["at"].strftime("%H:%M"))
+                for name, job in self.jobs.items()
+            ),
+        )
+        while not self.stop_event.is_set():
+            now = time.time()
+            for name, job in self.jobs.items():
+                if job["next_run"] > now:
+                    continue
+                if job["interval"] is not None:
+                    job["next_run"] = now + job["interval"]
+                else:
+                    job["next_run"] = self.__next_daily(job["at"])
+                if not job["lock"].acquire(blocking=False):
+                    job["skipped"] += 1
+                    COLLECTOR_RUNS.inc(name, "skipped")
+                    self.logger.warning("Skipping {}, previous run is still in progress.", name)
+                    continue
+                threading.Thread(
+                    target=self.__run_job, args=(name,), name="job-{}".format(name), daemon=True
+                ).start()
+            self.stop_event.wait(self.TICK)
+        self.logger.info("Scheduler stopping, waiting for running jobs...")
+        for job in self.jobs.values():
+            with job["lock"]:
+                pass
+        for name, job in self.jobs.items():
+            self.logger.info("Job {}: {} runs, {} skipped.", name, job["runs"], job["skipped"])
+
+    def __run_job(self, name: str) -> None:
+        # lock of the job is already held by the scheduler loop
+        job = self.jobs[name]
+        try:
+            for dependency in job["depends_on"]:
+                self.__run_dependency(dependency)
+            self.__call(name)
+        finally:
+            job["lock"].release()
+
+    def __run_dependency(self, name: str) -> None:
+        job = self.jobs[name]
+        if job["lock"].acquire(blocking=False):
+            self.__run_job(name)
+            return
+        # already running, its result is fresh enough, just wait for it
+        self.logger.debug("Waiting for running {}...", name)
+        with job["lock"]:
+            pass
+
+    def __call(self, name: str) -> None:
+        job = self.jobs[name]
+        start = time.time()
+        if not job["record"]:
+            try:
+                job["func"]()
+            except Exception as e:
+                self.logger.error("Job {} failed: {}: {}", name, type(e).__name__, str(e))
+            job["runs"] += 1
+            return
+        status = Collector_runner.run_collector(
+            name,
+            job["func"],
+            self.db_factory,
+            self.logger,
+            datetime.now(),
+            transport=self.transport,
+            profile_dir=self.profile_dir,
+        )
+        job["runs"] += 1
+        self.logger.debug("Job {} {} in {:.2f}s.", name, status, time.time() - start)
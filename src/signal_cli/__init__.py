@@ -20,14 +20,14 @@ class Signal_client:
             "recipients": self.recipients,
         }
         self.logger.info("Preparing to send signal message...")
-        self.logger.debug("Data: {}".format(json.dumps(data)))
+        self.logger.debug("Data: {}", lambda: json.dumps(data))
         response = requests.post(self.url, data=json.dumps(data))
         if response.status_code == 200 or response.status_code == 201:
             self.logger.info("Response from signal OK.")
         else:
             self.logger.info("Response from signal FAIL.")
         self.logger.debug(
-            "Response code: {} , response data: {}".format(
-                response.status_code, json.dumps(response.json())
-            )
+            "Response code: {} , response data: {}",
+            response.status_code,
+            lambda: json.dumps(response.json()),
         )
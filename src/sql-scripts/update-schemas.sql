@@ -0,0 +1,228 @@
+-- idempotent schema changes applied on every start, also on top of create-schemas.sql
+
+ALTER TABLE public.channels ADD COLUMN IF NOT EXISTS last_refreshed timestamp NULL;
+
+CREATE TABLE IF NOT EXISTS public.sync_state (
+	stream varchar NOT NULL,
+	cursor_value int8 NOT NULL,
+	updated timestamp NOT NULL,
+	CONSTRAINT sync_state_pk PRIMARY KEY (stream)
+);
+
+ALTER TABLE public.invoices ADD COLUMN IF NOT EXISTS add_index int8 NULL;
+ALTER TABLE public.invoices ADD COLUMN IF NOT EXISTS settle_index int8 NULL;
+ALTER TABLE public.invoices DROP COLUMN IF EXISTS r_hash;
+CREATE UNIQUE INDEX IF NOT EXISTS invoices_add_index_idx ON public.invoices USING btree (add_index);
+
+CREATE TABLE IF NOT EXISTS public.routing_daily (
+	day date NOT NULL,
+	chan_id_in int8 NOT NULL,
+	chan_id_out int8 NOT NULL,
+	tx_count int8 NOT NULL,
+	amount_out_sats int8 NOT NULL,
+	amount_out_milisats int8 NOT NULL,
+	fee_milisats int8 NOT NULL,
+	CONSTRAINT routing_daily_pk PRIMARY KEY (day, chan_id_in, chan_id_out)
+);
+
+-- report totals, one row per day; routing_daily grows with days times channel pairs
+CREATE TABLE IF NOT EXISTS public.routing_day_total (
+	day date NOT NULL,
+	tx_count int8 NOT NULL,
+	amount_out_sats int8 NOT NULL,
+	amount_out_milisats int8 NOT NULL,
+	fee_milisats int8 NOT NULL,
+	CONSTRAINT routing_day_total_pk PRIMARY KEY (day)
+);
+
+CREATE TABLE IF NOT EXISTS public.htlc_event_kind (
+	id int2 NOT NULL,
+	"kind" varchar NOT NULL,
+	CONSTRAINT htlc_event_kind_pk PRIMARY KEY (id)
+);
+INSERT INTO public.htlc_event_kind (id, "kind") VALUES
+	(1, 'forward'),
+	(2, 'forward_fail'),
+	(3, 'settle'),
+	(4, 'link_fail'),
+	(5, 'final_htlc')
+ON CONFLICT (id) DO NOTHING;
+
+-- append only, no surrogate key; event_type, wire_failure and failure_detail
+-- hold lnd's proto enum numbers (HtlcEvent.EventType, Failure.FailureCode, FailureDetail)
+CREATE TABLE IF NOT EXISTS public.htlc_events (
+	timestamp_ns int8 NOT NULL,
+	event_kind int2 NOT NULL,
+	event_type int2 NOT NULL,
+	incoming_channel_id int8 NOT NULL,
+	outgoing_channel_id int8 NOT NULL,
+	incoming_htlc_id int8 NOT NULL,
+	outgoing_htlc_id int8 NOT NULL,
+	incoming_amt_msat int8 NULL,
+	outgoing_amt_msat int8 NULL,
+	wire_failure int2 NULL,
+	failure_detail int2 NULL,
+	settled bool NULL
+);
+CREATE INDEX IF NOT EXISTS htlc_events_timestamp_ns_idx ON public.htlc_events USING brin (timestamp_ns);
+CREATE INDEX IF NOT EXISTS htlc_events_channels_idx ON public.htlc_events USING btree (incoming_channel_id, outgoing_channel_id);
+
+-- one row per collector per run of the rest client
+CREATE TABLE IF NOT EXISTS public.collector_runs (
+	id serial8 NOT NULL,
+	run_started timestamp NOT NULL,
+	collector varchar NOT NULL,
+	started timestamp NOT NULL,
+	finished timestamp NOT NULL,
+	duration_ms int4 NOT NULL,
+	rows_fetched int8 NOT NULL,
+	rows_written int8 NOT NULL,
+	rest_calls int4 NOT NULL,
+	status varchar NOT NULL,
+	error_class varchar NULL,
+	CONSTRAINT collector_runs_pk PRIMARY KEY (id)
+);
+CREATE INDEX IF NOT EXISTS collector_runs_collector_idx ON public.collector_runs USING btree (collector, started);
+
+-- one zlib compressed backup json per set of channels, hash is sha256 of the
+-- sorted channel points; channel_backup rows point to it, rows written before
+-- keep their json in "data"
+CREATE TABLE IF NOT EXISTS public.channel_backup_blob (
+	hash varchar NOT NULL,
+	created timestamp NOT NULL,
+	channels int4 NOT NULL,
+	size_bytes int4 NOT NULL,
+	"data" bytea NOT NULL,
+	CONSTRAINT channel_backup_blob_pk PRIMARY KEY (hash)
+);
+ALTER TABLE public.channel_backup ADD COLUMN IF NOT EXISTS blob_hash varchar NULL REFERENCES public.channel_backup_blob(hash);
+
+-- monthly range partitions: <table>_yYYYYmMM, plus <table>_default for rows
+-- outside of every month that has a partition
+
+-- creates the missing partitions from from_month up to months_ahead after
+-- the current month, rows that already landed in the default partition are
+-- moved into the new one; returns the number of partitions created
+CREATE OR REPLACE FUNCTION public.create_monthly_partitions(parent text, column_name text, from_month date, months_ahead int)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+	month_start date := date_trunc('month', from_month)::date;
+	last_month date := (date_trunc('month', now()) + make_interval(months => months_ahead))::date;
+	partition_name text;
+	created int := 0;
+BEGIN
+	WHILE month_start <= last_month LOOP
+		partition_name := format('%s_y%s', parent, to_char(month_start, 'YYYY"m"MM'));
+		IF to_regclass(format('public.%I', partition_name)) IS NULL THEN
+			EXECUTE format('CREATE TABLE public.%I (LIKE public.%I INCLUDING DEFAULTS)', partition_name, parent);
+			EXECUTE format(
+				'WITH moved AS (DELETE FROM public.%I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO public.%I SELECT * FROM moved',
+				parent || '_default', column_name, month_start, column_name, (month_start + interval '1 month')::date, partition_name
+			);
+			EXECUTE format(
+				'ALTER TABLE public.%I ATTACH PARTITION public.%I FOR VALUES FROM (%L) TO (%L)',
+				parent, partition_name, month_start, (month_start + interval '1 month')::date
+			);
+			created := created + 1;
+		END IF;
+		month_start := (month_start + interval '1 month')::date;
+	END LOOP;
+	RETURN created;
+END
+$$;
+
+-- retention: keeps the current month and keep_months months before it, older
+-- monthly partitions are dropped and older rows deleted from the default
+-- partition; returns the number of partitions dropped
+CREATE OR REPLACE FUNCTION public.drop_monthly_partitions(parent text, column_name text, keep_months int)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+	cutoff date := (date_trunc('month', now()) - make_interval(months => keep_months))::date;
+	partition_name text;
+	dropped int := 0;
+BEGIN
+	FOR partition_name IN
+		SELECT child.relname
+		FROM pg_inherits
+		JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+		WHERE pg_inherits.inhparent = format('public.%I', parent)::regclass
+			AND child.relname ~ ('^' || parent || '_y[0-9]{4}m[0-9]{2}$')
+			AND to_date(right(child.relname, 7), 'YYYY"m"MM') < cutoff
+	LOOP
+		EXECUTE format('DROP TABLE public.%I', partition_name);
+		dropped := dropped + 1;
+	END LOOP;
+	EXECUTE format('DELETE FROM public.%I WHERE %I < %L', parent || '_default', column_name, cutoff);
+	RETURN dropped;
+END
+$$;
+
+-- one time conversion of a plain table into a partitioned one with the same
+-- columns, id sequence, indexes, foreign keys and views; rows are copied in
+-- the transaction of the schema update. Returns false when already partitioned.
+CREATE OR REPLACE FUNCTION public.partition_by_month(parent text, column_name text, months_ahead int)
+RETURNS boolean
+LANGUAGE plpgsql
+AS $$
+DECLARE
+	old_name text := parent || '_unpartitioned';
+	id_sequence text := pg_get_serial_sequence(format('public.%I', parent), 'id');
+	first_row timestamp;
+	views text[];
+	indexes text[];
+	foreign_keys text[];
+	statement text;
+BEGIN
+	-- runs under the schema lock of DB, a container that waited for it finds
+	-- the table already converted by the other one
+	IF (SELECT relkind FROM pg_class WHERE oid = format('public.%I', parent)::regclass) = 'p' THEN
+		RETURN false;
+	END IF;
+	-- definitions still name the table, they are replayed against the new one
+	SELECT array_agg(DISTINCT format('CREATE OR REPLACE VIEW public.%I AS %s', view_class.relname, pg_get_viewdef(view_class.oid)))
+	INTO views
+	FROM pg_depend
+	JOIN pg_rewrite ON pg_rewrite.oid = pg_depend.objid
+	JOIN pg_class view_class ON view_class.oid = pg_rewrite.ev_class
+	WHERE pg_depend.classid = 'pg_rewrite'::regclass
+		AND pg_depend.refobjid = format('public.%I', parent)::regclass
+		AND view_class.oid <> pg_depend.refobjid;
+	SELECT array_agg(pg_get_indexdef(indexrelid))
+	INTO indexes
+	FROM pg_index
+	WHERE indrelid = format('public.%I', parent)::regclass AND NOT indisprimary;
+	SELECT array_agg(format('ALTER TABLE public.%I ADD CONSTRAINT %I %s', parent, conname, pg_get_constraintdef(oid)))
+	INTO foreign_keys
+	FROM pg_constraint
+	WHERE conrelid = format('public.%I', parent)::regclass AND contype = 'f';
+
+	EXECUTE format('ALTER TABLE public.%I RENAME TO %I', parent, old_name);
+	EXECUTE format('CREATE TABLE public.%I (LIKE public.%I INCLUDING DEFAULTS) PARTITION BY RANGE (%I)', parent, old_name, column_name);
+	EXECUTE format('CREATE TABLE public.%I PARTITION OF public.%I DEFAULT', parent || '_default', parent);
+	EXECUTE format('SELECT min(%I) FROM public.%I', column_name, old_name) INTO first_row;
+	PERFORM public.create_monthly_partitions(parent, column_name, coalesce(first_row, now())::date, months_ahead);
+	EXECUTE format('INSERT INTO public.%I SELECT * FROM public.%I', parent, old_name);
+	FOREACH statement IN ARRAY coalesce(views, ARRAY[]::text[]) LOOP
+		EXECUTE statement;
+	END LOOP;
+
+	-- the sequence would go away with the old table
+	EXECUTE format('ALTER SEQUENCE %s OWNED BY NONE', id_sequence);
+	EXECUTE format('DROP TABLE public.%I', old_name);
+	EXECUTE format('ALTER SEQUENCE %s OWNED BY public.%I.id', id_sequence, parent);
+	-- a primary key of a partitioned table has to contain the partition column
+	EXECUTE format('ALTER TABLE public.%I ADD CONSTRAINT %I PRIMARY KEY (id, %I)', parent, parent || '_pk', column_name);
+	FOREACH statement IN ARRAY coalesce(indexes, ARRAY[]::text[]) || coalesce(foreign_keys, ARRAY[]::text[]) LOOP
+		EXECUTE statement;
+	END LOOP;
+	RETURN true;
+END
+$$;
+
+SELECT public.partition_by_month('routing', 'unix_timestamp', 3);
+SELECT public.partition_by_month('failed_htlc', 'unix_timestamp', 3);
+SELECT public.partition_by_month('logs', 'log_timestamp', 3);
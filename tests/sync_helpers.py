@@ -0,0 +1,134 @@
+"""Shared setup of the sync tests: fake lnd from benchmarks, src on sys.path.
+
+Tests that need Postgres run only when TEST_POSTGRES_DATABASE is set, the
+database is emptied by them, never point it at the bot's database:
+
+    TEST_POSTGRES_DATABASE=lnd_test TEST_POSTGRES_USER=ln TEST_POSTGRES_PASSWORD=xxx \\
+        python3 -m pytest -q tests
+"""
+import importlib.util
+import os
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SRC = os.path.join(ROOT, "src")
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from fake_lnd import Fake_lnd  # noqa: E402
+from lnd_api import LND_api  # noqa: E402
+
+TEST_DATABASE = os.environ.get("TEST_POSTGRES_DATABASE")
+RESET_TABLES = (
+    "routing",
+    "routing_daily",
+    "routing_day_total",
+    "invoices",
+    "channels",
+    "sync_state",
+    "logs",
+)
+
+
+class Silent_logger:
+    def __init__(self) -> None:
+        self.errors = list()
+
+    def error(self, message, *args, **kwargs) -> None:
+        self.errors.append(message)
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class Recording_db:
+    # stands in for DB where only collector runs are written, runs is shared
+    # by all objects of one factory
+    def __init__(self, runs: list) -> None:
+        self.runs = runs
+        self.closed = False
+
+    def rollback(self) -> None:
+        pass
+
+    def write_collector_run(self, row: tuple) -> None:
+        self.runs.append(row)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def recording_db_factory() -> tuple:
+    # (db_factory, list of collector_runs rows)
+    runs = list()
+    return (lambda: Recording_db(runs)), runs
+
+
+def api_for(fake: Fake_lnd, logger=None) -> LND_api:
+    api = LND_api(fake.url, "00", None, False, logger or Silent_logger())
+    # the fake replays at once, no need to wait for a quiet stream
+    api.SETTLE_STREAM_IDLE = 0.3
+    return api
+
+
+def load_collectors():
+    # collectors are tested as they are, file name is not importable
+    path = os.path.join(SRC, "main-lnd-rest-api.py")
+    spec = importlib.util.spec_from_file_location("main_lnd_rest_api", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after(func, calls: int):
+    # wraps a db write so the run stops like a killed process after calls writes
+    state = {"calls": 0}
+
+    def wrapper(*args, **kwargs):
+        if state["calls"] >= calls:
+            raise Interrupted()
+        state["calls"] += 1
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+class Db_test_case(unittest.TestCase):
+    # empty test database in self.db, DB reads ./sql-scripts from src
+    @classmethod
+    def setUpClass(cls) -> None:
+        if TEST_DATABASE is None:
+            raise unittest.SkipTest("TEST_POSTGRES_DATABASE is not set")
+        cls.cwd = os.getcwd()
+        os.chdir(SRC)
+        from db import DB
+
+        cls.db = DB(
+            TEST_DATABASE,
+            os.environ.get("TEST_POSTGRES_USER", "ln"),
+            os.environ.get("TEST_POSTGRES_PASSWORD", ""),
+            os.environ.get("TEST_POSTGRES_HOST", "127.0.0.1"),
+            port=int(os.environ.get("TEST_POSTGRES_PORT", 5432)),
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.db.pool.close()
+        os.chdir(cls.cwd)
+
+    def setUp(self) -> None:
+        self.db.cursor.execute(
+            "TRUNCATE {} CASCADE;".format(", ".join("public." + table for table in RESET_TABLES))
+        )
+        self.db.conn.commit()
+
+    def count(self, query: str) -> int:
+        self.db.cursor.execute(query)
+        res = self.db.cursor.fetchone()[0]
+        self.db.conn.commit()
+        return res
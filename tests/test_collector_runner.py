@@ -0,0 +1,108 @@
+import threading
+import time
+import unittest
+
+from sync_helpers import Silent_logger, recording_db_factory
+from collector_runner import COLLECTOR_ROWS, Collector_runner
+from lnd_transport import LND_transport, CALL_COUNTER
+
+
+class Fake_transport:
+    count_calls = staticmethod(LND_transport.count_calls)
+
+    @staticmethod
+    def call() -> None:
+        # what LND_transport does for every request
+        counter = CALL_COUNTER.get()
+        if counter is not None:
+            counter.inc()
+
+
+class Collector_runner_test(unittest.TestCase):
+    def setUp(self) -> None:
+        self.db_factory, self.runs = recording_db_factory()
+        self.logger = Silent_logger()
+        self.runner = Collector_runner(
+            self.db_factory, self.logger, default_timeout=5, transport=Fake_transport()
+        )
+        self.runner.POLL_INTERVAL = 0.01
+
+    def run_of(self, name: str) -> tuple:
+        return [run for run in self.runs if run[1] == name][0]
+
+    def test_dependency_runs_first(self):
+        finished = dict()
+
+        def collector(name: str, seconds: float):
+            def func(db):
+                time.sleep(seconds)
+                finished[name] = time.time()
+                return {"fetched": 1, "written": 1}
+
+            return func
+
+        started = dict()
+
+        def dependent(db):
+            started["report"] = time.time()
+
+        self.runner.add("routing", collector("routing", 0.2))
+        self.runner.add("balance", collector("balance", 0.05))
+        self.runner.add("report", dependent, depends_on=("routing", "balance"))
+        res = self.runner.run()
+        self.assertEqual({name: status for name, (status, _) in res.items()}, {
+            "routing": Collector_runner.OK,
+            "balance": Collector_runner.OK,
+            "report": Collector_runner.OK,
+        })
+        self.assertGreaterEqual(started["report"], finished["routing"])
+        self.assertGreaterEqual(started["report"], finished["balance"])
+        # independent collectors run at once, the shorter one ends first
+        self.assertLess(finished["balance"], finished["routing"])
+
+    def test_unknown_dependency(self):
+        with self.assertRaises(ValueError):
+            self.runner.add("report", lambda db: None, depends_on=("routing",))
+
+    def test_timeout_does_not_wait_for_collector(self):
+        release = threading.Event()
+        self.runner.add("stuck", lambda db: release.wait(5), timeout=0.1)
+        self.runner.add("after", lambda db: None, depends_on=("stuck",))
+        start = time.time()
+        res = self.runner.run()
+        release.set()
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(res["stuck"][0], Collector_runner.TIMEOUT)
+        # dependents still run, with a warning
+        self.assertEqual(res["after"][0], Collector_runner.OK)
+
+    def test_failure_is_recorded(self):
+        def failing(db):
+            raise KeyError("chan_id")
+
+        self.runner.add("routing", failing)
+        res = self.runner.run()
+        self.assertEqual(res["routing"][0], Collector_runner.FAILED)
+        run = self.run_of("routing")
+        self.assertEqual(run[8:], (Collector_runner.FAILED, "KeyError"))
+        self.assertEqual(len(self.logger.errors), 1)
+
+    def test_rows_and_calls_are_counted(self):
+        def collector(db):
+            for _ in range(3):
+                Fake_transport.call()
+            return {"fetched": 10, "written": 7}
+
+        fetched = COLLECTOR_ROWS.values.get(("invoices", "fetched"), 0)
+        written = COLLECTOR_ROWS.values.get(("invoices", "written"), 0)
+        self.runner.add("invoices", collector)
+        self.runner.run()
+        run = self.run_of("invoices")
+        # rows_fetched, rows_written, rest_calls
+        self.assertEqual(run[5:8], (10, 7, 3))
+        self.assertEqual(COLLECTOR_ROWS.values[("invoices", "fetched")], fetched + 10)
+        self.assertEqual(COLLECTOR_ROWS.values[("invoices", "written")], written + 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import json
+import unittest
+from datetime import datetime
+
+from sync_helpers import Silent_logger
+from lnd_websocket import LND_websocket_client
+
+TIMESTAMP_NS = 1700000000123456789
+INFO = {
+    "incoming_timelock": 800144,
+    "outgoing_timelock": 800104,
+    "incoming_amt_msat": "1001000",
+    "outgoing_amt_msat": "1000000",
+}
+
+
+class Fake_api:
+    node_info = None
+
+
+def message(kind: str, body: dict, event_type: str = "FORWARD") -> str:
+    return json.dumps(
+        {
+            "result": {
+                "incoming_channel_id": "880000000000000001",
+                "outgoing_channel_id": "880000000000000002",
+                "incoming_htlc_id": "7",
+                "outgoing_htlc_id": "9",
+                "timestamp_ns": str(TIMESTAMP_NS),
+                "event_type": event_type,
+                kind: body,
+            }
+        }
+    )
+
+
+class Htlc_parser_test(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.client = LND_websocket_client(
+            "wss://127.0.0.1:8080", None, None, "00", Fake_api(), Silent_logger()
+        )
+        cls.parse = staticmethod(cls.client.writer.parse_message)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.client.writer.close()
+
+    def test_forward_event(self):
+        event, failed = self.parse(message("forward_event", {"info": INFO}))
+        self.assertEqual(
+            event,
+            (TIMESTAMP_NS, 1, 3, 880000000000000001, 880000000000000002, 7, 9, 1001000, 1000000, None, None, None),
+        )
+        self.assertIsNone(failed)
+
+    def test_link_fail_event_of_forward_is_a_failed_htlc(self):
+        body = {
+            "info": INFO,
+            "wire_failure": "TEMPORARY_CHANNEL_FAILURE",
+            "failure_detail": "INSUFFICIENT_BALANCE",
+            "failure_string": "insufficient bandwidth to route htlc",
+        }
+        event, failed = self.parse(message("link_fail_event", body))
+        self.assertEqual(event[1:3], (4, 3))
+        self.assertEqual(event[9:11], (15, 6))
+        self.assertEqual(
+            failed,
+            {
+                "chan_in": 880000000000000001,
+                "chan_out": 880000000000000002,
+                "event_type": "FORWARD",
+                "wire_failure": "TEMPORARY_CHANNEL_FAILURE",
+                "incoming_amount_msats": 1001000,
+                "outgoing_amount_msats": 1000000,
+                "failure_detail": "INSUFFICIENT_BALANCE",
+                "time": datetime.fromtimestamp(TIMESTAMP_NS // 1000000000),
+            },
+        )
+
+    def test_other_link_failures_are_only_events(self):
+        body = {"info": INFO, "wire_failure": "FEE_INSUFFICIENT", "failure_detail": "NO_DETAIL"}
+        event, failed = self.parse(message("link_fail_event", body))
+        self.assertEqual(event[9:11], (12, 1))
+        self.assertIsNone(failed)
+        body = dict(body, wire_failure="TEMPORARY_CHANNEL_FAILURE")
+        _, failed = self.parse(message("link_fail_event", body, event_type="SEND"))
+        self.assertIsNone(failed)
+
+    def test_settle_and_final_events(self):
+        event, _ = self.parse(message("settle_event", {"preimage": "AAAA"}, event_type="RECEIVE"))
+        self.assertEqual(event[1:3], (3, 2))
+        self.assertEqual(event[7:], (None, None, None, None, None))
+        event, _ = self.parse(message("final_htlc_event", {"settled": True, "offchain": True}))
+        self.assertEqual(event[1], 5)
+        self.assertIs(event[11], True)
+
+    def test_unknown_codes_are_stored_as_null(self):
+        body = {"info": INFO, "wire_failure": "NEW_FAILURE", "failure_detail": "NEW_DETAIL"}
+        event, _ = self.parse(message("link_fail_event", body, event_type="NEW_TYPE"))
+        self.assertEqual(event[2], 0)
+        self.assertEqual(event[9:11], (None, None))
+
+    def test_subscribed_event_is_skipped(self):
+        self.assertIsNone(self.parse(json.dumps({"result": {"subscribed_event": {}}})))
+
+    def test_invalid_message_raises(self):
+        # the writer logs these and goes on
+        with self.assertRaises(ValueError):
+            self.parse("not json")
+        with self.assertRaises(KeyError):
+            self.parse(json.dumps({"error": {"code": 2}}))
+
+
+if __name__ == "__main__":
+    unittest.main()
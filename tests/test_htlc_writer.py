@@ -0,0 +1,85 @@
+import unittest
+
+from sync_helpers import Silent_logger
+from htlc_writer import Htlc_writer
+
+
+class Failing_db:
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+        self.batches = list()
+        self.rollbacks = 0
+
+    def write_htlc_batch(self, rows: list, failed_list: list, channels: dict) -> int:
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("connection lost")
+        self.batches.append((list(rows), list(failed_list), dict(channels)))
+        return len(rows)
+
+    def rollback(self) -> None:
+        self.rollbacks += 1
+
+
+class Fake_api:
+    def __init__(self) -> None:
+        self.asked = list()
+
+    def resolve_channels(self, chan_ids: list) -> dict:
+        self.asked.append(sorted(chan_ids))
+        return {chan_id: ("alias" + chan_id, 0, "pub" + chan_id) for chan_id in chan_ids}
+
+
+def parse(message: str) -> tuple:
+    index = int(message)
+    failed = None
+    if index % 2 == 0:
+        failed = {"chan_in": 1, "chan_out": 2, "index": index}
+    return (index,), failed
+
+
+class Htlc_writer_test(unittest.TestCase):
+    def writer(self, db: Failing_db, api: Fake_api) -> Htlc_writer:
+        return Htlc_writer(
+            db, api, Silent_logger(), parse, queue_size=100, batch_size=10, flush_interval=0.05
+        )
+
+    def test_batch_is_kept_after_failed_write(self):
+        db = Failing_db(failures=1)
+        api = Fake_api()
+        writer = self.writer(db, api)
+        for index in range(10):
+            writer.submit(str(index))
+        writer.close()
+        self.assertEqual(db.rollbacks, 1)
+        self.assertEqual(writer.written, 10)
+        self.assertEqual(writer.dropped, 0)
+        rows = [row for batch in db.batches for row in batch[0]]
+        failed = [row["index"] for batch in db.batches for row in batch[1]]
+        self.assertEqual(rows, [(index,) for index in range(10)])
+        self.assertEqual(failed, [0, 2, 4, 6, 8])
+
+    def test_channels_written_with_first_batch_only(self):
+        db = Failing_db(failures=0)
+        api = Fake_api()
+        writer = self.writer(db, api)
+        for index in range(30):
+            writer.submit(str(index))
+        writer.close()
+        channels = [batch[2] for batch in db.batches]
+        self.assertEqual(channels[0], {1: ("pub1", "alias1"), 2: ("pub2", "alias2")})
+        self.assertTrue(all(len(batch) == 0 for batch in channels[1:]))
+        self.assertEqual(api.asked, [["1", "2"]])
+
+    def test_unwritten_events_are_counted_on_close(self):
+        db = Failing_db(failures=1000)
+        writer = self.writer(db, Fake_api())
+        for index in range(5):
+            writer.submit(str(index))
+        writer.close()
+        self.assertEqual(writer.written, 0)
+        self.assertEqual(writer.dropped, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+
+from sync_helpers import (
+    Db_test_case,
+    Fake_lnd,
+    Interrupted,
+    Silent_logger,
+    api_for,
+    interrupt_after,
+    load_collectors,
+)
+
+# every third invoice of the fake is open, settle_index of the last settled one is 200
+INVOICES = 300
+SETTLED = 200
+
+
+class Invoices_pages_test(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fake = Fake_lnd(invoices=INVOICES).start()
+        self.api = api_for(self.fake, Silent_logger())
+
+    def tearDown(self) -> None:
+        self.fake.stop()
+
+    def test_resume_after_interrupt(self):
+        pages = self.api.invoices_pages(0)
+        first, add_index = next(pages)
+        pages.close()
+        rest = list()
+        for invoices, add_index in self.api.invoices_pages(add_index):
+            rest.extend(invoices)
+        add_indexes = [int(invoice["add_index"]) for invoice in first + rest]
+        self.assertEqual(sorted(set(add_indexes)), list(range(1, INVOICES + 1)))
+        self.assertEqual(len(add_indexes), INVOICES)
+        self.assertEqual(add_index, INVOICES)
+
+    def test_idle_second_run(self):
+        requests = self.fake.requests
+        self.assertEqual(list(self.api.invoices_pages(INVOICES)), [])
+        self.assertEqual(self.api.settled_invoices(SETTLED), [])
+        self.assertEqual(self.fake.requests - requests, 2)
+        # no headers before the first event is not an error and is not retried
+        self.assertEqual(self.api.logger.errors, [])
+
+    def test_settled_after_cursor(self):
+        settle_index = self.fake.settle(3)
+        res = self.api.settled_invoices(SETTLED)
+        self.assertEqual(
+            [(invoice["add_index"], invoice["settle_index"]) for invoice in res],
+            [("3", str(settle_index))],
+        )
+        self.assertEqual(self.api.settled_invoices(settle_index), [])
+
+    def test_no_replay_for_zero_settle_index(self):
+        requests = self.fake.requests
+        self.assertEqual(self.api.settled_invoices(0), [])
+        self.assertEqual(self.fake.requests, requests)
+
+
+class Invoices_collector_test(Db_test_case):
+    def setUp(self) -> None:
+        super().setUp()
+        self.fake = Fake_lnd(invoices=INVOICES).start()
+        self.api = api_for(self.fake)
+        self.collectors = load_collectors()
+        self.logger = Silent_logger()
+
+    def tearDown(self) -> None:
+        self.fake.stop()
+
+    def states(self) -> dict:
+        self.db.cursor.execute("SELECT state, count(*) FROM invoices GROUP BY state;")
+        res = dict(self.db.cursor.fetchall())
+        self.db.conn.commit()
+        return res
+
+    def test_resume_after_interrupt(self):
+        write = self.db.write_invoices
+        self.db.write_invoices = interrupt_after(write, 1)
+        with self.assertRaises(Interrupted):
+            self.collectors.invoices(self.api, self.db, self.logger)
+        self.db.rollback()
+        self.assertEqual(self.count("SELECT count(*) FROM invoices;"), self.api.NUM_MAX_INVOICES)
+        self.db.write_invoices = write
+        self.collectors.invoices(self.api, self.db, self.logger)
+        self.assertEqual(self.count("SELECT count(DISTINCT add_index) FROM invoices;"), INVOICES)
+        self.assertEqual(self.count("SELECT count(*) FROM invoices;"), INVOICES)
+        # expiry is lnd's business, open invoices stay as lnd reported them
+        self.assertEqual(self.states(), {"SETTLED": SETTLED, "OPEN": INVOICES - SETTLED})
+
+    def test_idle_second_run(self):
+        self.collectors.invoices(self.api, self.db, self.logger)
+        requests = self.fake.requests
+        res = self.collectors.invoices(self.api, self.db, self.logger)
+        self.assertEqual(res, {"fetched": 0, "written": 0})
+        # one page of new invoices and one replay of settles
+        self.assertEqual(self.fake.requests - requests, 2)
+
+    def test_settle_between_runs(self):
+        self.collectors.invoices(self.api, self.db, self.logger)
+        self.fake.settle(3)
+        res = self.collectors.invoices(self.api, self.db, self.logger)
+        self.assertEqual(res, {"fetched": 1, "written": 1})
+        self.db.cursor.execute("SELECT state FROM invoices WHERE add_index = 3;")
+        self.assertEqual(self.db.cursor.fetchone()[0], "SETTLED")
+        self.db.conn.commit()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import sync_helpers  # noqa: F401
+from logger import Logger
+
+
+class Fake_db:
+    def __init__(self, ok: bool = True) -> None:
+        self.ok = ok
+        self.rows = list()
+
+    def write_logs(self, rows: list) -> bool:
+        if self.ok:
+            self.rows.extend(rows)
+        return self.ok
+
+
+class Logger_test(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "bot.log")
+        self.stdout = io.StringIO()
+        self.stderr = io.StringIO()
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def logger(self, db: Fake_db, **kwargs) -> Logger:
+        return Logger(self.path, db, host_name="test", flush_interval=0.05, **kwargs)
+
+    def run_logger(self, db: Fake_db, messages: int, **kwargs) -> Logger:
+        with contextlib.redirect_stdout(self.stdout), contextlib.redirect_stderr(self.stderr):
+            logger = self.logger(db, **kwargs)
+            for index in range(messages):
+                logger.info("message {}", index)
+            logger.debug("not enabled {}", lambda: 1 / 0)
+            logger.close()
+        return logger
+
+    def test_records_reach_db_file_and_console(self):
+        db = Fake_db()
+        self.run_logger(db, 3)
+        self.assertEqual([row[2] for row in db.rows], ["message 0", "message 1", "message 2"])
+        with open(self.path) as fp:
+            self.assertEqual(len(fp.read().splitlines()), 3)
+        self.assertEqual(len(self.stdout.getvalue().splitlines()), 3)
+
+    def test_failed_db_writes_are_reported_on_close(self):
+        logger = self.run_logger(Fake_db(ok=False), 3)
+        self.assertGreaterEqual(logger.failed, 3)
+        self.assertIn("3 log records were not written", self.stderr.getvalue())
+
+    def test_full_queue_drops_and_reports(self):
+        db = Fake_db()
+        with contextlib.redirect_stdout(self.stdout):
+            logger = self.logger(db, queue_size=1)
+            # without the worker nothing drains the queue
+            logger.stop_event.set()
+            logger.worker.join()
+            for index in range(6):
+                logger.info("message {}", index)
+            logger.close()
+        self.assertEqual(logger.dropped, 5)
+        self.assertEqual(
+            [row[2] for row in db.rows],
+            ["message 0", "Log queue was full, 5 messages dropped."],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+import sync_helpers  # noqa: F401
+from metrics import Registry
+
+
+class Metrics_test(unittest.TestCase):
+    def setUp(self) -> None:
+        self.registry = Registry()
+
+    def test_counter_with_labels(self):
+        counter = self.registry.counter("rows_total", "Rows.", ("collector", "kind"))
+        counter.inc("routing", "fetched", amount=5)
+        counter.inc("routing", "fetched")
+        counter.inc('we"ird\n', "written")
+        self.assertEqual(
+            self.registry.render().splitlines(),
+            [
+                "# HELP rows_total Rows.",
+                "# TYPE rows_total counter",
+                'rows_total{collector="routing",kind="fetched"} 6',
+                'rows_total{collector="we\\"ird\\n",kind="written"} 1',
+            ],
+        )
+
+    def test_same_name_is_one_metric(self):
+        first = self.registry.counter("runs_total", "Runs.")
+        self.assertIs(self.registry.counter("runs_total", "Runs."), first)
+
+    def test_gauge_function_is_read_on_render(self):
+        depth = [3]
+        gauge = self.registry.gauge("queue_depth", "Depth.")
+        gauge.set_function(lambda: depth[0])
+        self.assertIn("queue_depth 3", self.registry.render())
+        depth[0] = 7
+        self.assertIn("queue_depth 7", self.registry.render())
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram("seconds", "Time.", ("name",), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.7, 5):
+            histogram.observe(value, "a")
+        self.assertEqual(
+            self.registry.render().splitlines()[2:],
+            [
+                'seconds_bucket{name="a",le="0.1"} 1',
+                'seconds_bucket{name="a",le="1"} 3',
+                'seconds_bucket{name="a",le="+Inf"} 4',
+                'seconds_sum{name="a"} 6.25',
+                'seconds_count{name="a"} 4',
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
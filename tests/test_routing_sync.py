@@ -0,0 +1,112 @@
+import unittest
+
+from sync_helpers import (
+    Db_test_case,
+    Fake_lnd,
+    Interrupted,
+    Silent_logger,
+    api_for,
+    interrupt_after,
+    load_collectors,
+)
+
+FORWARDS = 12000
+CHANNELS = 20
+
+
+class Routing_pages_test(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.fake = Fake_lnd(forwards=FORWARDS, channels=CHANNELS).start()
+        cls.api = api_for(cls.fake)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.fake.stop()
+
+    def test_resume_after_interrupt(self):
+        pages = self.api.routing_pages(0)
+        first, offset = next(pages)
+        pages.close()
+        rest = list()
+        for events, offset in self.api.routing_pages(0, index_offset=offset):
+            rest.extend(events)
+        timestamps = [int(event["timestamp"]) for event in first + rest]
+        self.assertEqual(len(timestamps), FORWARDS)
+        self.assertEqual(len(set(timestamps)), FORWARDS)
+        self.assertEqual(offset, FORWARDS)
+
+    def test_idle_second_run(self):
+        requests = self.fake.requests
+        self.assertEqual(list(self.api.routing_pages(0, index_offset=FORWARDS)), [])
+        self.assertEqual(self.fake.requests - requests, 1)
+
+    def test_offset_counts_from_start_time(self):
+        start = Fake_lnd.START_TIME + Fake_lnd.FORWARD_STEP * 5000
+        end = start + Fake_lnd.FORWARD_STEP * 5999
+        events = list()
+        offsets = list()
+        for page, offset in self.api.routing_pages(start, end_time_unix=end):
+            events.extend(page)
+            offsets.append(offset)
+        self.assertEqual(offsets, [5000, 6000])
+        self.assertEqual(int(events[0]["timestamp"]), start)
+        self.assertEqual(int(events[-1]["timestamp"]), end)
+
+    def test_offset_after_stored_forwards(self):
+        newest = Fake_lnd.START_TIME + Fake_lnd.FORWARD_STEP * 7000
+        self.assertEqual(self.api.forwarding_offset_after(newest), 7001)
+        self.assertEqual(self.api.forwarding_offset_after(newest + 1), 7001)
+        self.assertEqual(self.api.forwarding_offset_after(0), 0)
+
+
+class Routing_collector_test(Db_test_case):
+    def setUp(self) -> None:
+        super().setUp()
+        self.fake = Fake_lnd(forwards=FORWARDS, channels=CHANNELS).start()
+        self.api = api_for(self.fake)
+        self.collectors = load_collectors()
+        self.logger = Silent_logger()
+
+    def tearDown(self) -> None:
+        self.fake.stop()
+
+    def stored(self) -> tuple:
+        return (
+            self.count("SELECT count(*) FROM routing;"),
+            self.count("SELECT count(DISTINCT unix_timestamp) FROM routing;"),
+        )
+
+    def test_resume_after_interrupt(self):
+        write = self.db.write_tx_to_db
+        self.db.write_tx_to_db = interrupt_after(write, 1)
+        with self.assertRaises(Interrupted):
+            self.collectors.routing(self.api, self.db, self.logger)
+        self.db.rollback()
+        self.assertEqual(self.stored(), (self.api.NUM_MAX_EVENTS, self.api.NUM_MAX_EVENTS))
+        self.db.write_tx_to_db = write
+        res = self.collectors.routing(self.api, self.db, self.logger)
+        self.assertEqual(res["written"], FORWARDS - self.api.NUM_MAX_EVENTS)
+        self.assertEqual(self.stored(), (FORWARDS, FORWARDS))
+
+    def test_idle_second_run(self):
+        self.collectors.routing(self.api, self.db, self.logger)
+        requests = self.fake.requests
+        res = self.collectors.routing(self.api, self.db, self.logger)
+        self.assertEqual(res, {"fetched": 0, "written": 0})
+        self.assertEqual(self.fake.requests - requests, 1)
+        self.assertEqual(self.stored(), (FORWARDS, FORWARDS))
+
+    def test_upgraded_database_continues_after_stored_forwards(self):
+        # forwards stored by a version without sync_state, no cursor yet
+        pages = self.api.routing_pages(0)
+        events, _ = next(pages)
+        pages.close()
+        self.db.write_tx_to_db(events, self.logger)
+        res = self.collectors.routing(self.api, self.db, self.logger)
+        self.assertEqual(res["written"], FORWARDS - len(events))
+        self.assertEqual(self.stored(), (FORWARDS, FORWARDS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from sync_helpers import Silent_logger, recording_db_factory
+from scheduler import Scheduler
+
+
+class Scheduler_test(unittest.TestCase):
+    def setUp(self) -> None:
+        self.db_factory, self.runs = recording_db_factory()
+        self.scheduler = Scheduler(self.db_factory, Silent_logger())
+        self.scheduler.TICK = 0.02
+        self.order = list()
+        self.lock = threading.Lock()
+
+    def record(self, name: str, seconds: float = 0):
+        def func(db):
+            time.sleep(seconds)
+            with self.lock:
+                self.order.append(name)
+            return {"fetched": 1, "written": 1}
+
+        return func
+
+    def run_for(self, seconds: float) -> None:
+        # run() installs signal handlers, so it has to stay on the main thread
+        timer = threading.Timer(seconds, self.scheduler.stop)
+        timer.start()
+        self.scheduler.run()
+        timer.join()
+
+    def test_dependency_runs_before_job(self):
+        self.scheduler.every("routing", 60, self.record("routing", 0.1))
+        self.scheduler.every("report", 60, self.record("report"), depends_on=("routing",))
+        self.run_for(0.5)
+        # report starts routing itself or waits for the running one
+        self.assertEqual(self.order.index("routing"), 0)
+        self.assertIn("report", self.order)
+        self.assertEqual(self.scheduler.jobs["report"]["runs"], 1)
+
+    def test_unknown_dependency(self):
+        with self.assertRaises(ValueError):
+            self.scheduler.every("report", 60, self.record("report"), depends_on=("routing",))
+
+    def test_overlapping_run_is_skipped(self):
+        self.scheduler.every("routing", 0.05, self.record("routing", 0.4))
+        self.run_for(0.3)
+        job = self.scheduler.jobs["routing"]
+        self.assertEqual(job["runs"], 1)
+        self.assertGreater(job["skipped"], 0)
+
+    def test_runs_are_recorded(self):
+        self.scheduler.every("balance", 60, self.record("balance"))
+        self.run_for(0.2)
+        self.assertEqual([(run[1], run[5], run[6], run[8]) for run in self.runs], [
+            ("balance", 1, 1, "ok"),
+        ])
+
+    def test_timer_job_is_not_recorded(self):
+        calls = list()
+        self.scheduler.every("stats", 60, lambda: calls.append(1), record=False)
+        self.run_for(0.2)
+        self.assertEqual(calls, [1])
+        self.assertEqual(self.runs, [])
+
+    def test_next_daily_run(self):
+        next_daily = getattr(Scheduler, "_Scheduler__next_daily")
+        now = datetime.now()
+        soon = (now + timedelta(minutes=2)).replace(second=0, microsecond=0)
+        self.assertEqual(next_daily(soon.time()), soon.timestamp())
+        passed = (now - timedelta(minutes=2)).replace(second=0, microsecond=0)
+        self.assertEqual(next_daily(passed.time()), (passed + timedelta(days=1)).timestamp())
+
+
+if __name__ == "__main__":
+    unittest.main()